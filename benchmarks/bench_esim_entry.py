@@ -0,0 +1,101 @@
+"""Đo bộ nhớ và thời gian dựng eSIMEntry cho nhiều dòng.
+
+So sánh cách cũ (dataclass thường + dict trung gian từ ``row[i]``) với cách
+hiện tại (``eSIMEntry`` có ``__slots__`` dựng thẳng từ tuple qua row factory).
+
+Chạy: ``python benchmarks/bench_esim_entry.py [--rows 100000]``
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from esim_storage import eSIMEntry  # noqa: E402
+
+
+@dataclass
+class LegacyEntry:
+    """Bản sao eSIMEntry trước khi có slots, chỉ dùng để so sánh."""
+    id: str
+    sm_dp_address: str
+    activation_code: str
+    description: str
+    added_date: str
+    status: str
+    used_date: Optional[str] = None
+    used_by: Optional[str] = None
+    lpa_string: Optional[str] = None
+    iccid: Optional[str] = None
+    used_note: Optional[str] = None
+
+
+def make_rows(count):
+    return [
+        (
+            f"{i:08x}", "rsp.esim.exchange", f"CODE-{i}", "", "2024-01-01T00:00:00",
+            "used", "2024-02-01T00:00:00", "1000 (@admin)",
+            f"LPA:1$rsp.esim.exchange$CODE-{i}", f"8985{i:016d}", "",
+        )
+        for i in range(count)
+    ]
+
+
+def build_legacy(rows):
+    entries = []
+    for row in rows:
+        entry_dict = {
+            'id': row[0],
+            'sm_dp_address': row[1],
+            'activation_code': row[2],
+            'description': row[3],
+            'added_date': row[4],
+            'status': row[5],
+            'used_date': row[6],
+            'used_by': row[7],
+            'lpa_string': row[8],
+            'iccid': row[9] if len(row) > 9 else None,
+            'used_note': row[10] if len(row) > 10 else None
+        }
+        entries.append(LegacyEntry(**entry_dict))
+    return entries
+
+
+def build_slotted(rows):
+    return [eSIMEntry(*row) for row in rows]
+
+
+def measure(builder, rows):
+    start = time.perf_counter()
+    builder(rows)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    entries = builder(rows)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del entries
+    return elapsed, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    print(f"{'variant':<10} {'time (ms)':>10} {'memory (MB)':>12} {'bytes/row':>10}")
+    for name, builder in (('legacy', build_legacy), ('slots', build_slotted)):
+        elapsed, memory = measure(builder, rows)
+        print(
+            f"{name:<10} {elapsed * 1000:>10.1f} {memory / 1024 / 1024:>12.2f} "
+            f"{memory / args.rows:>10.0f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
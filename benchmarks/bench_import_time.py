@@ -0,0 +1,64 @@
+"""Đo thời gian import lúc khởi động bằng ``python -X importtime``.
+
+Mỗi module được import trong một process Python mới (cold start), lặp
+``--runs`` lần và lấy median. Dòng ``eager`` import thêm các thư viện QR nặng
+(cv2, numpy, qrcode, pyzbar) để so với cách cũ khi ``esim_tools`` nạp tất cả
+ngay lúc import.
+
+Chạy: ``python benchmarks/bench_import_time.py [--runs 5] [--top 10]``
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# "import time:   self [us] | cumulative | imported package"
+LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+TARGETS = {
+    "esim_tools": "import esim_tools",
+    "bot": "import bot",
+    "eager": "import esim_tools, cv2, numpy, qrcode\n"
+             "try:\n    import pyzbar.pyzbar\nexcept Exception:\n    pass",
+}
+
+
+def measure(code):
+    """Chạy ``code`` trong process mới; trả về (tổng µs, {module: cumulative µs})."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    top_level = {}
+    for line in result.stderr.splitlines():
+        match = LINE_RE.match(line)
+        # Chỉ lấy module cấp cao nhất (thụt lề 1 space) để tổng không bị đếm trùng
+        if match and len(match.group(3)) == 1:
+            top_level[match.group(4)] = int(match.group(2))
+    return sum(top_level.values()), top_level
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Số module chậm nhất in ra cho mỗi target")
+    args = parser.parse_args()
+
+    for name, code in TARGETS.items():
+        totals = []
+        last = {}
+        for _ in range(args.runs):
+            total, last = measure(code)
+            totals.append(total)
+        print(f"{name:<12} median {statistics.median(totals) / 1000:8.1f} ms "
+              f"(min {min(totals) / 1000:.1f} ms, {args.runs} runs)")
+        for module, cumulative in sorted(last.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {cumulative / 1000:8.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""Bộ benchmark tái lập được: parser hàng loạt, tạo/đọc QR và thao tác kho.
+
+Mỗi case đo bằng ``timeit`` (tự chọn số lần gọi mỗi vòng như ``autorange``),
+lặp ``--repeat`` vòng và lưu min/median/mean/stdev của một lần gọi. Kết quả
+ghi ra JSON để làm baseline; lệnh ``compare`` báo case nào chậm đi quá
+ngưỡng và trả exit code 1, dùng được trong CI.
+
+Chạy:
+    python benchmarks/bench_suite.py run [--profile quick|full] [--only qr.]
+                                         [--output benchmarks/baselines/local.json]
+                                         [--compare benchmarks/baselines/quick.json]
+    python benchmarks/bench_suite.py compare BASELINE.json CURRENT.json [--threshold 0.25]
+
+Baseline phụ thuộc máy: hãy tạo baseline trên chính máy (hoặc runner CI) dùng
+để so sánh.
+"""
+import argparse
+import datetime
+import fnmatch
+import importlib.util
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from typing import Callable, Dict, Iterator, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures  # noqa: E402
+
+PROFILES = {
+    "quick": {
+        "bulk_lines": (10, 1_000),
+        "lpa_lengths": (40, 120, 300),
+        "photos": fixtures.PHOTO_KINDS,
+        "pdf_pages": (20,),
+        "storage_rows": (1_000, 20_000),
+    },
+    "full": {
+        "bulk_lines": (10, 1_000, 100_000),
+        "lpa_lengths": (40, 120, 300),
+        "photos": fixtures.PHOTO_KINDS,
+        "pdf_pages": (20, 200),
+        "storage_rows": (1_000, 100_000, 1_000_000),
+    },
+}
+
+Case = Tuple[str, Callable[[], object]]
+
+
+def bulk_cases(profile) -> Iterator[Case]:
+    from esim_tools import esim_tools
+
+    for lines in profile["bulk_lines"]:
+        text = fixtures.bulk_text(lines)
+        yield f"bulk.parse[{lines}]", lambda text=text: esim_tools.parse_bulk_esim_input(text, fixtures.SM_DP)
+
+
+def learned_decoder(image: bytes) -> Callable[[], object]:
+    """Hàm giải mã ``image`` với thống kê chiến lược cố định.
+
+    Thống kê được học lại từ đầu trên chính ảnh này (đủ ``min_trials`` lượt chạy
+    hết danh sách) rồi tắt khám phá, để mọi lần đo chạy cùng một thứ tự chiến
+    lược bất kể case nào chạy trước.
+    """
+    from esim_qr_decode import strategy_stats
+    from esim_tools import esim_tools
+
+    strategy_stats.exploring = True
+    strategy_stats.reset()
+    for _ in range(strategy_stats.min_trials):
+        esim_tools.decode_qr_from_image(image)
+        strategy_stats.drain()
+    strategy_stats.exploring = False
+    return lambda: esim_tools.decode_qr_from_image(image)
+
+
+def qr_cases(profile, wanted: Callable[[str], bool]) -> Iterator[Case]:
+    from esim_qr_decode import strategy_stats
+    from esim_tools import esim_tools
+
+    for length in profile["lpa_lengths"]:
+        lpa = fixtures.lpa_of_length(length)
+        yield f"qr.encode[{length}]", lambda lpa=lpa: esim_tools.create_qr_from_lpa(lpa)
+    try:
+        for kind in profile["photos"]:
+            # Học thống kê tốn ~min_trials lần giải mã: bỏ qua nếu case không được chọn
+            if wanted(f"qr.decode[{kind}]"):
+                yield f"qr.decode[{kind}]", learned_decoder(fixtures.qr_photo(kind))
+    finally:
+        strategy_stats.exploring = True
+        strategy_stats.reset()
+    if importlib.util.find_spec("pypdfium2") is None:
+        return
+    from esim_pdf import decode_pdf
+
+    for pages in profile["pdf_pages"]:
+        pdf, _ = fixtures.voucher_pdf(pages)
+        yield f"qr.pdf[{pages}]", lambda pdf=pdf: decode_pdf(pdf)
+
+
+STORAGE_OPS = ("stats", "available", "used_page", "by_id", "search_iccid", "add_and_use", "iter_all")
+
+
+def storage_cases(profile, workdir, wanted: Callable[[str], bool]) -> Iterator[Case]:
+    for rows in profile["storage_rows"]:
+        # Dựng kho 1 triệu dòng mất vài chục giây: bỏ qua nếu không case nào được chọn
+        if not any(wanted(f"storage.{op}[{rows}]") for op in STORAGE_OPS):
+            continue
+        storage, ids = fixtures.populate_storage(os.path.join(workdir, f"esim_{rows}.db"), rows)
+        probe_id = ids[len(ids) // 2]
+        probe_iccid = fixtures.iccid(rows // 3)
+
+        def add_and_use(storage=storage):
+            esim_id = storage.add_esim(fixtures.SM_DP, "BENCH-WRITE")
+            storage.mark_esim_used(esim_id, "bench")
+
+        yield f"storage.stats[{rows}]", storage.get_storage_stats
+        yield f"storage.available[{rows}]", storage.get_available_esims
+        yield f"storage.used_page[{rows}]", lambda storage=storage: storage.get_used_esims(limit=20)
+        yield f"storage.by_id[{rows}]", lambda storage=storage, i=probe_id: storage.get_esim_by_id(i)
+        yield f"storage.search_iccid[{rows}]", lambda storage=storage, t=probe_iccid: storage.search_esims(t)
+        yield f"storage.add_and_use[{rows}]", add_and_use
+        yield f"storage.iter_all[{rows}]", lambda storage=storage: sum(1 for _ in storage.iter_esims())
+
+
+def measure(func: Callable[[], object], repeat: int) -> Dict[str, float]:
+    timer = timeit.Timer(func)
+    func()  # warm-up: import lười, cache của SQLite/OpenCV
+    number, _ = timer.autorange()
+    samples = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+def _matches(name: str, pattern: str) -> bool:
+    # Tên case chứa "[...]" nên "[" trong pattern được hiểu là ký tự thường
+    return name.startswith(pattern) or fnmatch.fnmatchcase(name, pattern.replace("[", "[[]"))
+
+
+def run_suite(profile_name: str, patterns: List[str], repeat: int) -> Dict:
+    profile = PROFILES[profile_name]
+    workdir = tempfile.mkdtemp()
+    results = {}
+
+    def wanted(name: str) -> bool:
+        return not patterns or any(_matches(name, p) for p in patterns)
+
+    try:
+        groups = (bulk_cases(profile), qr_cases(profile, wanted), storage_cases(profile, workdir, wanted))
+        for group in groups:
+            for name, func in group:
+                if not wanted(name):
+                    continue
+                results[name] = measure(func, repeat)
+                print(f"{name:<32} {format_seconds(results[name]['median']):>10}", flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {
+            "profile": profile_name,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f}µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f}ms"
+    return f"{seconds:.2f}s"
+
+
+def compare(baseline: Dict, current: Dict, threshold: float, stat: str = "median") -> List[str]:
+    """In bảng so sánh và trả về danh sách case chậm đi quá ``threshold``."""
+    regressions = []
+    base_results = baseline["results"]
+    print(f"{'case':<32} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for name, result in current["results"].items():
+        if name not in base_results:
+            print(f"{name:<32} {'-':>10} {format_seconds(result[stat]):>10} {'new':>7}")
+            continue
+        before = base_results[name][stat]
+        after = result[stat]
+        ratio = after / before if before else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / (1 + threshold):
+            flag = "  faster"
+        print(f"{name:<32} {format_seconds(before):>10} {format_seconds(after):>10} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def _load(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Chạy benchmark")
+    run_parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    run_parser.add_argument("--only", action="append", default=[],
+                            help="Chỉ chạy case khớp tiền tố/glob, ví dụ qr.decode hoặc 'storage.*[1000]'")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--output", help="Ghi kết quả JSON (dùng làm baseline)")
+    run_parser.add_argument("--compare", metavar="BASELINE", help="So sánh ngay với baseline")
+    run_parser.add_argument("--threshold", type=float, default=0.25)
+
+    compare_parser = sub.add_parser("compare", help="So sánh hai file kết quả")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.25,
+                                help="Tỉ lệ chậm đi tối đa cho phép (0.25 = 25%%)")
+    compare_parser.add_argument("--stat", choices=("min", "median", "mean"), default="median")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.command == "compare":
+        regressions = compare(_load(args.baseline), _load(args.current), args.threshold, args.stat)
+    else:
+        report = run_suite(args.profile, args.only, args.repeat)
+        if args.output:
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+                f.write("\n")
+            print(f"Saved {len(report['results'])} results to {args.output}")
+        regressions = []
+        if args.compare:
+            print()
+            regressions = compare(_load(args.compare), report, args.threshold)
+
+    if regressions:
+        print(f"\n{len(regressions)} case chậm hơn baseline quá {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
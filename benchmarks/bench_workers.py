@@ -0,0 +1,127 @@
+"""Load test chế độ nhiều worker với tải nặng về QR.
+
+Đẩy ``--updates`` update giả (mỗi update tương ứng một ảnh QR cần giải mã)
+vào ``SharedUpdateQueue``, rồi chạy lần lượt 1..``--max-workers`` process
+worker dùng đúng vòng lặp ``consume_updates`` của bot. Mỗi update được "xử
+lý" bằng ``esim_tools.decode_qr_from_image`` nên throughput bị chặn bởi CPU;
+với đủ core, throughput tăng gần tuyến tính theo số worker.
+
+Chạy: ``python benchmarks/bench_workers.py [--updates 400] [--max-workers 4]``
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot_cluster import SharedUpdateQueue, consume_updates  # noqa: E402
+from bot_webhook import build_fake_update  # noqa: E402
+
+
+def make_images(directory, count):
+    from esim_tools import esim_tools
+
+    paths = []
+    for i in range(count):
+        buffer, _ = esim_tools.create_qr_from_lpa(f"LPA:1$rsp.esim.exchange$BENCH-{i:04d}")
+        path = os.path.join(directory, f"qr_{i}.png")
+        with open(path, "wb") as f:
+            f.write(buffer.getvalue())
+        paths.append(path)
+    return paths
+
+
+class DecodeApplication:
+    """Thay cho Application: mỗi update giải mã một ảnh QR (không gọi Telegram)."""
+
+    bot = None
+
+    def __init__(self, images):
+        from esim_tools import esim_tools
+
+        self.esim_tools = esim_tools
+        self.images = images
+
+    async def process_update(self, update):
+        index = int(update.message.text)
+        self.esim_tools.decode_qr_from_image(self.images[index % len(self.images)])
+
+
+def worker_main(queue_path, image_paths, worker_index, workers, result_queue):
+    images = []
+    for path in image_paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    queue = SharedUpdateQueue(queue_path)
+
+    async def run():
+        stop_event = asyncio.Event()
+
+        async def stop_when_drained():
+            while queue.pending_count():
+                await asyncio.sleep(0.05)
+            stop_event.set()
+
+        watcher = asyncio.create_task(stop_when_drained())
+        processed = await consume_updates(
+            DecodeApplication(images), queue, worker_index, workers, stop_event, idle_sleep=0.02
+        )
+        await watcher
+        return processed
+
+    result_queue.put(asyncio.run(run()))
+
+
+def run_round(workdir, image_paths, updates, workers):
+    queue_path = os.path.join(workdir, f"queue_{workers}.db")
+    queue = SharedUpdateQueue(queue_path)
+    # Nhiều chat khác nhau để update chia đều cho các worker
+    queue.enqueue_many(
+        [build_fake_update(str(i), user_id=10_000 + i, update_id=i) for i in range(updates)]
+    )
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker_main, args=(queue_path, image_paths, index, workers, results))
+        for index in range(workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    processed = sum(results.get() for _ in processes)
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+    return processed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=400)
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--max-workers", type=int, default=min(4, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        image_paths = make_images(workdir, args.images)
+        print(f"CPU cores: {os.cpu_count()} | updates: {args.updates}")
+        print(f"{'workers':>8} {'seconds':>9} {'updates/s':>10} {'speedup':>8}")
+        baseline = None
+        for workers in range(1, args.max_workers + 1):
+            processed, elapsed = run_round(workdir, image_paths, args.updates, workers)
+            throughput = processed / elapsed
+            baseline = baseline or throughput
+            print(f"{workers:>8} {elapsed:>9.2f} {throughput:>10.1f} {throughput / baseline:>7.2f}x")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""Dữ liệu giả dùng chung cho benchmark và load test (tất định theo ``seed``)."""
+import os
+import random
+import sqlite3
+import sys
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SM_DP = "rsp.esim.exchange"
+
+
+def activation_code(rng: random.Random, length: int = 16) -> str:
+    return "".join(rng.choice("ABCDEFGHJKLMNPQRSTUVWXYZ0123456789") for _ in range(length))
+
+
+def iccid(i: int) -> str:
+    return f"8985{i:015d}"
+
+
+def bulk_text(lines: int, seed: int = 0) -> str:
+    """Danh sách dán hàng loạt đúng ``lines`` dòng.
+
+    Trộn các dạng người dùng hay dán: block có nhãn, block ``key=value``, dòng
+    LPA thô và cặp ICCID/mã không nhãn, các block cách nhau bằng dòng trống.
+    """
+    rng = random.Random(seed)
+    out = []
+    i = 0
+    while len(out) < lines:
+        code = activation_code(rng)
+        style = i % 4
+        if style == 0:
+            out += [f"Activation Code: {code}", f"ICCID: {iccid(i)}", ""]
+        elif style == 1:
+            out += [f"activecode={code}", f"iccid={iccid(i)}", f"SM-DP+: {SM_DP}", ""]
+        elif style == 2:
+            out += [f"LPA:1${SM_DP}${code}", ""]
+        else:
+            out += [iccid(i), code, ""]
+        i += 1
+    return "\n".join(out[:lines])
+
+
+def lpa_of_length(length: int, seed: int = 0) -> str:
+    """LPA string dài đúng ``length`` ký tự (activation code được kéo dài)."""
+    prefix = f"LPA:1${SM_DP}$"
+    return prefix + activation_code(random.Random(seed), max(1, length - len(prefix)))
+
+
+PHOTO_KINDS = ("clean", "noisy", "rotated", "large", "dark")
+
+
+def qr_photo(kind: str, lpa: str = f"LPA:1${SM_DP}$BENCH-PHOTO-0001", seed: int = 0) -> bytes:
+    """Ảnh QR giống ảnh người dùng gửi.
+
+    - ``clean``: PNG gốc do bot tạo.
+    - ``noisy``: nhiễu Gauss + mờ + JPEG chất lượng thấp.
+    - ``rotated``: xoay 23 độ trên nền trắng, JPEG.
+    - ``large``: QR nằm giữa ảnh chụp 4000x3000 có nền nhiễu, JPEG.
+    - ``dark``: screenshot dark mode (module sáng trên nền tối, tương phản thấp), PNG.
+    """
+    import cv2
+    import numpy as np
+
+    from esim_tools import esim_tools
+
+    buffer, _ = esim_tools.create_qr_from_lpa(lpa)
+    png = buffer.getvalue()
+    if kind == "clean":
+        return png
+
+    rng = np.random.default_rng(seed)
+    img = cv2.imdecode(np.frombuffer(png, np.uint8), cv2.IMREAD_COLOR)
+    if kind == "noisy":
+        noise = rng.normal(0, 25, img.shape)
+        img = np.clip(img.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+        img = cv2.GaussianBlur(img, (3, 3), 0)
+        quality = 60
+    elif kind == "rotated":
+        pad = img.shape[0] // 3
+        img = cv2.copyMakeBorder(img, pad, pad, pad, pad, cv2.BORDER_CONSTANT, value=(255, 255, 255))
+        h, w = img.shape[:2]
+        matrix = cv2.getRotationMatrix2D((w / 2, h / 2), 23, 1.0)
+        img = cv2.warpAffine(img, matrix, (w, h), borderValue=(255, 255, 255))
+        quality = 85
+    elif kind == "large":
+        canvas = rng.integers(90, 200, (3000, 4000, 3), dtype=np.uint8)
+        canvas = cv2.GaussianBlur(canvas, (31, 31), 0)
+        qr = cv2.resize(img, (1400, 1400), interpolation=cv2.INTER_NEAREST)
+        canvas[800:2200, 1300:2700] = qr
+        img = canvas
+        quality = 90
+    elif kind == "dark":
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return cv2.imencode(".png", cv2.bitwise_not((gray / 255 * 100 + 40).astype(np.uint8)))[1].tobytes()
+    else:
+        raise ValueError(f"Unknown photo kind: {kind}")
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("Could not encode JPEG")
+    return encoded.tobytes()
+
+
+def telegram_photo_sizes(image: bytes, sides=(90, 320, 800, 1280, 2560)):
+    """Các bản ``(width, height, jpeg)`` Telegram tạo cho một ảnh gửi dạng photo.
+
+    Telegram giữ tỉ lệ, thu cạnh dài về từng mốc trong ``sides`` và không phóng
+    to ảnh nhỏ hơn mốc.
+    """
+    import cv2
+    import numpy as np
+
+    img = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+    height, width = img.shape[:2]
+    sizes = []
+    for side in sides:
+        scale = min(1.0, side / max(width, height))
+        w, h = max(1, round(width * scale)), max(1, round(height * scale))
+        resized = img if scale == 1.0 else cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, 87])
+        sizes.append((w, h, encoded.tobytes()))
+        if scale == 1.0:
+            break
+    return sizes
+
+
+def populate_storage(db_path: str, rows: int, used_fraction: float = 0.5, seed: int = 0, chunk: int = 50_000):
+    """Tạo kho ``rows`` eSIM (một phần đã dùng) bằng INSERT theo lô.
+
+    Nhanh hơn nhiều so với gọi API từng dòng, nên dựng được kho 1 triệu dòng.
+    Trả về ``(storage, ids)``.
+    """
+    from esim_storage import eSIMStorage
+
+    storage = eSIMStorage(db_path=db_path)
+    rng = random.Random(seed)
+    ids = []
+    conn = sqlite3.connect(db_path)
+    try:
+        for start in range(0, rows, chunk):
+            batch = []
+            for i in range(start, min(rows, start + chunk)):
+                esim_id = uuid.UUID(int=rng.getrandbits(128)).hex[:8]
+                code = activation_code(rng)
+                added = f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}T10:00:00"
+                used = rng.random() < used_fraction
+                batch.append((
+                    esim_id, SM_DP, code, f"batch {i // 1000}", added,
+                    "used" if used else "available",
+                    added if used else None,
+                    "1000 (@admin)" if used else None,
+                    f"LPA:1${SM_DP}${code}", iccid(i),
+                    f"khách {i}" if used else None,
+                ))
+                ids.append(esim_id)
+            conn.executemany('''
+                INSERT OR IGNORE INTO esim_entries
+                (id, sm_dp_address, activation_code, description, added_date, status,
+                 used_date, used_by, lpa_string, iccid, used_note)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+            conn.commit()
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    return storage, ids
+
+
+def voucher_pdf(pages: int, per_page: int = 1, seed: int = 0):
+    """PDF voucher ``pages`` trang, mỗi trang ``per_page`` QR kèm dòng ``ICCID: ...`` in bên dưới.
+
+    PDF được viết tay (ảnh QR xám nén Flate + font Helvetica chuẩn) để không
+    cần thư viện tạo PDF. Trả về ``(pdf, [(lpa, iccid), ...])`` theo thứ tự trang.
+    """
+    import zlib
+
+    import cv2
+    import numpy as np
+
+    from esim_tools import esim_tools
+
+    rng = random.Random(seed)
+    objects = []  # nội dung object thứ i + 1
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    def stream(header: bytes, data: bytes) -> bytes:
+        return header[:-2] + b" /Length %d >>\nstream\n" % len(data) + data + b"\nendstream"
+
+    catalog = add(b"")  # điền sau khi biết các trang
+    pages_obj = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    vouchers, page_ids = [], []
+    n = 0
+    for _ in range(pages):
+        draws, xobjects = [], []
+        for slot in range(per_page):
+            code = activation_code(rng)
+            lpa, number = f"LPA:1${SM_DP}${code}", iccid(seed * 100_000 + n)
+            n += 1
+            png = esim_tools.create_qr_from_lpa(lpa)[0].getvalue()
+            gray = cv2.imdecode(np.frombuffer(png, np.uint8), cv2.IMREAD_GRAYSCALE)
+            h, w = gray.shape
+            image = add(stream(
+                b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+                b"/BitsPerComponent 8 /Filter /FlateDecode >>" % (w, h),
+                zlib.compress(gray.tobytes()),
+            ))
+            xobjects.append(b"/Im%d %d 0 R" % (slot, image))
+            top = 780 - slot * 260
+            draws.append(
+                b"q 180 0 0 180 72 %d cm /Im%d Do Q\n" % (top - 180, slot)
+                + b"BT /F1 11 Tf 72 %d Td (ICCID: %s) Tj ET\n" % (top - 200, number.encode())
+            )
+            vouchers.append((lpa, number))
+        content = add(stream(b"<< >>", b"".join(draws)))
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> /XObject << %s >> >> >>"
+            % (pages_obj, content, font, b" ".join(xobjects))
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj
+    objects[pages_obj - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % p for p in page_ids), len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out), vouchers
@@ -0,0 +1,416 @@
+"""Load test: chạy hàng nghìn phiên giả đồng thời thẳng vào handler của eSIMBot.
+
+Mỗi phiên đi hết một luồng người dùng thật (tạo link, quét ảnh QR, dùng eSIM
+trong kho, thêm hàng loạt) qua đúng các method handler, với Bot API được thay
+bằng stub có độ trễ mạng giả lập. Kết quả: throughput, p50/p95/p99 theo luồng
+và theo bước, số lần gọi Bot API, và độ trễ event loop (``LoopLagMonitor``)
+để phát hiện code đồng bộ chặn loop.
+
+Chạy:
+    python benchmarks/load_test.py [--sessions 2000] [--concurrency 200]
+        [--mix create_link=4,scan_qr=3,use_esim=2,bulk_add=1] [--rtt-ms 40]
+        [--photos clean,noisy,rotated] [--json out.json] [--max-loop-lag-ms 250]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures  # noqa: E402
+
+DEFAULT_MIX = {"create_link": 4, "scan_qr": 3, "use_esim": 2, "bulk_add": 1}
+
+
+# ----------------------------------------------------------------------
+# Stub Bot API: chỉ mô phỏng độ trễ mạng và đếm số lần gọi
+# ----------------------------------------------------------------------
+class StubBotAPI:
+    def __init__(self, rtt: float = 0.04, jitter: float = 0.5, seed: int = 0):
+        self.rtt = rtt
+        self.jitter = jitter
+        self.calls: Dict[str, int] = {}
+        self._rng = random.Random(seed)
+
+    async def call(self, method: str):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.rtt:
+            await asyncio.sleep(self.rtt * (1 + self._rng.uniform(-self.jitter, self.jitter)))
+
+
+class FakeFile:
+    def __init__(self, api: StubBotAPI, data: bytes):
+        self._api = api
+        self._data = data
+
+    async def download_to_memory(self, out) -> None:
+        await self._api.call("downloadFile")
+        out.write(self._data)
+
+
+class FakePhotoSize:
+    def __init__(self, api: StubBotAPI, data: bytes, width: int = 0, height: int = 0):
+        self._api = api
+        self._data = data
+        self.width = width
+        self.height = height
+        self.file_size = len(data)
+
+    async def get_file(self) -> FakeFile:
+        await self._api.call("getFile")
+        return FakeFile(self._api, self._data)
+
+
+_message_ids = itertools.count(1)
+
+
+class FakeMessage:
+    def __init__(self, api: StubBotAPI, text: str = "", photo=None):
+        """``photo``: danh sách ``(width, height, data)`` như ``fixtures.telegram_photo_sizes``."""
+        self._api = api
+        self.text = text
+        self.photo = [FakePhotoSize(api, data, w, h) for w, h, data in photo or ()]
+        self.document = None
+        self.reply_markup = None
+        self.media_group_id = None
+        self.message_id = next(_message_ids)
+
+    async def reply_text(self, text, reply_markup=None, **kwargs):
+        await self._api.call("sendMessage")
+        message = FakeMessage(self._api, text)
+        message.reply_markup = reply_markup
+        return message
+
+    async def reply_photo(self, photo=None, reply_markup=None, **kwargs):
+        await self._api.call("sendPhoto")
+        return FakeMessage(self._api)
+
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        await self._api.call("editMessageText")
+        self.text = text
+        self.reply_markup = reply_markup
+        return self
+
+    async def delete(self):
+        await self._api.call("deleteMessage")
+        return True
+
+
+class FakeCallbackQuery:
+    def __init__(self, api: StubBotAPI, data: str, message: FakeMessage):
+        self._api = api
+        self.data = data
+        self.message = message
+
+    async def answer(self, *args, **kwargs):
+        await self._api.call("answerCallbackQuery")
+        return True
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        return await self.message.edit_text(text, reply_markup=reply_markup)
+
+    async def delete_message(self):
+        return await self.message.delete()
+
+
+@dataclass
+class FakeUser:
+    id: int
+    username: str
+
+
+class FakeUpdate:
+    def __init__(self, user: FakeUser, message: Optional[FakeMessage] = None,
+                 callback_query: Optional[FakeCallbackQuery] = None):
+        self.effective_user = user
+        self.message = message
+        self.callback_query = callback_query
+        self.effective_message = message if message is not None else callback_query.message
+
+
+@dataclass
+class FakeContext:
+    user_data: Dict = field(default_factory=dict)
+    args: List[str] = field(default_factory=list)
+
+
+# ----------------------------------------------------------------------
+# Phiên người dùng
+# ----------------------------------------------------------------------
+class Session:
+    """Một người dùng: giữ ``user_data`` và tin nhắn menu như trong chat thật."""
+
+    def __init__(self, runner: "LoadRunner", user: FakeUser):
+        self.runner = runner
+        self.user = user
+        self.context = FakeContext()
+        self.menu = FakeMessage(runner.api, "menu")
+
+    async def step(self, name: str, handler, update: FakeUpdate):
+        start = time.perf_counter()
+        try:
+            return await handler(update, self.context)
+        finally:
+            self.runner.record(f"step.{name}", time.perf_counter() - start)
+            if self.runner.think_time:
+                await asyncio.sleep(self.runner.rng.uniform(0, self.runner.think_time))
+
+    def callback(self, data: str) -> FakeUpdate:
+        return FakeUpdate(self.user, callback_query=FakeCallbackQuery(self.runner.api, data, self.menu))
+
+    def message(self, text: str = "", photo=None) -> FakeUpdate:
+        return FakeUpdate(self.user, message=FakeMessage(self.runner.api, text, photo))
+
+
+async def scenario_create_link(session: Session):
+    bot = session.runner.bot
+    code = fixtures.activation_code(session.runner.rng)
+    await session.step("start_create_link", bot.start_create_link, session.callback("create_link"))
+    await session.step("handle_sm_dp_for_link", bot.handle_sm_dp_for_link, session.message(fixtures.SM_DP))
+    await session.step("handle_activation_code_for_link", bot.handle_activation_code_for_link,
+                       session.message(code))
+
+
+async def scenario_scan_qr(session: Session):
+    bot = session.runner.bot
+    photo = session.runner.rng.choice(session.runner.photos)
+    await session.step("start_analyze_qr", bot.start_analyze_qr, session.callback("analyze_qr"))
+    await session.step("handle_qr_choice", bot.handle_qr_choice, session.callback("qr_image"))
+    await session.step("handle_qr_image", bot.handle_qr_image, session.message(photo=photo))
+
+
+async def scenario_use_esim(session: Session):
+    bot = session.runner.bot
+    await session.step("start_use_esim", bot.start_use_esim, session.callback("use_esim"))
+    markup = session.menu.reply_markup
+    choices = [
+        row[0].callback_data for row in (markup.inline_keyboard if markup else ())
+        if row[0].callback_data.startswith("select_esim_")
+    ]
+    if not choices:
+        return
+    # Nhiều admin cùng chọn trong 20 eSIM đầu: có tranh chấp như thật
+    selected = session.runner.rng.choice(choices)
+    await session.step("handle_esim_selection", bot.handle_esim_selection, session.callback(selected))
+    await session.step("skip_use_esim_note", bot.skip_use_esim_note, session.callback("skip_use_note"))
+
+
+async def scenario_bulk_add(session: Session):
+    bot = session.runner.bot
+    text = fixtures.bulk_text(session.runner.bulk_lines, seed=session.runner.rng.randrange(1 << 30))
+    await session.step("start_bulk_add_esim", bot.start_bulk_add_esim, session.callback("bulk_add_esim"))
+    await session.step("handle_bulk_smdp_choice", bot.handle_bulk_smdp_choice, session.callback("bulk_smdp_1"))
+    await session.step("handle_bulk_list", bot.handle_bulk_list, session.message(text))
+
+
+SCENARIOS = {
+    "create_link": (scenario_create_link, False),
+    "scan_qr": (scenario_scan_qr, False),
+    "use_esim": (scenario_use_esim, True),
+    "bulk_add": (scenario_bulk_add, True),
+}
+
+
+class LoadRunner:
+    def __init__(self, bot, api: StubBotAPI, photos: List[list], admin_id: int,
+                 bulk_lines: int = 30, think_time: float = 0.0, seed: int = 0):
+        from esim_metrics import Histogram
+
+        self.bot = bot
+        self.api = api
+        self.photos = photos
+        self.admin_id = admin_id
+        self.bulk_lines = bulk_lines
+        self.think_time = think_time
+        self.rng = random.Random(seed)
+        self.histograms: Dict[str, Histogram] = {}
+        self.errors: Dict[str, int] = {}
+        self._histogram_cls = Histogram
+
+    def record(self, name: str, seconds: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = self._histogram_cls()
+        histogram.observe(seconds)
+
+    async def run_session(self, index: int, scenario: str):
+        func, needs_admin = SCENARIOS[scenario]
+        user_id = self.admin_id if needs_admin else 10_000_000 + index
+        session = Session(self, FakeUser(user_id, f"user{index}"))
+        start = time.perf_counter()
+        try:
+            await func(session)
+        except Exception as e:
+            key = f"{scenario}: {type(e).__name__}: {e}"
+            self.errors[key] = self.errors.get(key, 0) + 1
+        finally:
+            self.record(f"session.{scenario}", time.perf_counter() - start)
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario: {name}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+async def run_load(
+    sessions: int = 2000,
+    concurrency: int = 200,
+    mix: Optional[Dict[str, int]] = None,
+    rtt: float = 0.04,
+    photo_kinds=("clean", "noisy", "rotated"),
+    inventory: int = 5000,
+    bulk_lines: int = 30,
+    think_time: float = 0.0,
+    seed: int = 0,
+    workdir: Optional[str] = None,
+) -> Dict:
+    """Chạy load test trong event loop hiện tại và trả về báo cáo (dict)."""
+    import bot as botmod
+    from bot_perf import LoopLagMonitor
+    from esim_metrics import MetricsRegistry
+
+    mix = mix or DEFAULT_MIX
+    own_workdir = workdir is None
+    workdir = workdir or tempfile.mkdtemp()
+    original_storage = botmod.esim_storage
+    storage, _ = fixtures.populate_storage(os.path.join(workdir, "load.db"), inventory, used_fraction=0.0, seed=seed)
+    botmod.esim_storage = storage
+
+    api = StubBotAPI(rtt=rtt, seed=seed)
+    photos = [
+        fixtures.telegram_photo_sizes(fixtures.qr_photo(kind, lpa=fixtures.lpa_of_length(60, seed=i), seed=i))
+        for i, kind in enumerate(photo_kinds)
+    ]
+    runner = LoadRunner(botmod.eSIMBot(), api, photos, botmod.ADMIN_IDS[0], bulk_lines, think_time, seed)
+
+    rng = random.Random(seed)
+    names = list(mix)
+    plan = rng.choices(names, weights=[mix[n] for n in names], k=sessions)
+    # Registry riêng: không lẫn với số liệu toàn cục của bot
+    monitor = LoopLagMonitor(interval=0.01, registry=MetricsRegistry(), log_stalls=False)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(index, scenario):
+        async with semaphore:
+            await runner.run_session(index, scenario)
+
+    monitor.start()
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(limited(i, name) for i, name in enumerate(plan)))
+        elapsed = time.perf_counter() - start
+    finally:
+        await monitor.stop()
+        botmod.esim_storage = original_storage
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    step_calls = sum(h.count for name, h in runner.histograms.items() if name.startswith("step."))
+    return {
+        "config": {
+            "sessions": sessions, "concurrency": concurrency, "mix": mix, "rtt": rtt,
+            "photos": list(photo_kinds), "inventory": inventory, "bulk_lines": bulk_lines,
+            "think_time": think_time, "cpu_count": os.cpu_count(),
+        },
+        "elapsed": elapsed,
+        "sessions_per_second": sessions / elapsed,
+        "handler_calls_per_second": step_calls / elapsed,
+        "latency": {name: h.summary() for name, h in sorted(runner.histograms.items())},
+        "api_calls": dict(sorted(api.calls.items())),
+        "errors": runner.errors,
+        "loop_lag": {**monitor.histogram.summary(), "stalls": monitor.stalls,
+                     "stall_threshold": monitor.stall_threshold},
+    }
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f}"
+
+
+def print_report(report: Dict):
+    cfg = report["config"]
+    print(f"Sessions: {cfg['sessions']} | concurrency: {cfg['concurrency']} | "
+          f"RTT: {cfg['rtt'] * 1000:.0f}ms | CPU cores: {cfg['cpu_count']}")
+    print(f"Elapsed: {report['elapsed']:.2f}s | {report['sessions_per_second']:.1f} sessions/s | "
+          f"{report['handler_calls_per_second']:.1f} handler calls/s")
+    print()
+    print(f"{'latency (ms)':<40} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, s in report["latency"].items():
+        print(f"{name:<40} {s['count']:>6} {_ms(s['p50']):>8} {_ms(s['p95']):>8} "
+              f"{_ms(s['p99']):>8} {_ms(s['max']):>8}")
+    lag = report["loop_lag"]
+    print()
+    print(f"Event loop lag: p50 {_ms(lag['p50'])}ms | p99 {_ms(lag['p99'])}ms | max {_ms(lag['max'])}ms | "
+          f"stalls >= {_ms(lag['stall_threshold'])}ms: {lag['stalls']}")
+    print("Bot API calls: " + ", ".join(f"{k}={v}" for k, v in report["api_calls"].items()))
+    if report["errors"]:
+        print("Errors:")
+        for key, count in report["errors"].items():
+            print(f"  {count} x {key}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="Tỉ trọng các luồng, ví dụ create_link=4,scan_qr=3,use_esim=2,bulk_add=1")
+    parser.add_argument("--rtt-ms", type=float, default=40, help="Độ trễ giả lập mỗi lần gọi Bot API")
+    parser.add_argument("--photos", default="clean,noisy,rotated",
+                        help=f"Loại ảnh QR gửi lên, chọn trong {','.join(fixtures.PHOTO_KINDS)}")
+    parser.add_argument("--inventory", type=int, default=5000, help="Số eSIM có sẵn trong kho")
+    parser.add_argument("--bulk-lines", type=int, default=30)
+    parser.add_argument("--think-ms", type=float, default=0, help="Thời gian nghỉ ngẫu nhiên tối đa giữa hai bước")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Ghi báo cáo ra file JSON")
+    parser.add_argument("--max-loop-lag-ms", type=float,
+                        help="Exit code 1 nếu độ trễ event loop lớn nhất vượt ngưỡng")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    import bot  # noqa: F401  (bot cấu hình logging INFO khi import)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = asyncio.run(run_load(
+        sessions=args.sessions,
+        concurrency=args.concurrency,
+        mix=args.mix,
+        rtt=args.rtt_ms / 1000,
+        photo_kinds=tuple(k.strip() for k in args.photos.split(",") if k.strip()),
+        inventory=args.inventory,
+        bulk_lines=args.bulk_lines,
+        think_time=args.think_ms / 1000,
+        seed=args.seed,
+    ))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    if args.max_loop_lag_ms is not None and report["loop_lag"]["max"] * 1000 > args.max_loop_lag_ms:
+        print(f"\nEvent loop lag vượt ngưỡng {args.max_loop_lag_ms:.0f}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
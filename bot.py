@@ -1,5 +1,13 @@
 import asyncio
+import datetime
+import functools
+import inspect
+import io
 import logging
+import multiprocessing
+import os
+import secrets
+import signal
 import warnings
 
 # Suppress các warnings không cần thiết
@@ -34,7 +42,20 @@ from bot_constants import (
     WAITING_SM_DP_LINK,
     WAITING_SM_DP_QR,
 )
+from bot_cluster import LeaderLease, SharedUpdateQueue, consume_updates, poll_into_queue
 from bot_handlers import setup_bot_handlers
+from bot_media import (
+    MediaGroupCollector,
+    analyze_telegram_file,
+    analyze_url_image,
+    configure_url_cache,
+    decode_photo_progressively,
+    download_buffers,
+    render_qr,
+)
+from bot_perf import LoopLagMonitor, MetricsServer, format_perf_report
+from bot_persistence import SQLitePersistence
+from bot_webhook import WebhookServer
 from bot_keyboards import (
     build_back_keyboard,
     build_bulk_smdp_keyboard,
@@ -50,11 +71,21 @@ from bot_keyboards import (
     build_storage_result_keyboard,
     build_storage_keyboard,
     build_storage_menu_keyboard,
+    build_undo_delete_keyboard,
 )
 from bot_user_info import format_user_id_response
+import config
 from config import BOT_TOKEN, MESSAGES, ADMIN_IDS
-from esim_tools import esim_tools
-from esim_storage import esim_storage
+from esim_zip import decode_zip_archive, format_archive_report
+from esim_backup import SnapshotManager
+from esim_export import build_export_filename, export_to_tempfile, parse_export_args
+from esim_image_guard import decode_admission
+from esim_decode_pool import decode_pool
+from esim_maintenance import StorageCompactor
+from esim_metrics import instrument_methods, metrics
+from esim_pdf import decode_pdf
+from esim_tools import esim_tools, prewarm as prewarm_qr_tools
+from esim_storage import configure_storage, esim_storage
 
 # Logging setup - Clean và chỉ hiển thị thông tin quan trọng
 logging.basicConfig(
@@ -69,9 +100,32 @@ logging.getLogger('telegram.ext.Application').setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
+def _is_update_handler(name, func):
+    """Handler Telegram: coroutine nhận ``update`` (bỏ qua helper private)."""
+    return (
+        not name.startswith('_')
+        and asyncio.iscoroutinefunction(func)
+        and 'update' in inspect.signature(func).parameters
+    )
+
+
+@instrument_methods('handler', include=_is_update_handler)
 class eSIMBot:
     def __init__(self):
         self.application = None
+        # config.py cũ có thể chưa khai báo các khóa mới nên dùng getattr
+        self.snapshots = SnapshotManager(
+            backup_dir=getattr(config, 'BACKUP_DIR', 'backups'),
+            keep=getattr(config, 'BACKUP_KEEP', 7),
+        )
+        self.tombstone_retention = datetime.timedelta(
+            hours=getattr(config, 'TOMBSTONE_RETENTION_HOURS', 24)
+        )
+        self._background_tasks = []
+        self._metrics_server = None
+        # Worker thứ i mở /metrics ở METRICS_PORT + i
+        self.worker_index = 0
+        self.media_groups = MediaGroupCollector(window=getattr(config, 'MEDIA_GROUP_WINDOW', 1.0))
     
     def admin_required(func):
         """Decorator để kiểm tra admin access cho callback handlers"""
@@ -200,6 +254,8 @@ class eSIMBot:
             await self.confirm_delete_all(update, context)
         elif query.data == "confirm_del_all":
             await self.do_delete_all(update, context)
+        elif query.data.startswith("undo_del_"):
+            await self.undo_delete(update, context)
 
     
     def get_back_keyboard(self):
@@ -459,6 +515,7 @@ class eSIMBot:
                 "📎 **URL/QR data:**\n"
                 "• `https://esimsetup.apple.com/...`\n"
                 "• Dữ liệu QR code (text)\n\n"
+                "📸 **Ảnh QR code:** gửi ảnh hoặc file ảnh\n\n"
                 "🔧 **SM-DP+ Address:**\n"
                 "• `rsp.truphone.com`\n\n"
                 "💡 **Bot sẽ tự động:**\n"
@@ -478,6 +535,7 @@ class eSIMBot:
                 "📎 **URL/QR data:**\n"
                 "• `https://esimsetup.apple.com/...`\n"
                 "• Dữ liệu QR code (text)\n\n"
+                "📸 **Ảnh QR code:** gửi ảnh hoặc file ảnh\n\n"
                 "🔧 **SM-DP+ Address:**\n"
                 "• `rsp.truphone.com`\n\n"
                 "💡 **Bot sẽ tự động:**\n"
@@ -526,15 +584,13 @@ class eSIMBot:
                 # If no SM-DP+ found, try downloading as image
                 if not analysis['sm_dp_address']:
                     try:
-                        import requests
                         logger.info(f"Trying to download image from URL")
                         
-                        response = await asyncio.to_thread(requests.get, data, timeout=30)
-                        response.raise_for_status()
-                        image_data = response.content
-                        
-                        # Analyze QR from image (chạy off-thread để không block event loop)
-                        analysis = await asyncio.to_thread(esim_tools.analyze_qr_image, image_data)
+                        # Tải theo từng đoạn vào buffer dùng lại rồi đọc QR (off-thread)
+                        analysis = await analyze_url_image(
+                            data, functools.partial(esim_tools.analyze_qr_image, source='url'), timeout=30,
+                            result_key='analyze_qr_image',
+                        )
                         
                         if not analysis['qr_detected']:
                             await processing_msg.delete()
@@ -606,7 +662,7 @@ class eSIMBot:
             install_link = esim_tools.create_iphone_install_link(sm_dp_address, activation_code)
             
             # Create QR code
-            qr_image, lpa_string = esim_tools.create_qr_from_sm_dp(sm_dp_address, activation_code)
+            qr_image, lpa_string = await render_qr(esim_tools.create_qr_from_sm_dp, sm_dp_address, activation_code)
             self.remember_last_lpa(context, lpa_string)
             
             # Log activity
@@ -773,7 +829,7 @@ class eSIMBot:
         
         try:
             # Tạo QR code
-            qr_image, lpa_string = esim_tools.create_qr_from_sm_dp(sm_dp_address, activation_code)
+            qr_image, lpa_string = await render_qr(esim_tools.create_qr_from_sm_dp, sm_dp_address, activation_code)
             self.remember_last_lpa(context, lpa_string)
             
             # Log activity
@@ -923,8 +979,32 @@ class eSIMBot:
         
         return ConversationHandler.END
 
+    async def _analyze_qr_message(self, message):
+        """Đọc QR từ photo/document của một message; None nếu message không có ảnh."""
+        if message.photo:
+            # Thử bản ~800px trước, chỉ tải bản lớn nhất khi không đọc được
+            return await decode_photo_progressively(
+                message.photo,
+                functools.partial(esim_tools.analyze_qr_image, source='photo'),
+                target_side=getattr(config, 'QR_PHOTO_TARGET_SIDE', 800),
+            )
+        if message.document:
+            file = await message.document.get_file()
+            # Tải vào buffer dùng lại của worker, phân tích off-thread
+            return await analyze_telegram_file(
+                file, functools.partial(esim_tools.analyze_qr_image, source='document')
+            )
+        return None
+
     async def handle_qr_image(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Xử lý ảnh QR code được gửi"""
+        messages = await self.media_groups.collect(update.message)
+        if messages is None:
+            # Ảnh sau trong album: message đầu album trả lời chung, giữ nguyên state
+            return None
+        if len(messages) > 1:
+            return await self._handle_qr_album(update, context, messages)
+
         try:
             # Hiển thị đang xử lý
             processing_msg = await update.message.reply_text(
@@ -933,24 +1013,14 @@ class eSIMBot:
                 parse_mode=ParseMode.MARKDOWN
             )
             
-            # Lấy file ảnh lớn nhất
-            if update.message.photo:
-                file = await update.message.photo[-1].get_file()
-            elif update.message.document:
-                file = await update.message.document.get_file()
-            else:
+            analysis = await self._analyze_qr_message(update.message)
+            if analysis is None:
                 await processing_msg.edit_text(
                     "❌ **Lỗi:** Vui lòng gửi ảnh hoặc file ảnh!",
                     parse_mode=ParseMode.MARKDOWN
                 )
                 return ConversationHandler.END
             
-            # Download file
-            file_data = await file.download_as_bytearray()
-            
-            # Phân tích QR từ ảnh (chạy off-thread để không block event loop)
-            analysis = await asyncio.to_thread(esim_tools.analyze_qr_image, bytes(file_data))
-            
             # Xóa message đang xử lý
             await processing_msg.delete()
             
@@ -1024,6 +1094,47 @@ class eSIMBot:
         
         return ConversationHandler.END
     
+    async def _handle_qr_album(self, update: Update, context: ContextTypes.DEFAULT_TYPE, messages: list):
+        """Phân tích mọi ảnh trong album song song và trả lời bằng một tin nhắn."""
+        processing_msg = await update.message.reply_text(
+            f"🔄 **Đang phân tích {len(messages)} ảnh QR code...**",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        results = await asyncio.gather(
+            *(self._analyze_qr_message(message) for message in messages), return_exceptions=True
+        )
+        try:
+            await processing_msg.delete()
+        except Exception:
+            pass
+
+        response = f"🔍 **KẾT QUẢ PHÂN TÍCH {len(messages)} ẢNH**\n\n"
+        found = 0
+        for idx, analysis in enumerate(results, 1):
+            if isinstance(analysis, Exception):
+                response += f"**{idx}.** ❌ {str(analysis)[:80]}\n"
+                continue
+            if not analysis or not analysis.get('qr_detected'):
+                error = (analysis or {}).get('error', 'Không có ảnh')
+                response += f"**{idx}.** ❌ {error[:80]}\n"
+                continue
+            found += 1
+            response += f"**{idx}.** ✅ `{analysis['original_data'][:100]}`\n"
+            if analysis['sm_dp_address']:
+                self.remember_last_lpa(
+                    context, f"LPA:1${analysis['sm_dp_address']}${analysis['activation_code']}"
+                )
+        response += f"\n📊 Đọc được {found}/{len(messages)} ảnh"
+        if found > 1:
+            response += "\n💡 Dùng **📦 Thêm hàng loạt** và gửi lại album để lưu tất cả vào kho"
+
+        await update.message.reply_text(
+            response,
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=self.get_result_actions_keyboard(update, context)
+        )
+        return ConversationHandler.END
+
     # Tool 4: Tạo link từ QR
     async def start_link_from_qr(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Bắt đầu tạo link từ QR data"""
@@ -1133,7 +1244,7 @@ class eSIMBot:
             analysis = esim_tools.extract_sm_dp_and_activation(lpa_string)
             
             # Tạo QR code từ LPA string
-            qr_image, _ = esim_tools.create_qr_from_lpa(lpa_string)
+            qr_image, _ = await render_qr(esim_tools.create_qr_from_lpa, lpa_string)
             self.remember_last_lpa(context, lpa_string)
             
             # Tạo install link
@@ -1542,17 +1653,14 @@ class eSIMBot:
         )
         
         try:
-            # Import requests để download ảnh
+            # Import requests để bắt lỗi tải ảnh
             import requests
             
-            # Download ảnh từ URL (chạy off-thread để không block event loop)
-            response = await asyncio.to_thread(requests.get, url, timeout=30)
-            response.raise_for_status()
-            
-            image_data = response.content
-            
-            # Phân tích QR từ ảnh (chạy off-thread)
-            analysis = await asyncio.to_thread(esim_tools.analyze_qr_image, image_data)
+            # Tải ảnh theo từng đoạn vào buffer dùng lại rồi phân tích QR (off-thread)
+            analysis = await analyze_url_image(
+                url, functools.partial(esim_tools.analyze_qr_image, source='url'), timeout=30,
+                result_key='analyze_qr_image',
+            )
             
             # Xóa message đang xử lý
             await processing_msg.delete()
@@ -1764,6 +1872,12 @@ class eSIMBot:
             "Nếu mỗi eSIM chỉ có 2 dòng, bot cũng nhận dạng cặp `Activation Code` + `ICCID` không nhãn.\n\n"
             "💡 Mỗi block có thể thêm dòng `SM-DP+:` riêng để ghi đè, hoặc dán "
             "thẳng dòng `LPA:1$...$...`.\n\n"
+            "📷 Hoặc gửi **ảnh/bản scan tờ voucher** chứa nhiều QR, bot đọc và thêm "
+            "tất cả một lần (gửi dạng file để giữ độ nét).\n\n"
+            "🗜 Có nhiều ảnh QR? Nén thành một file **.zip** rồi gửi, bot đọc từng ảnh "
+            "và gửi lại báo cáo từng file.\n\n"
+            "📄 Voucher dạng **PDF** (mỗi trang một hoặc nhiều QR) cũng gửi thẳng được; "
+            "ICCID in trên trang được lưu kèm.\n\n"
             "Gửi /cancel để hủy"
         )
 
@@ -1791,6 +1905,172 @@ class eSIMBot:
             )
             return WAITING_BULK_LIST
 
+        return await self._save_bulk_entries(update, entries, errors)
+
+    async def _decode_all_codes(self, message) -> list:
+        if message.photo:
+            # Tờ voucher cần độ phân giải cao nhất: tải thẳng bản lớn nhất
+            largest = max(message.photo, key=lambda photo: photo.width * photo.height)
+            file = await largest.get_file()
+        else:
+            file = await message.document.get_file()
+        return await analyze_telegram_file(file, esim_tools.decode_all_qr_from_image)
+
+    async def handle_bulk_image(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Đọc mọi QR trong ảnh/bản scan tờ voucher và lưu cả lô trong một transaction.
+
+        Album nhiều ảnh được gom lại (``media_groups``), giải mã song song và lưu
+        chung một lô.
+        """
+        messages = await self.media_groups.collect(update.message)
+        if messages is None:
+            # Ảnh sau trong album: message đầu album lưu chung, giữ nguyên state
+            return None
+
+        processing_msg = await update.message.reply_text(
+            f"🔄 **Đang đọc các QR trong {len(messages)} ảnh...**\n\n"
+            "⏳ Ảnh nhiều mã có thể mất vài giây.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+        results = await asyncio.gather(
+            *(self._decode_all_codes(message) for message in messages), return_exceptions=True
+        )
+        codes, image_errors = [], []
+        for idx, result in enumerate(results, 1):
+            if isinstance(result, Exception):
+                logger.warning(f"Bulk QR image failed: {result}")
+                image_errors.append({'block': f"Ảnh {idx}", 'reason': str(result)})
+            else:
+                codes.extend(result)
+
+        try:
+            await processing_msg.delete()
+        except Exception:
+            pass
+
+        if not codes:
+            error = image_errors[0]['reason'] if image_errors else "Không tìm thấy QR code nào trong ảnh"
+            await update.message.reply_text(
+                f"❌ **Không đọc được QR nào**\n\n"
+                f"**Lỗi:** {error}\n\n"
+                f"💡 Gửi ảnh dạng file để giữ nguyên độ nét, hoặc /cancel để hủy.",
+                parse_mode=ParseMode.MARKDOWN,
+                reply_markup=build_cancel_keyboard()
+            )
+            return WAITING_BULK_LIST
+
+        entries, errors = esim_tools.parse_bulk_qr_codes(codes)
+        return await self._save_bulk_entries(update, entries, image_errors + errors)
+
+    async def handle_bulk_zip(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Đọc QR của mọi ảnh trong file ZIP và lưu cả lô, kèm báo cáo từng file."""
+        processing_msg = await update.message.reply_text(
+            "🔄 **Đang giải nén và đọc QR trong file ZIP...**\n\n"
+            "⏳ ZIP nhiều ảnh có thể mất một lúc.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+        decode = functools.partial(
+            decode_zip_archive,
+            workers=getattr(config, 'ZIP_DECODE_WORKERS', 0),
+            max_members=getattr(config, 'ZIP_MAX_IMAGES', 500),
+        )
+        try:
+            file = await update.message.document.get_file()
+            report = await analyze_telegram_file(file, decode)
+            error = None
+        except Exception as e:
+            logger.warning(f"Bulk ZIP failed: {e}")
+            report, error = None, str(e)
+
+        try:
+            await processing_msg.delete()
+        except Exception:
+            pass
+
+        if report is None or not report.codes:
+            if error is None:
+                error = f"Không tìm thấy QR code nào trong {report.count('ok') + report.count('error')} ảnh"
+            await update.message.reply_text(
+                f"❌ **Không đọc được QR nào từ file ZIP**\n\n"
+                f"**Lỗi:** {error}\n\n"
+                f"💡 Gửi file khác hoặc /cancel để hủy.",
+                parse_mode=ParseMode.MARKDOWN,
+                reply_markup=build_cancel_keyboard()
+            )
+            return WAITING_BULK_LIST
+
+        entries, errors = esim_tools.parse_bulk_qr_codes(report.codes)
+        file_errors = [
+            {'block': f.name, 'reason': f.reason}
+            for f in report.files
+            if f.status in ('error', 'duplicate')
+        ]
+        if any(f.status != 'ok' for f in report.files):
+            await update.message.reply_document(
+                document=io.BytesIO(format_archive_report(report).encode('utf-8')),
+                filename='zip_report.tsv',
+                caption=(
+                    f"📁 {len(report.files)} file: {report.count('ok')} đọc được, "
+                    f"{report.count('duplicate')} trùng, {report.count('error')} lỗi, "
+                    f"{report.count('skipped')} bỏ qua"
+                ),
+            )
+        return await self._save_bulk_entries(update, entries, file_errors + errors)
+
+    async def handle_bulk_pdf(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Đọc QR trên mọi trang của PDF voucher (kèm ICCID in trên trang) và lưu cả lô."""
+        processing_msg = await update.message.reply_text(
+            "🔄 **Đang đọc QR trên các trang PDF...**\n\n"
+            "⏳ PDF nhiều trang có thể mất một lúc.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+        decode = functools.partial(
+            decode_pdf,
+            workers=getattr(config, 'PDF_DECODE_WORKERS', 0),
+            max_pages=getattr(config, 'PDF_MAX_PAGES', 500),
+        )
+        try:
+            file = await update.message.document.get_file()
+            report = await analyze_telegram_file(file, decode)
+            error = None
+        except Exception as e:
+            logger.warning(f"Bulk PDF failed: {e}")
+            report, error = None, str(e)
+
+        try:
+            await processing_msg.delete()
+        except Exception:
+            pass
+
+        if report is None or not report.codes:
+            if error is None:
+                error = f"Không tìm thấy QR code nào trong {len(report.pages)} trang"
+            await update.message.reply_text(
+                f"❌ **Không đọc được QR nào từ file PDF**\n\n"
+                f"**Lỗi:** {error}\n\n"
+                f"💡 Gửi file khác hoặc /cancel để hủy.",
+                parse_mode=ParseMode.MARKDOWN,
+                reply_markup=build_cancel_keyboard()
+            )
+            return WAITING_BULK_LIST
+
+        entries, errors = esim_tools.parse_bulk_qr_codes(report.codes, report.iccids)
+        page_errors = [
+            {'block': f"Trang {number}", 'reason': "Không tìm thấy QR code"}
+            for number in report.empty_pages
+        ]
+        if report.skipped_pages:
+            page_errors.append({
+                'block': f"{report.skipped_pages} trang cuối",
+                'reason': f"Vượt quá {len(report.pages)} trang mỗi PDF",
+            })
+        return await self._save_bulk_entries(update, entries, page_errors + errors)
+
+    async def _save_bulk_entries(self, update: Update, entries: list, errors: list):
+        """Lưu các entry hàng loạt trong một transaction và gửi bảng kết quả."""
         added_ids = []
         if entries:
             try:
@@ -2128,7 +2408,7 @@ class eSIMBot:
         
         try:
             # Tạo QR code và link từ eSIM
-            qr_image, lpa_string = esim_tools.create_qr_from_lpa(esim.lpa_string)
+            qr_image, lpa_string = await render_qr(esim_tools.create_qr_from_lpa, esim.lpa_string)
             install_link = f"https://esimsetup.apple.com/esim_qrcode_provisioning?carddata={esim.lpa_string}"
             
             # Đánh dấu eSIM đã sử dụng (kèm ghi chú cài cho ai)
@@ -2190,7 +2470,9 @@ class eSIMBot:
         """Xem danh sách eSIM đã sử dụng"""
         query = update.callback_query
         
-        esims = esim_storage.get_used_esims()
+        # Chỉ lấy 10 eSIM mới nhất; tổng số lấy từ thống kê (gồm cả archive)
+        esims = esim_storage.get_used_esims(limit=10)
+        total_used = esim_storage.get_storage_stats()['used']
         
         if not esims:
             try:
@@ -2217,9 +2499,9 @@ class eSIMBot:
             return
         
         # Tạo danh sách eSIM đã dùng
-        response = f"📊 **eSIM ĐÃ SỬ DỤNG ({len(esims)} eSIM)**\n\n"
+        response = f"📊 **eSIM ĐÃ SỬ DỤNG ({total_used} eSIM)**\n\n"
         
-        for i, esim in enumerate(esims[:10], 1):  # Hiển thị tối đa 10 eSIM
+        for i, esim in enumerate(esims, 1):  # Hiển thị tối đa 10 eSIM
             response += f"**{i}. ID: {esim.id}**\n"
             response += f"📍 `{esim.sm_dp_address}`\n"
             if esim.iccid:
@@ -2234,8 +2516,8 @@ class eSIMBot:
                 response += f"👤 Bởi: {esim.used_by}\n"
             response += "\n"
         
-        if len(esims) > 10:
-            response += f"... và {len(esims) - 10} eSIM khác\n\n"
+        if total_used > len(esims):
+            response += f"... và {total_used - len(esims)} eSIM khác (tìm bằng /search)\n\n"
         
         response += "💡 **Ghi chú:** Đây là lịch sử các eSIM đã được tạo QR/link"
         
@@ -2286,7 +2568,7 @@ class eSIMBot:
         text = (
             "🗑 **XÓA eSIM KHỎI KHO**\n\n"
             f"📊 Tổng: {stats['total']} | ✅ Có sẵn: {stats['available']} | 🔴 Đã dùng: {stats['used']}\n\n"
-            "⚠️ Thao tác xóa **không thể hoàn tác**. Chọn loại xóa:"
+            f"↩️ eSIM bị xóa có thể **hoàn tác** trong {self._undo_window_text()}. Chọn loại xóa:"
         )
         await self._edit_or_reply(update, text, build_delete_menu_keyboard())
 
@@ -2342,7 +2624,7 @@ class eSIMBot:
         if esim.description:
             text += f"🏷️ **Mô tả:** {esim.description}\n"
         text += f"📦 **Trạng thái:** {status_text}\n\n"
-        text += "⚠️ Bạn chắc chắn muốn xóa eSIM này? Không thể hoàn tác."
+        text += "⚠️ Bạn chắc chắn muốn xóa eSIM này?"
 
         await self._edit_or_reply(
             update,
@@ -2353,17 +2635,25 @@ class eSIMBot:
     async def do_delete_esim(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Thực hiện xóa một eSIM."""
         esim_id = update.callback_query.data.replace("confirm_del_esim_", "")
-        success = esim_storage.delete_esim(esim_id)
+        tombstone = esim_storage.new_tombstone()
+        success = esim_storage.delete_esim(esim_id, deleted_at=tombstone)
 
         user = update.effective_user
         logger.info(f"[DELETE eSIM] User: {user.username or user.id} | ID: {esim_id} | Success: {success}")
 
         if success:
-            text = f"✅ Đã xóa eSIM `{esim_id}` khỏi kho."
+            await self._edit_or_reply(
+                update,
+                f"✅ Đã xóa eSIM `{esim_id}` khỏi kho.\n\n"
+                f"↩️ Có thể hoàn tác trong {self._undo_window_text()}.",
+                build_undo_delete_keyboard(tombstone)
+            )
         else:
-            text = f"❌ Không xóa được eSIM `{esim_id}` (có thể đã bị xóa)."
-
-        await self._edit_or_reply(update, text, build_delete_menu_keyboard())
+            await self._edit_or_reply(
+                update,
+                f"❌ Không xóa được eSIM `{esim_id}` (có thể đã bị xóa).",
+                build_delete_menu_keyboard()
+            )
 
     async def confirm_delete_used(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Xác nhận xóa toàn bộ eSIM đã dùng."""
@@ -2379,13 +2669,31 @@ class eSIMBot:
         text = (
             "🧹 **XÁC NHẬN XÓA eSIM ĐÃ DÙNG**\n\n"
             f"Sẽ xóa **{stats['used']}** eSIM đã dùng (giữ lại {stats['available']} eSIM có sẵn).\n\n"
-            "⚠️ Không thể hoàn tác. Tiếp tục?"
+            f"↩️ Có thể hoàn tác trong {self._undo_window_text()}. Tiếp tục?"
         )
         await self._edit_or_reply(update, text, build_confirm_keyboard("confirm_del_used"))
 
+    async def _snapshot_before_delete(self, update: Update, reason: str) -> bool:
+        """Tạo snapshot trước thao tác xóa hàng loạt. Trả về False nếu lỗi."""
+        try:
+            await asyncio.to_thread(self.snapshots.create_snapshot, esim_storage, reason)
+            return True
+        except Exception as e:
+            logger.error(f"Snapshot before {reason} failed: {e}")
+            await self._edit_or_reply(
+                update,
+                f"❌ **Không tạo được bản backup:** {str(e)}\n\n"
+                "Đã hủy thao tác xóa để an toàn dữ liệu.",
+                build_delete_menu_keyboard()
+            )
+            return False
+
     async def do_delete_used(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Thực hiện xóa toàn bộ eSIM đã dùng."""
-        count = esim_storage.delete_used_esims()
+        if not await self._snapshot_before_delete(update, 'delete_used'):
+            return
+        tombstone = esim_storage.new_tombstone()
+        count = esim_storage.delete_used_esims(deleted_at=tombstone)
 
         user = update.effective_user
         logger.info(f"[DELETE USED] User: {user.username or user.id} | Deleted: {count}")
@@ -2393,7 +2701,7 @@ class eSIMBot:
         await self._edit_or_reply(
             update,
             f"✅ Đã xóa **{count}** eSIM đã dùng khỏi kho.",
-            build_delete_menu_keyboard()
+            build_undo_delete_keyboard(tombstone) if count else build_delete_menu_keyboard()
         )
 
     async def confirm_delete_all(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -2411,13 +2719,17 @@ class eSIMBot:
             "💣 **XÁC NHẬN XÓA TOÀN BỘ KHO**\n\n"
             f"Sẽ xóa **TẤT CẢ {stats['total']}** eSIM "
             f"(✅ {stats['available']} có sẵn + 🔴 {stats['used']} đã dùng).\n\n"
-            "🚨 **CẢNH BÁO:** Toàn bộ dữ liệu kho sẽ bị xóa và KHÔNG THỂ HOÀN TÁC!"
+            "🚨 **CẢNH BÁO:** Toàn bộ dữ liệu kho sẽ bị xóa! "
+            f"Chỉ có thể hoàn tác trong {self._undo_window_text()}."
         )
         await self._edit_or_reply(update, text, build_confirm_keyboard("confirm_del_all"))
 
     async def do_delete_all(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Thực hiện xóa toàn bộ kho."""
-        count = esim_storage.delete_all_esims()
+        if not await self._snapshot_before_delete(update, 'delete_all'):
+            return
+        tombstone = esim_storage.new_tombstone()
+        count = esim_storage.delete_all_esims(deleted_at=tombstone)
 
         user = update.effective_user
         logger.info(f"[DELETE ALL] User: {user.username or user.id} | Deleted: {count}")
@@ -2425,9 +2737,28 @@ class eSIMBot:
         await self._edit_or_reply(
             update,
             f"✅ Đã xóa toàn bộ kho (**{count}** eSIM).",
-            build_delete_menu_keyboard()
+            build_undo_delete_keyboard(tombstone) if count else build_delete_menu_keyboard()
         )
 
+    async def undo_delete(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Hoàn tác một lần xóa (khôi phục các eSIM có cùng mốc deleted_at)."""
+        tombstone = update.callback_query.data.replace("undo_del_", "")
+        count = esim_storage.restore_deleted(tombstone)
+
+        user = update.effective_user
+        logger.info(f"[UNDO DELETE] User: {user.username or user.id} | Restored: {count}")
+
+        if count:
+            text = f"↩️ Đã khôi phục **{count}** eSIM vào kho."
+        else:
+            text = "❌ Không thể hoàn tác (đã quá hạn hoặc đã khôi phục trước đó)."
+
+        await self._edit_or_reply(update, text, build_delete_menu_keyboard())
+
+    def _undo_window_text(self) -> str:
+        hours = self.tombstone_retention.total_seconds() / 3600
+        return f"{hours:g} giờ"
+
     # Device check và Support placeholders
     async def start_check_device(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Kiểm tra thiết bị hỗ trợ eSIM"""
@@ -2518,6 +2849,10 @@ class eSIMBot:
 **📞 Hỗ trợ:**
 Gửi /start để xem menu chính
 Gửi /cancel để hủy thao tác hiện tại
+Gửi /export để xuất kho ra CSV/JSONL
+Gửi /backup để nhận bản backup database
+Gửi /search để tìm eSIM theo ID/ICCID/ghi chú
+Gửi /perf để xem số liệu hiệu năng
         """
         
         await update.message.reply_text(
@@ -2526,6 +2861,137 @@ Gửi /cancel để hủy thao tác hiện tại
             reply_markup=self.get_back_keyboard()
         )
     
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler cho command /export - xuất kho eSIM ra file CSV/JSONL"""
+        try:
+            options = parse_export_args(context.args or [])
+        except ValueError as e:
+            await update.message.reply_text(
+                f"❌ {e}\n\n"
+                "**Cú pháp:** `/export [csv|jsonl] [all|available|used] "
+                "[from:YYYY-MM-DD] [to:YYYY-MM-DD] [smdp:địa_chỉ]`\n"
+                "**Ví dụ:** `/export csv used from:2024-06-01 to:2024-06-07`",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+
+        fmt = options.pop('fmt')
+        path = None
+        try:
+            # Ghi file off-thread để không block event loop với kho lớn
+            path, count = await asyncio.to_thread(
+                export_to_tempfile, esim_storage, fmt, **options
+            )
+
+            user = update.effective_user
+            logger.info(
+                f"[EXPORT] User: {user.username or user.id} | Format: {fmt} | "
+                f"Status: {options['status'] or 'all'} | Rows: {count}"
+            )
+
+            caption = f"📤 **Xuất kho eSIM:** {count} dòng ({fmt.upper()})"
+            with open(path, 'rb') as document:
+                await update.message.reply_document(
+                    document=document,
+                    filename=build_export_filename(fmt, options['status']),
+                    caption=caption,
+                    parse_mode=ParseMode.MARKDOWN
+                )
+        except Exception as e:
+            logger.error(f"Export error: {e}")
+            await update.message.reply_text(
+                f"❌ **Lỗi xuất dữ liệu:** {str(e)}",
+                parse_mode=ParseMode.MARKDOWN
+            )
+        finally:
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    async def backup_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler cho command /backup - tạo và gửi snapshot database"""
+        processing_msg = await update.message.reply_text(
+            "🔄 **Đang backup kho eSIM...**",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+        try:
+            path = await asyncio.to_thread(self.snapshots.create_snapshot, esim_storage, 'manual')
+
+            user = update.effective_user
+            logger.info(f"[BACKUP] User: {user.username or user.id} | File: {path}")
+
+            with open(path, 'rb') as document:
+                await update.message.reply_document(
+                    document=document,
+                    filename=os.path.basename(path),
+                    caption=(
+                        f"💾 **Backup kho eSIM**\n"
+                        f"Giữ lại {self.snapshots.keep} bản gần nhất trong `{self.snapshots.backup_dir}`"
+                    ),
+                    parse_mode=ParseMode.MARKDOWN
+                )
+        except Exception as e:
+            logger.error(f"Backup error: {e}")
+            await update.message.reply_text(
+                f"❌ **Lỗi backup:** {str(e)}",
+                parse_mode=ParseMode.MARKDOWN
+            )
+        finally:
+            try:
+                await processing_msg.delete()
+            except Exception:
+                pass
+
+    async def search_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler cho command /search - tìm eSIM trong kho và lịch sử"""
+        term = " ".join(context.args or []).strip()
+        if not term:
+            await update.message.reply_text(
+                "🔎 **Cú pháp:** `/search <ID | ICCID | mã kích hoạt | ghi chú>`",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+
+        esims = await asyncio.to_thread(esim_storage.search_esims, term)
+        if not esims:
+            await update.message.reply_text(
+                f"🔎 Không tìm thấy eSIM nào khớp với `{term}`.",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+
+        response = f"🔎 **KẾT QUẢ TÌM KIẾM ({len(esims)})**\n\n"
+        for i, esim in enumerate(esims, 1):
+            status_icon = "✅" if esim.status == "available" else "🔴"
+            response += f"**{i}. {status_icon} ID: {esim.id}**\n"
+            response += f"📍 `{esim.sm_dp_address}`\n"
+            if esim.iccid:
+                response += f"📲 ICCID: `{esim.iccid}`\n"
+            if esim.used_date:
+                response += f"📅 Dùng: {esim.used_date.replace('T', ' ')[:16]}\n"
+            if esim.used_note:
+                response += f"📝 Ghi chú: {esim.used_note}\n"
+            response += "\n"
+
+        await update.message.reply_text(response, parse_mode=ParseMode.MARKDOWN)
+
+    async def perf_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler cho command /perf - số liệu hiệu năng của process hiện tại"""
+        if not metrics.enabled:
+            await update.message.reply_text(
+                "📊 Chưa bật đo hiệu năng. Đặt `METRICS_ENABLED=1` (hoặc `METRICS_PORT`) rồi khởi động lại bot.",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+
+        report = format_perf_report(metrics)
+        header = f"📊 **HIỆU NĂNG** (worker {self.worker_index})\n"
+        # Khối code giữ thẳng cột; cắt bớt để vừa giới hạn 4096 ký tự
+        await update.message.reply_text(
+            header + "```\n" + report[:3900] + "\n```",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
     async def get_user_id(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handler để lấy user ID cho debug"""
         response = format_user_id_response(update.effective_user, ADMIN_IDS)
@@ -2556,25 +3022,263 @@ Gửi /cancel để hủy thao tác hiện tại
         except Exception as e:
             logger.warning(f"Could not set bot commands: {e}")
     
-    def run(self):
-        """Chạy bot"""
-        # Tạo application
+    async def post_init(self, application: Application):
+        """Khởi động các tác vụ nền sau khi application sẵn sàng."""
+        interval_seconds = getattr(config, 'COMPACT_INTERVAL_MINUTES', 30) * 60
+        # Nhiều worker: chỉ leader chạy compactor; lease sống qua hai chu kỳ
+        lease = None
+        if self._workers() > 1:
+            lease = LeaderLease(esim_storage, 'storage_compactor', ttl_seconds=interval_seconds * 2)
+        compactor = StorageCompactor(
+            esim_storage,
+            retention=self.tombstone_retention,
+            interval_seconds=interval_seconds,
+            archive_after=self._archive_after(),
+            lease=lease,
+        )
+        self._background_tasks.append(asyncio.create_task(compactor.run_forever()))
+        if getattr(config, 'PREWARM_QR_TOOLS', True):
+            self._background_tasks.append(asyncio.create_task(self._prewarm_qr_tools()))
+
+        if metrics.enabled:
+            self._background_tasks.append(LoopLagMonitor(registry=metrics).start())
+
+        # Chế độ nhiều worker ghi đè gauge này bằng độ sâu hàng đợi dùng chung
+        metrics.register_gauge('update_queue_depth', application.update_queue.qsize)
+        metrics.register_gauge('download_buffer_bytes', download_buffers.retained_bytes)
+        metrics.register_gauge('decode_budget_bytes_in_use', lambda: decode_admission.budget.in_use)
+        port = getattr(config, 'METRICS_PORT', 0)
+        if port:
+            self._metrics_server = MetricsServer(
+                metrics,
+                host=getattr(config, 'METRICS_LISTEN', '127.0.0.1'),
+                port=port + self.worker_index,
+            )
+            try:
+                await self._metrics_server.start()
+            except OSError as e:
+                logger.warning(f"Could not start metrics server: {e}")
+                self._metrics_server = None
+
+    async def _prewarm_qr_tools(self):
+        """Import OpenCV/qrcode off-thread sau khi bot đã nhận update."""
+        try:
+            await asyncio.to_thread(prewarm_qr_tools)
+            logger.info("QR tools pre-warmed")
+        except Exception as e:
+            logger.warning(f"Could not pre-warm QR tools: {e}")
+
+    def _archive_after(self):
+        days = getattr(config, 'ARCHIVE_AFTER_DAYS', 90)
+        return datetime.timedelta(days=days) if days and days > 0 else None
+
+    @staticmethod
+    def _workers() -> int:
+        return max(1, int(getattr(config, 'WORKERS', 1)))
+
+    async def post_shutdown(self, application: Application):
+        """Dừng các tác vụ nền khi bot tắt."""
+        if self._metrics_server is not None:
+            await self._metrics_server.stop()
+            self._metrics_server = None
+        for task in self._background_tasks:
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        self._background_tasks.clear()
+        await asyncio.to_thread(decode_pool.shutdown)
+
+    def _build_application(self):
+        """Tạo application kèm persistence và handlers."""
+        configure_storage(getattr(config, 'DB_PATH', 'esim_storage.db'))
+        decode_admission.configure(
+            max_pixels=getattr(config, 'QR_MAX_IMAGE_PIXELS', 50_000_000),
+            target_pixels=getattr(config, 'QR_DECODE_TARGET_PIXELS', 12_000_000),
+            memory_budget=getattr(config, 'QR_DECODE_MEMORY_BUDGET_MB', 256) * 1024 * 1024,
+        )
+        # Mỗi worker có pool riêng: chia số core cho các worker để không tranh CPU
+        decode_pool.configure(
+            getattr(config, 'DECODE_POOL_WORKERS', 0) or max(1, (os.cpu_count() or 1) // self._workers())
+        )
+        configure_url_cache(
+            getattr(config, 'HTTP_CACHE_DB', 'http_cache.db'),
+            getattr(config, 'HTTP_CACHE_MAX_MB', 64) * 1024 * 1024,
+        )
+        # Mở /metrics thì cũng phải đo, nếu không endpoint chỉ toàn số 0
+        metrics.enabled = bool(getattr(config, 'METRICS_ENABLED', False) or getattr(config, 'METRICS_PORT', 0))
         self.application = (
             Application.builder()
             .token(BOT_TOKEN)
             .concurrent_updates(True)
+            .persistence(SQLitePersistence(
+                esim_storage,
+                update_interval=getattr(config, 'PERSISTENCE_UPDATE_INTERVAL', 5),
+            ))
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
             .build()
         )
-        
-        # Thiết lập handlers
         self.setup_handlers()
+
+    def run(self):
+        """Chạy bot"""
+        workers = self._workers()
+        if workers > 1:
+            print(f"🤖 eSIM Support Bot khởi động với {workers} worker!")
+            print("💡 Nhấn Ctrl+C để dừng bot")
+            asyncio.run(self._run_ingress(workers))
+            return
+
+        self._build_application()
         
         # Startup message
         print("🤖 eSIM Support Bot đã khởi động!")
         print("💡 Nhấn Ctrl+C để dừng bot")
         
-        # Chạy bot với polling
-        self.application.run_polling(drop_pending_updates=True)
+        if getattr(config, 'WEBHOOK_URL', ''):
+            asyncio.run(self._run_webhook())
+        else:
+            # Không bỏ update tồn đọng khi restart, trừ khi cấu hình yêu cầu
+            self.application.run_polling(
+                drop_pending_updates=getattr(config, 'DROP_PENDING_UPDATES', False)
+            )
+
+    @staticmethod
+    def _stop_event_on_signals() -> asyncio.Event:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+        return stop_event
+
+    def _webhook_server(self, application: Application, secret_token: str, sink=None) -> WebhookServer:
+        return WebhookServer(
+            application,
+            secret_token=secret_token,
+            path=getattr(config, 'WEBHOOK_PATH', '/telegram'),
+            host=getattr(config, 'WEBHOOK_LISTEN', '0.0.0.0'),
+            port=getattr(config, 'WEBHOOK_PORT', 8443),
+            sink=sink,
+        )
+
+    async def _set_webhook(self, application: Application, server: WebhookServer, secret_token: str):
+        await application.bot.set_webhook(
+            url=config.WEBHOOK_URL.rstrip('/') + server.path,
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=getattr(config, 'DROP_PENDING_UPDATES', False),
+            max_connections=getattr(config, 'WEBHOOK_MAX_CONNECTIONS', 40),
+        )
+        server.ready = True
+        logger.info(f"Webhook mode: {config.WEBHOOK_URL}")
+
+    async def _run_webhook(self):
+        """Chạy bot ở chế độ webhook với HTTP server nhúng.
+
+        Webhook không bị xóa khi tắt bot: trong lúc deploy Telegram giữ update
+        và gửi lại khi server sẵn sàng, nên không mất update.
+        """
+        application = self.application
+        secret_token = getattr(config, 'WEBHOOK_SECRET_TOKEN', '') or secrets.token_urlsafe(32)
+        server = self._webhook_server(application, secret_token)
+        stop_event = self._stop_event_on_signals()
+
+        # Cùng thứ tự vòng đời với Application.run_polling
+        await application.initialize()
+        try:
+            await self.post_init(application)
+            await application.start()
+            await server.start()
+            await self._set_webhook(application, server, secret_token)
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+            await self.post_shutdown(application)
+
+    async def _run_ingress(self, workers: int):
+        """Process chính khi chạy nhiều worker: nhận update và ghi vào hàng đợi chung.
+
+        Mỗi worker là một process riêng (xử lý QR dùng hết một core), nhận các
+        chat thuộc phân vùng của mình từ ``SharedUpdateQueue``.
+        """
+        queue = SharedUpdateQueue(getattr(config, 'UPDATE_QUEUE_DB', 'update_queue.db'))
+        context = multiprocessing.get_context('spawn')
+        processes = [
+            context.Process(target=run_worker_process, args=(index, workers), name=f"esim-worker-{index}")
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        application = Application.builder().token(BOT_TOKEN).build()
+        stop_event = self._stop_event_on_signals()
+        server = None
+        poller = None
+        await application.initialize()
+        try:
+            await application.start()
+            if getattr(config, 'WEBHOOK_URL', ''):
+                secret_token = getattr(config, 'WEBHOOK_SECRET_TOKEN', '') or secrets.token_urlsafe(32)
+
+                async def sink(payload):
+                    await asyncio.to_thread(queue.enqueue, payload)
+
+                server = self._webhook_server(application, secret_token, sink=sink)
+                await server.start()
+                await self._set_webhook(application, server, secret_token)
+            else:
+                poller = asyncio.create_task(poll_into_queue(
+                    application.bot, queue, stop_event,
+                    drop_pending_updates=getattr(config, 'DROP_PENDING_UPDATES', False),
+                ))
+            await stop_event.wait()
+        finally:
+            if poller is not None:
+                poller.cancel()
+                await asyncio.gather(poller, return_exceptions=True)
+            if server is not None:
+                await server.stop()
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                await asyncio.to_thread(process.join, 30)
+
+    def run_worker(self, worker_index: int, workers: int):
+        """Chạy một worker: xử lý update thuộc phân vùng ``worker_index``."""
+        self.worker_index = worker_index
+        self._build_application()
+        asyncio.run(self._run_worker(worker_index, workers))
+
+    async def _run_worker(self, worker_index: int, workers: int):
+        application = self.application
+        queue = SharedUpdateQueue(getattr(config, 'UPDATE_QUEUE_DB', 'update_queue.db'))
+        stop_event = self._stop_event_on_signals()
+
+        await application.initialize()
+        try:
+            await self.post_init(application)
+            await application.start()
+            metrics.register_gauge('update_queue_depth', queue.pending_count)
+            logger.info(f"Worker {worker_index}/{workers} started")
+            await consume_updates(application, queue, worker_index, workers, stop_event)
+        finally:
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+            await self.post_shutdown(application)
+
+
+def run_worker_process(worker_index: int, workers: int):
+    """Entry point của process worker (multiprocessing spawn)."""
+    eSIMBot().run_worker(worker_index, workers)
 
 def main():
     """Hàm main"""
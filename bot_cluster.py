@@ -0,0 +1,330 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from telegram import Update
+
+from esim_storage import BUSY_TIMEOUT_SECONDS, eSIMStorage
+
+logger = logging.getLogger(__name__)
+
+
+def partition_key_for(payload: Dict) -> int:
+    """Khóa phân vùng của một update: chat id (hoặc user id) nếu có.
+
+    Mọi update của cùng một chat luôn vào cùng một worker, nên trạng thái
+    ConversationHandler/user_data của chat đó chỉ nằm ở một process và thứ tự
+    tin nhắn được giữ nguyên.
+    """
+    for field in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if field in payload:
+            return abs(int(payload[field]['chat']['id']))
+    callback = payload.get('callback_query')
+    if callback:
+        if callback.get('message'):
+            return abs(int(callback['message']['chat']['id']))
+        return abs(int(callback['from']['id']))
+    for value in payload.values():
+        if isinstance(value, dict) and isinstance(value.get('from'), dict):
+            return abs(int(value['from']['id']))
+    return abs(int(payload.get('update_id', 0)))
+
+
+class SharedUpdateQueue:
+    """Hàng đợi update dùng chung giữa các worker, lưu trong một file SQLite riêng.
+
+    Đóng vai broker cục bộ: ingress (webhook/polling) ``enqueue``, mỗi worker
+    ``claim`` các update thuộc phân vùng của mình rồi ``ack`` sau khi xử lý.
+    Update đã claim mà không được ack (worker chết) sẽ được claim lại sau
+    ``lease_seconds``; worker còn sống ``renew`` lease của các update đang xử
+    lý để handler chậm không bị worker khác xử lý lần hai.
+    """
+
+    def __init__(self, db_path: str = "update_queue.db", lease_seconds: float = 60):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.init_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: tự quản lý transaction (BEGIN IMMEDIATE khi claim)
+        return sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+
+    def init_database(self):
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS update_queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    partition_key INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    claimed_by TEXT,
+                    claimed_until REAL
+                )
+            ''')
+        finally:
+            conn.close()
+
+    def enqueue(self, payload: Dict) -> int:
+        return self.enqueue_many([payload])
+
+    def enqueue_many(self, payloads: List[Dict]) -> int:
+        """Ghi một lô update trong một transaction. Trả về số update đã ghi."""
+        if not payloads:
+            return 0
+        now = time.time()
+        rows = [(partition_key_for(p), json.dumps(p, ensure_ascii=False), now) for p in payloads]
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'INSERT INTO update_queue (partition_key, payload, enqueued_at) VALUES (?, ?, ?)',
+                rows
+            )
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return len(rows)
+
+    def claim(self, worker_index: int, workers: int, worker_id: str, limit: int = 32) -> List[Tuple[int, Dict]]:
+        """Nhận tối đa ``limit`` update của phân vùng ``worker_index``, theo thứ tự đến."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('''
+                UPDATE update_queue
+                SET claimed_by = ?, claimed_until = ?
+                WHERE id IN (
+                    SELECT id FROM update_queue
+                    WHERE partition_key % ? = ?
+                      AND (claimed_until IS NULL OR claimed_until < ?)
+                    ORDER BY id
+                    LIMIT ?
+                )
+                RETURNING id, payload
+            ''', (worker_id, now + self.lease_seconds, workers, worker_index, now, limit)).fetchall()
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        # RETURNING không đảm bảo thứ tự
+        return [(row_id, json.loads(payload)) for row_id, payload in sorted(rows)]
+
+    def renew(self, ids: List[int], worker_id: str) -> int:
+        """Gia hạn lease của các update ``worker_id`` đang giữ. Trả về số update còn giữ được."""
+        if not ids:
+            return 0
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            renewed = conn.executemany(
+                'UPDATE update_queue SET claimed_until = ? WHERE id = ? AND claimed_by = ?',
+                [(time.time() + self.lease_seconds, row_id, worker_id) for row_id in ids]
+            ).rowcount
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return renewed
+
+    def ack(self, ids: List[int]) -> int:
+        if not ids:
+            return 0
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            deleted = conn.executemany(
+                'DELETE FROM update_queue WHERE id = ?', [(row_id,) for row_id in ids]
+            ).rowcount
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return deleted
+
+    def pending_count(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM update_queue').fetchone()[0]
+        finally:
+            conn.close()
+
+
+class LeaderLease:
+    """Khóa leader có thời hạn, lưu trong bảng ``leader_leases`` của database kho.
+
+    Chỉ worker giữ lease mới chạy tác vụ nền (compactor, archive). Leader gia
+    hạn mỗi lần ``acquire``; nếu leader chết, worker khác nhận lease sau
+    ``ttl_seconds``.
+    """
+
+    def __init__(self, storage: eSIMStorage, name: str, holder: Optional[str] = None, ttl_seconds: float = 60):
+        self.storage = storage
+        self.name = name
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}"
+        self.ttl_seconds = ttl_seconds
+
+    def acquire(self) -> bool:
+        """Nhận hoặc gia hạn lease. Trả về True nếu process này đang là leader."""
+        now = time.time()
+        conn = self.storage._connect()
+        try:
+            with conn:
+                conn.execute('''
+                    INSERT INTO leader_leases (name, holder, expires_at) VALUES (?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET
+                        holder = excluded.holder,
+                        expires_at = excluded.expires_at
+                    WHERE leader_leases.holder = excluded.holder
+                       OR leader_leases.expires_at < ?
+                ''', (self.name, self.holder, now + self.ttl_seconds, now))
+            row = conn.execute(
+                'SELECT holder FROM leader_leases WHERE name = ?', (self.name,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row is not None and row[0] == self.holder
+
+    def release(self):
+        conn = self.storage._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'DELETE FROM leader_leases WHERE name = ? AND holder = ?', (self.name, self.holder)
+                )
+        finally:
+            conn.close()
+
+
+def media_group_of(payload: Dict) -> Optional[str]:
+    """``media_group_id`` của update nếu là một ảnh trong album, ngược lại None."""
+    message = payload.get('message') or payload.get('channel_post')
+    return message.get('media_group_id') if isinstance(message, dict) else None
+
+
+async def _process_one(application, row_id: int, payload: Dict) -> int:
+    try:
+        await application.process_update(Update.de_json(payload, application.bot))
+    except Exception as e:
+        # Lỗi handler không được làm kẹt hàng đợi: vẫn ack và ghi log
+        logger.error(f"Error processing queued update {row_id}: {e}")
+    return row_id
+
+
+async def _process_partition(application, items: List[Tuple[int, Dict]], albums: Set[asyncio.Task]) -> List[int]:
+    """Xử lý tuần tự các update của một chat; trả về id đã xử lý xong.
+
+    Ảnh thuộc album không được chờ: MediaGroupCollector giữ ảnh đầu tiên của
+    album cho tới khi các ảnh còn lại tới, nên mỗi ảnh album chạy ở task riêng
+    (thêm vào ``albums``, ack khi task xong) và partition đi tiếp ngay.
+    """
+    done = []
+    for row_id, payload in items:
+        if media_group_of(payload):
+            albums.add(asyncio.create_task(_process_one(application, row_id, payload)))
+        else:
+            done.append(await _process_one(application, row_id, payload))
+    return done
+
+
+def _finished_albums(albums: Set[asyncio.Task]) -> List[int]:
+    finished = [task for task in albums if task.done()]
+    albums.difference_update(finished)
+    return [task.result() for task in finished]
+
+
+async def _renew_leases(queue: SharedUpdateQueue, worker_id: str, in_flight: Set[int]):
+    """Gia hạn lease của các update đã claim mà chưa ack, mỗi ``lease_seconds / 3`` giây."""
+    while True:
+        await asyncio.sleep(queue.lease_seconds / 3)
+        ids = list(in_flight)
+        try:
+            renewed = await asyncio.to_thread(queue.renew, ids, worker_id)
+        except Exception as e:
+            logger.warning(f"Could not renew update leases: {e}")
+            continue
+        if renewed < len(ids):
+            logger.warning(f"Lost lease on {len(ids) - renewed} queued updates")
+
+
+async def consume_updates(
+    application,
+    queue: SharedUpdateQueue,
+    worker_index: int,
+    workers: int,
+    stop_event: asyncio.Event,
+    batch_size: int = 32,
+    idle_sleep: float = 0.2,
+) -> int:
+    """Vòng lặp worker: claim update của phân vùng mình, xử lý rồi ack.
+
+    Update của cùng một chat xử lý tuần tự; các chat khác nhau chạy song song.
+    Riêng ảnh album chạy song song với nhau (kể cả khi nằm ở các lần claim
+    khác nhau) để được gom thành một lượt giải mã. Lease của update đang xử
+    lý được gia hạn trong lúc chờ, nên handler hay album chạy lâu hơn
+    ``lease_seconds`` không bị worker khác claim lại. Trả về tổng số update
+    đã xử lý khi ``stop_event`` được set.
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{worker_index}"
+    processed = 0
+    albums: Set[asyncio.Task] = set()
+    # Update đã claim mà chưa ack: lease được gia hạn ở task nền tới khi ack
+    in_flight: Set[int] = set()
+    renewer = asyncio.create_task(_renew_leases(queue, worker_id, in_flight))
+    try:
+        while not stop_event.is_set():
+            items = await asyncio.to_thread(queue.claim, worker_index, workers, worker_id, batch_size)
+            in_flight.update(row_id for row_id, _ in items)
+            done = _finished_albums(albums)
+            if items:
+                by_chat: Dict[int, List[Tuple[int, Dict]]] = {}
+                for item in items:
+                    by_chat.setdefault(partition_key_for(item[1]), []).append(item)
+                results = await asyncio.gather(
+                    *(_process_partition(application, group, albums) for group in by_chat.values())
+                )
+                done.extend(row_id for group in results for row_id in group)
+            if done:
+                await asyncio.to_thread(queue.ack, done)
+                in_flight.difference_update(done)
+                processed += len(done)
+            if not items:
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=idle_sleep)
+                except asyncio.TimeoutError:
+                    pass
+
+        if albums:
+            done = list(await asyncio.gather(*albums))
+            await asyncio.to_thread(queue.ack, done)
+            in_flight.difference_update(done)
+            processed += len(done)
+    finally:
+        renewer.cancel()
+        await asyncio.gather(renewer, return_exceptions=True)
+    return processed
+
+
+async def poll_into_queue(bot, queue: SharedUpdateQueue, stop_event: asyncio.Event,
+                          timeout: int = 30, drop_pending_updates: bool = False):
+    """Ingress polling cho chế độ nhiều worker: getUpdates rồi ghi vào hàng đợi.
+
+    Offset chỉ tăng sau khi lô update đã ghi xong, nên process chết giữa chừng
+    không làm mất update.
+    """
+    await bot.delete_webhook(drop_pending_updates=drop_pending_updates)
+    offset = None
+    while not stop_event.is_set():
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=Update.ALL_TYPES)
+        except Exception as e:
+            logger.warning(f"getUpdates error: {e}")
+            await asyncio.sleep(1)
+            continue
+        if updates:
+            await asyncio.to_thread(queue.enqueue_many, [u.to_dict() for u in updates])
+            offset = updates[-1].update_id + 1
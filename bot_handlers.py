@@ -1,8 +1,10 @@
+from telegram import Update
 from telegram.ext import (
     CallbackQueryHandler,
     CommandHandler,
     ConversationHandler,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 
@@ -18,9 +20,11 @@ from bot_constants import (
     WAITING_BULK_SM_DP_CUSTOM,
     WAITING_BULK_SMDP_CHOICE,
     WAITING_ESIM_SELECTION,
+    WAITING_QR_IMAGE,
     WAITING_SM_DP_LINK,
     WAITING_USE_ESIM_NOTE,
 )
+from bot_perf import count_update
 from config import ADMIN_IDS
 
 
@@ -28,11 +32,25 @@ def setup_bot_handlers(bot):
     """Register Telegram handlers for an eSIMBot instance."""
     admin_filter = filters.User(user_id=ADMIN_IDS)
 
+    # Group âm chạy trước mọi handler khác và không chặn chúng
+    bot.application.add_handler(TypeHandler(Update, count_update), group=-1)
     bot.application.add_handler(CommandHandler("start", bot.start))
     bot.application.add_handler(
         CommandHandler("help", bot.help_command, filters=admin_filter)
     )
     bot.application.add_handler(CommandHandler("myid", bot.get_user_id))
+    bot.application.add_handler(
+        CommandHandler("export", bot.export_command, filters=admin_filter)
+    )
+    bot.application.add_handler(
+        CommandHandler("backup", bot.backup_command, filters=admin_filter)
+    )
+    bot.application.add_handler(
+        CommandHandler("search", bot.search_command, filters=admin_filter)
+    )
+    bot.application.add_handler(
+        CommandHandler("perf", bot.perf_command, filters=admin_filter)
+    )
 
     create_link_qr_handler = ConversationHandler(
         entry_points=[
@@ -43,6 +61,16 @@ def setup_bot_handlers(bot):
                 MessageHandler(
                     filters.TEXT & ~filters.COMMAND,
                     bot.handle_create_link_qr_auto,
+                ),
+                MessageHandler(
+                    filters.PHOTO | filters.Document.IMAGE,
+                    bot.handle_qr_image,
+                ),
+            ],
+            WAITING_QR_IMAGE: [
+                MessageHandler(
+                    filters.PHOTO | filters.Document.IMAGE,
+                    bot.handle_qr_image,
                 )
             ],
         },
@@ -50,6 +78,8 @@ def setup_bot_handlers(bot):
         per_message=False,
         per_chat=True,
         per_user=True,
+        name="create_link_qr",
+        persistent=True,
     )
 
     add_esim_handler = ConversationHandler(
@@ -141,6 +171,8 @@ def setup_bot_handlers(bot):
         per_message=False,
         per_chat=True,
         per_user=True,
+        name="add_esim",
+        persistent=True,
     )
 
     use_esim_handler = ConversationHandler(
@@ -169,6 +201,8 @@ def setup_bot_handlers(bot):
         per_message=False,
         per_chat=True,
         per_user=True,
+        name="use_esim",
+        persistent=True,
     )
 
     bulk_add_esim_handler = ConversationHandler(
@@ -205,12 +239,23 @@ def setup_bot_handlers(bot):
                     filters.TEXT & ~filters.COMMAND & admin_filter,
                     bot.handle_bulk_list,
                 ),
+                MessageHandler(
+                    (filters.PHOTO | filters.Document.IMAGE) & admin_filter,
+                    bot.handle_bulk_image,
+                ),
+                MessageHandler(
+                    (filters.Document.ZIP | filters.Document.FileExtension("zip")) & admin_filter,
+                    bot.handle_bulk_zip,
+                ),
+                MessageHandler(filters.Document.PDF & admin_filter, bot.handle_bulk_pdf),
             ],
         },
         fallbacks=[CommandHandler("cancel", bot.cancel)],
         per_message=False,
         per_chat=True,
         per_user=True,
+        name="bulk_add_esim",
+        persistent=True,
     )
 
     bot.application.add_handler(create_link_qr_handler, group=1)
@@ -147,6 +147,13 @@ def build_confirm_keyboard(confirm_callback: str, cancel_callback: str = "delete
     ])
 
 
+def build_undo_delete_keyboard(tombstone: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("↩️ Hoàn tác", callback_data=f"undo_del_{tombstone}")],
+        [InlineKeyboardButton("🔙 Về Menu Xóa", callback_data="delete_menu")],
+    ])
+
+
 def build_bulk_smdp_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup([
         [InlineKeyboardButton("🌐 rsp.esim.exchange", callback_data="bulk_smdp_1")],
@@ -0,0 +1,406 @@
+import asyncio
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple, TypeVar
+
+from telegram import File, Message, PhotoSize
+
+from esim_http_cache import HTTPCache
+from esim_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Ảnh chụp màn hình QR thường đọc được ở cạnh dài ~800px (bản "x" của Telegram)
+DEFAULT_TARGET_SIDE = 800
+
+# Telegram gửi album tối đa 10 ảnh, từng ảnh là một update riêng cách nhau vài trăm ms
+MEDIA_GROUP_WINDOW = 1.0
+MEDIA_GROUP_MAX_ITEMS = 10
+
+# Bot API chỉ cho tải file <= 20MB; áp cùng giới hạn cho ảnh tải từ URL
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class ByteBuffer:
+    """Buffer ghi tuần tự, dùng lại được giữa các lần tải.
+
+    ``write`` chép từng đoạn vào bytearray cấp sẵn; ``getbuffer`` trả
+    memoryview phần đã ghi, nên ``esim_tools.decode_qr_from_image`` đọc thẳng
+    mà không copy. Đủ giao diện file cho ``File.download_to_memory``.
+    """
+
+    def __init__(self, capacity: int = 1024 * 1024):
+        self._data = bytearray(capacity)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data)
+
+    def reserve(self, nbytes: int):
+        """Đảm bảo chứa được ``nbytes`` byte, tăng ít nhất gấp đôi khi phải cấp lại."""
+        if nbytes <= len(self._data):
+            return
+        # Cấp bytearray mới thay vì resize tại chỗ: memoryview cũ còn sống không gây BufferError
+        grown = bytearray(max(nbytes, 2 * len(self._data)))
+        grown[:self._size] = memoryview(self._data)[:self._size]
+        self._data = grown
+
+    def write(self, chunk) -> int:
+        size = memoryview(chunk).nbytes
+        end = self._size + size
+        self.reserve(end)
+        self._data[self._size:end] = chunk
+        self._size = end
+        return size
+
+    def getbuffer(self) -> memoryview:
+        return memoryview(self._data)[:self._size]
+
+    def reset(self):
+        self._size = 0
+
+
+class BufferPool:
+    """Kho ``ByteBuffer`` dùng lại trong một worker (mỗi process bot có pool riêng).
+
+    Mỗi lượt tải + giải mã mượn một buffer rồi trả lại; pool rỗng thì cấp
+    buffer mới chứ không chờ. Chỉ giữ tối đa ``size`` buffer, và bỏ buffer đã
+    phình quá ``max_retained`` để một ảnh khổng lồ không chiếm bộ nhớ mãi.
+    """
+
+    def __init__(self, size: int = 4, capacity: int = 1024 * 1024, max_retained: int = 8 * 1024 * 1024):
+        self.size = size
+        self.capacity = capacity
+        self.max_retained = max_retained
+        self._free: List[ByteBuffer] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> ByteBuffer:
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return ByteBuffer(self.capacity)
+
+    def release(self, buffer: ByteBuffer):
+        buffer.reset()
+        if buffer.capacity > self.max_retained:
+            return
+        with self._lock:
+            if len(self._free) < self.size:
+                self._free.append(buffer)
+
+    @contextmanager
+    def buffer(self):
+        buffer = self.acquire()
+        try:
+            yield buffer
+        finally:
+            self.release(buffer)
+
+    def retained_bytes(self) -> int:
+        with self._lock:
+            return sum(buffer.capacity for buffer in self._free)
+
+
+download_buffers = BufferPool()
+
+
+class SingleFlight:
+    """Gộp các lời gọi cùng key đang chạy đồng thời thành một lần chạy (singleflight).
+
+    Lời gọi đầu tiên tạo task riêng cho ``func``; các lời gọi trùng key tới
+    trước khi task xong chỉ chờ và nhận chung kết quả (hoặc exception). Task
+    không phụ thuộc người gọi nào, nên một handler bị hủy không làm hỏng lượt
+    chạy của handler khác. Kết quả dùng chung nên người gọi không được sửa nó.
+    Đặt trước cache: cache miss cho cùng key chỉ phải tính một lần.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._finished, key))
+            metrics.inc('singleflight_total', labels={'flight': self.name, 'result': 'leader'})
+        else:
+            metrics.inc('singleflight_total', labels={'flight': self.name, 'result': 'shared'})
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Đánh dấu đã đọc exception: mọi người chờ có thể đã bị hủy trước đó
+            task.exception()
+
+
+def call_key(func: Callable) -> Hashable:
+    """Key cho một hàm phân tích, dùng trong key của ``SingleFlight``.
+
+    Hàm và bound method so sánh được sẵn (cùng hàm, cùng object). Mỗi lần gọi
+    ``functools.partial`` lại tạo object mới, nên partial được so theo hàm gốc
+    và tham số.
+    """
+    if isinstance(func, functools.partial):
+        return (call_key(func.func), func.args, tuple(sorted(func.keywords.items())))
+    return func
+
+
+# Tải + giải mã ảnh (theo URL hoặc file_unique_id) và render QR (theo tham số)
+media_flights = SingleFlight('media')
+render_flights = SingleFlight('render')
+
+
+def _read_body(response, buffer: ByteBuffer, max_bytes: int):
+    length = int(response.headers.get('Content-Length') or 0)
+    if length > max_bytes:
+        raise ValueError(f"Ảnh quá lớn ({length // 1024} KB, tối đa {max_bytes // 1024} KB)")
+    buffer.reserve(length)
+    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+        if len(buffer) + len(chunk) > max_bytes:
+            raise ValueError(f"Ảnh quá lớn (tối đa {max_bytes // 1024} KB)")
+        buffer.write(chunk)
+
+
+def fetch_url_into(url: str, buffer: ByteBuffer, timeout: float = 30,
+                   max_bytes: int = MAX_DOWNLOAD_BYTES) -> int:
+    """Tải ``url`` theo từng đoạn vào ``buffer`` (không tạo ``response.content``).
+
+    Chặn ngay khi ``Content-Length`` hoặc số byte đã nhận vượt ``max_bytes``.
+    Trả về số byte đã tải.
+    """
+    import requests
+
+    with requests.get(url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        _read_body(response, buffer, max_bytes)
+    return len(buffer)
+
+
+# Cache HTTP cho ảnh QR tải từ URL; None = tắt (bot bật theo config lúc khởi động)
+url_cache: Optional[HTTPCache] = None
+
+
+def configure_url_cache(db_path: str, max_bytes: int) -> Optional[HTTPCache]:
+    global url_cache
+    url_cache = HTTPCache(db_path, max_bytes) if max_bytes > 0 else None
+    return url_cache
+
+
+def _is_cacheable_result(result) -> bool:
+    # Lỗi có thể chỉ tạm thời (ví dụ hết ngân sách giải mã), không gắn với URL
+    return isinstance(result, dict) and not result.get('error')
+
+
+def fetch_cached_and_analyze(cache: HTTPCache, url: str, analyze: Callable, timeout: float = 30,
+                             result_key: Optional[str] = None, max_bytes: int = MAX_DOWNLOAD_BYTES):
+    """Phân tích ảnh ở ``url`` qua ``cache``: còn tươi thì không gọi mạng, hết tươi thì hỏi lại có điều kiện.
+
+    Với ``result_key``, kết quả ``analyze`` được gắn với body đang lưu; lần sau
+    cùng URL, body không đổi (còn tươi hoặc 304) thì trả luôn mà không đọc body
+    từ cache, không giải mã lại.
+    """
+    import requests
+
+    entry = cache.get(url)
+    if entry is not None and entry.is_fresh():
+        outcome = 'fresh'
+    else:
+        with download_buffers.buffer() as buffer:
+            headers = entry.validators() if entry is not None else {}
+            with requests.get(url, timeout=timeout, stream=True, headers=headers) as response:
+                if response.status_code == 304 and entry is not None:
+                    outcome = 'revalidated'
+                    entry = cache.refresh(url, response.headers) or entry
+                else:
+                    response.raise_for_status()
+                    _read_body(response, buffer, max_bytes)
+                    metrics.inc('url_download_bytes_total', len(buffer))
+                    outcome = 'stale' if entry is not None else 'miss'
+                    entry = cache.store(url, buffer.getbuffer(), response.headers)
+                    if entry is None:
+                        metrics.inc('http_cache_total', labels={'result': 'uncacheable'})
+                        return analyze(buffer)
+    metrics.inc('http_cache_total', labels={'result': outcome})
+
+    if result_key is not None:
+        cached = cache.get_result(url, result_key)
+        if cached is not None:
+            metrics.inc('http_cache_results_total', labels={'result': 'hit'})
+            return cached
+        metrics.inc('http_cache_results_total', labels={'result': 'miss'})
+    # Body chỉ được đọc từ cache khi thật sự phải giải mã lại
+    body = entry.body if entry.body is not None else cache.body(url)
+    if body is None:
+        # URL vừa bị LRU xóa giữa chừng: lần sau sẽ tải lại
+        raise ValueError("Ảnh trong cache không còn, vui lòng thử lại")
+    result = analyze(body)
+    if result_key is not None and _is_cacheable_result(result):
+        cache.put_result(url, result_key, result)
+    return result
+
+
+async def analyze_url_image(url: str, analyze: Callable[[ByteBuffer], Dict], timeout: float = 30,
+                            result_key: Optional[str] = None) -> Dict:
+    """Tải ảnh từ URL vào buffer của pool rồi phân tích, cả hai trong một lượt off-thread.
+
+    Các lời gọi cùng URL (và cùng ``analyze``) đang chạy dùng chung một lượt tải.
+    Khi ``url_cache`` bật, ảnh đi qua cache HTTP (xem ``fetch_cached_and_analyze``);
+    ``result_key`` đặt tên kết quả của ``analyze`` để lưu kèm URL.
+    """
+
+    def fetch_and_analyze():
+        cache = url_cache
+        if cache is not None:
+            return fetch_cached_and_analyze(cache, url, analyze, timeout, result_key)
+        with download_buffers.buffer() as buffer:
+            metrics.inc('url_download_bytes_total', fetch_url_into(url, buffer, timeout))
+            return analyze(buffer)
+
+    return await media_flights.do(('url', url, call_key(analyze)), lambda: asyncio.to_thread(fetch_and_analyze))
+
+
+async def _download_and_analyze(file: File, analyze: Callable[[ByteBuffer], Dict]) -> Tuple[Dict, int]:
+    """Tải file Telegram rồi phân tích off-thread; trả về ``(kết quả, số byte)``.
+
+    ``file_unique_id`` giống nhau khi cùng một file được forward nhiều lần, nên
+    là key để gộp các lượt tải + giải mã trùng đang chạy.
+    """
+
+    async def download_and_analyze():
+        with download_buffers.buffer() as buffer:
+            await file.download_to_memory(buffer)
+            return await asyncio.to_thread(analyze, buffer), len(buffer)
+
+    unique_id = getattr(file, 'file_unique_id', None)
+    if not isinstance(unique_id, str):
+        return await download_and_analyze()
+    return await media_flights.do(('file', unique_id, call_key(analyze)), download_and_analyze)
+
+
+async def render_qr(create: Callable[..., Tuple[BytesIO, str]], *args) -> Tuple[BytesIO, str]:
+    """Gọi ``create`` (ví dụ ``esim_tools.create_qr_from_lpa``) off-thread.
+
+    Các lời gọi cùng hàm, cùng tham số đang chạy dùng chung một lần render;
+    mỗi người gọi nhận ``BytesIO`` riêng trên cùng dữ liệu PNG.
+    """
+
+    def render() -> Tuple[bytes, str]:
+        image, lpa_string = create(*args)
+        return image.getvalue(), lpa_string
+
+    png, lpa_string = await render_flights.do((call_key(create), args), lambda: asyncio.to_thread(render))
+    return BytesIO(png), lpa_string
+
+
+async def analyze_telegram_file(file: File, analyze: Callable[[ByteBuffer], Dict]) -> Dict:
+    """Tải file Telegram (ảnh gửi dạng document) vào buffer của pool rồi phân tích off-thread."""
+    analysis, _ = await _download_and_analyze(file, analyze)
+    return analysis
+
+
+def photo_candidates(photos: Sequence[PhotoSize], target_side: int = DEFAULT_TARGET_SIDE) -> List[PhotoSize]:
+    """Thứ tự tải các bản của một ảnh Telegram để đọc QR.
+
+    Trước hết là bản nhỏ nhất có cạnh dài >= ``target_side``; nếu không đọc
+    được thì nâng thẳng lên bản lớn nhất (tối đa hai lần tải).
+    """
+    if not photos:
+        return []
+    ordered = sorted(photos, key=lambda p: p.width * p.height)
+    largest = ordered[-1]
+    first = next((p for p in ordered if max(p.width, p.height) >= target_side), largest)
+    return [first] if first is largest else [first, largest]
+
+
+async def decode_photo_progressively(
+    photos: Sequence[PhotoSize],
+    analyze: Callable[[ByteBuffer], Dict],
+    target_side: int = DEFAULT_TARGET_SIDE,
+) -> Optional[Dict]:
+    """Tải và phân tích ảnh từ bản vừa đủ lớn, chỉ tải bản lớn hơn khi thất bại.
+
+    ``analyze`` (ví dụ ``esim_tools.analyze_qr_image``) chạy off-thread và
+    nhận thẳng ``ByteBuffer`` đã tải từ ``download_buffers``. Trả về kết quả
+    của lần thử cuối, hoặc None nếu không có ảnh.
+    """
+    analysis = None
+    candidates = photo_candidates(photos, target_side)
+    for attempt, photo in enumerate(candidates):
+        if attempt:
+            first = candidates[0]
+            logger.info(f"QR not found in {first.width}x{first.height} photo, "
+                        f"escalating to {photo.width}x{photo.height}")
+        file = await photo.get_file()
+        analysis, size = await _download_and_analyze(file, analyze)
+        metrics.inc('photo_downloads_total', labels={'attempt': 'escalated' if attempt else 'first'})
+        metrics.inc('photo_download_bytes_total', size)
+        if analysis.get('qr_detected'):
+            break
+    return analysis
+
+
+class MediaGroupCollector:
+    """Gom các message cùng ``media_group_id`` (album) để xử lý một lần.
+
+    Message đầu tiên của album chờ đến khi ``window`` giây trôi qua mà không có
+    ảnh mới (hoặc đủ ``max_items``) rồi nhận cả nhóm; các message sau chỉ được
+    ghép vào nhóm. Các update cùng album phải vào handler trong lúc message đầu
+    đang chờ: ``concurrent_updates`` khi chạy một process, ``consume_updates``
+    dispatch ảnh album song song khi chạy nhiều worker.
+    """
+
+    def __init__(self, window: float = MEDIA_GROUP_WINDOW, max_items: int = MEDIA_GROUP_MAX_ITEMS):
+        self.window = window
+        self.max_items = max_items
+        self._groups: Dict[str, List[Message]] = {}
+        self._arrivals: Dict[str, asyncio.Event] = {}
+
+    async def collect(self, message: Message) -> Optional[List[Message]]:
+        """Trả về cả album (theo thứ tự gửi) cho message đầu, None cho các message sau.
+
+        Message không thuộc album được trả về ngay dạng ``[message]``.
+        """
+        group_id = message.media_group_id
+        if not group_id:
+            return [message]
+
+        group = self._groups.get(group_id)
+        if group is not None:
+            group.append(message)
+            self._arrivals[group_id].set()
+            return None
+
+        group = self._groups[group_id] = [message]
+        arrived = self._arrivals[group_id] = asyncio.Event()
+        try:
+            while len(group) < self.max_items:
+                arrived.clear()
+                try:
+                    await asyncio.wait_for(arrived.wait(), self.window)
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            del self._groups[group_id]
+            del self._arrivals[group_id]
+
+        metrics.inc('media_groups_total')
+        metrics.inc('media_group_items_total', len(group))
+        return sorted(group, key=lambda m: m.message_id)
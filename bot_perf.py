@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from bot_webhook import AsyncHTTPServer
+from esim_metrics import Histogram, MetricsRegistry, format_labels, format_value, metrics, render_prometheus
+
+logger = logging.getLogger(__name__)
+
+# Loại update được đếm trong ``updates_total{type=...}``
+_UPDATE_KINDS = (
+    'message',
+    'edited_message',
+    'callback_query',
+    'inline_query',
+    'chosen_inline_result',
+    'channel_post',
+    'edited_channel_post',
+    'my_chat_member',
+    'chat_member',
+)
+
+
+def update_kind(update: Update) -> str:
+    for kind in _UPDATE_KINDS:
+        if getattr(update, kind, None) is not None:
+            return kind
+    return 'other'
+
+
+async def count_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """TypeHandler ở group âm: đếm mọi update trước khi tới handler thật."""
+    metrics.inc('updates_total', labels={'type': update_kind(update)})
+
+
+class LoopLagMonitor:
+    """Đo độ trễ của event loop: ngủ ``interval`` rồi đo thức dậy muộn bao lâu.
+
+    Độ trễ lớn nghĩa là có code đồng bộ (giải mã ảnh, truy vấn kho...) chạy
+    thẳng trên loop và mọi update khác phải chờ. Lần trễ từ
+    ``stall_threshold`` trở lên được tính là stall (``loop_stalls_total``).
+    """
+
+    def __init__(self, interval: float = 0.05, stall_threshold: float = 0.1,
+                 registry: Optional[MetricsRegistry] = None, log_stalls: bool = True):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.registry = registry or metrics
+        self.log_stalls = log_stalls
+        self.histogram = Histogram()
+        self.stalls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def observe(self, lag: float):
+        self.histogram.observe(lag)
+        self.registry.observe('loop.lag', lag)
+        if lag >= self.stall_threshold:
+            self.stalls += 1
+            self.registry.inc('loop_stalls_total')
+            if self.log_stalls:
+                logger.warning(f"Event loop stalled for {lag * 1000:.0f} ms")
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.observe(max(0.0, time.perf_counter() - start - self.interval))
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class MetricsServer(AsyncHTTPServer):
+    """Endpoint ``GET /metrics`` (text exposition của Prometheus) cho một process.
+
+    Chỉ nên lắng nghe ở 127.0.0.1 hoặc mạng nội bộ: số liệu không có xác thực.
+    """
+
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None, host: str = '127.0.0.1', port: int = 9464):
+        super().__init__(host, port, max_body_bytes=0, keepalive_timeout=30)
+        self.registry = registry or metrics
+
+    async def _dispatch(
+        self, method: str, target: str, headers: Dict[str, str], body: Optional[bytes]
+    ) -> Tuple[int, bytes]:
+        path = target.split('?', 1)[0]
+        if path == '/healthz':
+            return 200, b'ok'
+        if path != '/metrics':
+            return 404, b'not found'
+        if method not in ('GET', 'HEAD'):
+            return 405, b'method not allowed'
+        return 200, render_prometheus(self.registry).encode('utf-8')
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f}"
+
+
+def _kb(nbytes: float) -> str:
+    return f"{nbytes / 1024:.0f}"
+
+
+def format_perf_report(registry: Optional[MetricsRegistry] = None, top: int = 15) -> str:
+    """Bản tóm tắt dạng text cho lệnh ``/perf``.
+
+    Histogram xếp theo tổng thời gian (``sum``) giảm dần, chỉ lấy ``top`` dòng
+    đầu để vừa một tin nhắn Telegram.
+    """
+    registry = registry or metrics
+    lines: List[str] = []
+
+    histograms = registry.histograms()
+    snapshot = {name: h.summary() for name, h in histograms.items() if h.unit == 'seconds'}
+    ranked = sorted(snapshot.items(), key=lambda item: item[1]['sum'], reverse=True)[:top]
+    lines.append('Thời gian (ms)          n     p50     p95     p99')
+    if not ranked:
+        lines.append('  (chưa có số liệu)')
+    for name, s in ranked:
+        lines.append(
+            f"{name[:20]:<20} {s['count']:>5} {_ms(s['p50']):>7} {_ms(s['p95']):>7} {_ms(s['p99']):>7}"
+        )
+    if len(snapshot) > top:
+        lines.append(f'  ... và {len(snapshot) - top} mục khác (xem /metrics)')
+
+    sizes = {name: h.summary() for name, h in histograms.items() if h.unit == 'bytes'}
+    if sizes:
+        lines.append('')
+        lines.append('Bộ nhớ (KB)             n     p50     p95     max')
+        for name, s in sizes.items():
+            lines.append(
+                f"{name[:20]:<20} {s['count']:>5} {_kb(s['p50']):>7} {_kb(s['p95']):>7} {_kb(s['max']):>7}"
+            )
+
+    counters = registry.counters()
+    if counters:
+        lines.append('')
+        lines.append('Bộ đếm:')
+        for name, series in counters.items():
+            for key, value in sorted(series.items()):
+                lines.append(f'{name}{format_labels(key)} {format_value(value)}')
+
+    gauges = {name: value for name, value in registry.gauges().items() if value is not None}
+    if gauges:
+        lines.append('')
+        lines.append('Gauge:')
+        for name, value in gauges.items():
+            lines.append(f'{name} {format_value(value)}')
+
+    return '\n'.join(lines)
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import pickle
+import threading
+from typing import Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from esim_storage import eSIMStorage
+
+logger = logging.getLogger(__name__)
+
+# Kind của từng loại dữ liệu trong bảng bot_persistence
+_USER = 'user'
+_CHAT = 'chat'
+_BOT = 'bot'
+_CONVERSATION = 'conversation:'
+
+
+class SQLitePersistence(BasePersistence):
+    """Lưu ``user_data`` và trạng thái ConversationHandler vào database kho.
+
+    Dùng chung kết nối của ``eSIMStorage`` (bảng ``bot_persistence``, tạo bởi
+    migration của kho). PTB gọi các hàm ``update_*`` theo lô mỗi
+    ``update_interval`` giây ở tác vụ nền, không nằm trong đường xử lý update.
+    Mỗi lô được gom vào bộ đệm rồi ghi off-thread trong một transaction;
+    ``flush()`` khi tắt bot ghi nốt phần còn lại.
+    """
+
+    def __init__(
+        self,
+        storage: eSIMStorage,
+        update_interval: float = 5,
+        store_data: Optional[PersistenceInput] = None,
+    ):
+        super().__init__(
+            store_data=store_data or PersistenceInput(
+                bot_data=False, chat_data=False, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.storage = storage
+        # (kind, key) -> bytes đã pickle, hoặc None nếu cần xóa
+        self._pending: Dict[Tuple[str, str], Optional[bytes]] = {}
+        self._pending_lock = threading.Lock()
+        # Hai lần ghi không chạy chồng nhau (ví dụ lô định kỳ và flush() khi tắt)
+        self._write_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Đọc khi khởi động
+    # ------------------------------------------------------------------
+    def _load_kind(self, kind: str) -> Dict[str, object]:
+        conn = self.storage._connect()
+        try:
+            rows = conn.execute(
+                'SELECT key, data FROM bot_persistence WHERE kind = ?', (kind,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return {key: pickle.loads(data) for key, data in rows}
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        rows = await asyncio.to_thread(self._load_kind, _USER)
+        return {int(key): value for key, value in rows.items()}
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        rows = await asyncio.to_thread(self._load_kind, _CHAT)
+        return {int(key): value for key, value in rows.items()}
+
+    async def get_bot_data(self) -> dict:
+        rows = await asyncio.to_thread(self._load_kind, _BOT)
+        return rows.get('', {})
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        rows = await asyncio.to_thread(self._load_kind, _CONVERSATION + name)
+        # Key conversation là tuple (chat_id, user_id) lưu dạng pickle trong value
+        return dict(rows.values())
+
+    # ------------------------------------------------------------------
+    # Ghi: đệm trong RAM rồi ghi gom
+    # ------------------------------------------------------------------
+    def _queue(self, kind: str, key: str, value: Optional[object]):
+        data = None if value is None else pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._pending_lock:
+            self._pending[(kind, key)] = data
+
+    async def _persist(self, kind: str, key: str, value: Optional[object]):
+        self._queue(kind, key, value)
+        # Nhường vòng lặp để các update_* khác trong cùng lô của PTB kịp vào bộ
+        # đệm; lời gọi đầu ghi cả lô, các lời gọi sau chỉ thấy bộ đệm rỗng
+        await asyncio.sleep(0)
+        await asyncio.to_thread(self._write_pending)
+
+    def _write_pending(self) -> int:
+        """Ghi toàn bộ thay đổi đang đệm trong một transaction. Trả về số key đã ghi."""
+        with self._write_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            if pending:
+                self._write_batch(pending)
+        return len(pending)
+
+    def _write_batch(self, pending: Dict[Tuple[str, str], Optional[bytes]]):
+        upserts = [(kind, key, data) for (kind, key), data in pending.items() if data is not None]
+        deletes = [(kind, key) for (kind, key), data in pending.items() if data is None]
+
+        try:
+            conn = self.storage._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO bot_persistence (kind, key, data) VALUES (?, ?, ?)',
+                        upserts
+                    )
+                    conn.executemany(
+                        'DELETE FROM bot_persistence WHERE kind = ? AND key = ?', deletes
+                    )
+            finally:
+                conn.close()
+        except Exception:
+            # Trả lại bộ đệm để lần ghi sau thử lại, không ghi đè dữ liệu mới hơn
+            with self._pending_lock:
+                for item, data in pending.items():
+                    self._pending.setdefault(item, data)
+            raise
+
+        logger.debug(f"Persisted {len(pending)} bot state keys")
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        await self._persist(_USER, str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        await self._persist(_CHAT, str(chat_id), data)
+
+    async def update_bot_data(self, data: dict) -> None:
+        await self._persist(_BOT, '', data)
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        # Lưu cả key gốc trong value để đọc lại đúng kiểu tuple
+        await self._persist(
+            _CONVERSATION + name,
+            repr(key),
+            None if new_state is None else (key, new_state),
+        )
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._persist(_USER, str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self._persist(_CHAT, str(chat_id), None)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        await asyncio.to_thread(self._write_pending)
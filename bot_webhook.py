@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import time
+import urllib.error
+import urllib.request
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+MAX_HEADER_LINES = 100
+
+_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    503: 'Service Unavailable',
+}
+
+
+class BadRequest(Exception):
+    """Request không đọc được đúng khung (Content-Length sai, body chunked...).
+
+    Server trả 400 rồi đóng kết nối vì không biết body kết thúc ở đâu.
+    """
+
+
+class AsyncHTTPServer:
+    """HTTP/1.1 server tối giản trên asyncio (keep-alive, giới hạn body).
+
+    Lớp con chỉ cần cài ``_dispatch(method, target, headers, body)`` trả về
+    ``(status, payload)``.
+    """
+
+    content_type = 'text/plain; charset=utf-8'
+
+    def __init__(self, host: str, port: int, max_body_bytes: int = 1024 * 1024,
+                 keepalive_timeout: float = 75):
+        self.host = host
+        self.port = port
+        self.max_body_bytes = max_body_bytes
+        self.keepalive_timeout = keepalive_timeout
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def bound_port(self) -> int:
+        """Port thật đang lắng nghe (hữu ích khi khởi tạo với port 0)."""
+        return self._server.sockets[0].getsockname()[1] if self._server else self.port
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info(f"{type(self).__name__} listening on {self.host}:{self.bound_port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _dispatch(
+        self, method: str, target: str, headers: Dict[str, str], body: Optional[bytes]
+    ) -> Tuple[int, bytes]:
+        raise NotImplementedError
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Telegram giữ kết nối keep-alive, nên xử lý nhiều request trên một socket
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(
+                        self._read_request(reader), timeout=self.keepalive_timeout
+                    )
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except BadRequest as e:
+                    logger.warning(f"Rejected malformed HTTP request: {e}")
+                    await self._write_response(writer, 400, b'bad request', keep_alive=False)
+                    break
+                if request is None:
+                    break
+
+                method, target, headers, body = request
+                status, payload = await self._dispatch(method, target, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except Exception as e:
+            logger.error(f"HTTP connection error: {e}")
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader
+    ) -> Optional[Tuple[str, str, Dict[str, str], Optional[bytes]]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            return None
+
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'transfer-encoding' in headers:
+            # Telegram luôn gửi Content-Length; không hỗ trợ body chunked
+            raise BadRequest(f"unsupported Transfer-Encoding: {headers['transfer-encoding']}")
+        raw_length = headers.get('content-length') or '0'
+        if not (raw_length.isascii() and raw_length.isdigit()):
+            raise BadRequest(f"invalid Content-Length: {raw_length!r}")
+        length = int(raw_length)
+        if length > self.max_body_bytes:
+            # Không đọc body quá lớn; trả 413 rồi đóng kết nối
+            headers['connection'] = 'close'
+            return method.upper(), target, headers, None
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target, headers, body
+
+    async def _write_response(self, writer: asyncio.StreamWriter, status: int, payload: bytes, keep_alive: bool):
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {self.content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
+
+
+class WebhookServer(AsyncHTTPServer):
+    """HTTP server nhỏ (asyncio thuần) nhận update từ Telegram qua webhook.
+
+    - ``POST <path>``: kiểm tra header secret token, parse ``Update`` rồi đẩy vào
+      ``application.update_queue`` và trả 200 ngay, không chờ handler xử lý.
+    - ``GET /healthz``: process còn sống.
+    - ``GET /readyz``: 200 khi application đang chạy và webhook đã đăng ký
+      (``ready = True``), ngược lại 503 để load balancer chưa chuyển traffic.
+
+    Nếu truyền ``sink``, payload JSON được chuyển cho ``sink`` thay vì
+    ``update_queue`` (chế độ nhiều worker ghi vào hàng đợi dùng chung).
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        secret_token: str,
+        path: str = '/telegram',
+        host: str = '0.0.0.0',
+        port: int = 8443,
+        max_body_bytes: int = 1024 * 1024,
+        keepalive_timeout: float = 75,
+        sink: Optional[Callable[[dict], Awaitable[None]]] = None,
+    ):
+        super().__init__(host, port, max_body_bytes, keepalive_timeout)
+        self.application = application
+        self.secret_token = secret_token
+        self.path = path if path.startswith('/') else '/' + path
+        self.sink = sink
+        self.ready = False
+
+    async def stop(self):
+        self.ready = False
+        await super().stop()
+
+    async def _dispatch(
+        self, method: str, target: str, headers: Dict[str, str], body: Optional[bytes]
+    ) -> Tuple[int, bytes]:
+        path = target.split('?', 1)[0]
+
+        if path == '/healthz':
+            return 200, b'ok'
+        if path == '/readyz':
+            if self.ready and self.application.running:
+                return 200, b'ready'
+            return 503, b'not ready'
+        if path != self.path:
+            return 404, b'not found'
+        if method != 'POST':
+            return 405, b'method not allowed'
+        # So sánh bytes: compare_digest với str chỉ nhận ASCII, header lạ sẽ làm nó raise
+        received = headers.get(SECRET_HEADER, '').encode('latin-1')
+        if not hmac.compare_digest(received, self.secret_token.encode('utf-8')):
+            logger.warning("Rejected webhook request with invalid secret token")
+            return 403, b'forbidden'
+        if body is None:
+            return 413, b'payload too large'
+
+        try:
+            payload = json.loads(body)
+            update = None if self.sink else Update.de_json(payload, self.application.bot)
+        except Exception as e:
+            logger.warning(f"Invalid webhook payload: {e}")
+            return 400, b'bad request'
+        if not isinstance(payload, dict) or 'update_id' not in payload:
+            return 400, b'bad request'
+
+        if self.sink:
+            await self.sink(payload)
+        else:
+            await self.application.update_queue.put(update)
+        return 200, b'ok'
+
+
+# ----------------------------------------------------------------------
+# Giả lập Telegram để test webhook ở máy local
+# ----------------------------------------------------------------------
+def build_fake_update(text: str, user_id: int = 1000, chat_id: Optional[int] = None,
+                      update_id: Optional[int] = None, username: str = 'tester') -> dict:
+    """Tạo payload update dạng tin nhắn văn bản giống Telegram gửi tới webhook."""
+    chat_id = user_id if chat_id is None else chat_id
+    now = int(time.time())
+    message = {
+        'message_id': now % 1_000_000,
+        'date': now,
+        'chat': {'id': chat_id, 'type': 'private', 'username': username},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': username, 'username': username},
+        'text': text,
+    }
+    if text.startswith('/'):
+        command = text.split()[0]
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    return {'update_id': update_id if update_id is not None else now, 'message': message}
+
+
+def post_fake_update(url: str, secret_token: str, payload: dict, timeout: float = 10) -> int:
+    """POST một update giả tới webhook. Trả về HTTP status."""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': secret_token},
+        method='POST',
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gửi update giả tới webhook của bot (test local)')
+    parser.add_argument('text', help='Nội dung tin nhắn, ví dụ "/start"')
+    parser.add_argument('--url', default='http://127.0.0.1:8443/telegram')
+    parser.add_argument('--secret', required=True, help='WEBHOOK_SECRET_TOKEN của bot')
+    parser.add_argument('--user-id', type=int, default=1000)
+    args = parser.parse_args()
+
+    status = post_fake_update(args.url, args.secret, build_fake_update(args.text, user_id=args.user_id))
+    print(f"HTTP {status}")
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,138 @@ BOT_TOKEN = os.getenv('BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
 # Admin IDs - chỉ admin mới dùng được Kho eSIM
 ADMIN_IDS = [123456789]  # Thay bằng Telegram user ID của bạn
 
+# =============================================================================
+# DATABASE
+# =============================================================================
+
+# File SQLite của kho eSIM (schema được tạo/migrate khi bot khởi động)
+DB_PATH = os.getenv('ESIM_DB_PATH', 'esim_storage.db')
+
+# =============================================================================
+# WEBHOOK
+# =============================================================================
+
+# URL public (HTTPS) mà Telegram gọi tới, ví dụ https://bot.example.com
+# Để trống = chạy polling như cũ
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+
+# Path nhận update và địa chỉ/port HTTP server nhúng (đặt sau reverse proxy)
+WEBHOOK_PATH = '/telegram'
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+
+# Telegram gửi kèm token này trong header X-Telegram-Bot-Api-Secret-Token;
+# để trống thì bot tự sinh token ngẫu nhiên mỗi lần khởi động
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')
+
+# Số kết nối đồng thời tối đa Telegram mở tới webhook
+WEBHOOK_MAX_CONNECTIONS = 40
+
+# Bỏ các update tồn đọng khi khởi động (polling và webhook)
+DROP_PENDING_UPDATES = False
+
+# =============================================================================
+# NHIỀU WORKER
+# =============================================================================
+
+# Số process xử lý update. >1: process chính chỉ nhận update (webhook/polling)
+# và ghi vào hàng đợi chung; mỗi worker xử lý một phần chat, dùng một core
+WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+
+# File SQLite làm hàng đợi update dùng chung giữa các worker
+UPDATE_QUEUE_DB = os.getenv('UPDATE_QUEUE_DB', 'update_queue.db')
+
+# =============================================================================
+# KHỞI ĐỘNG
+# =============================================================================
+
+# Thư viện QR (OpenCV, qrcode) chỉ nạp khi cần; True = nạp trước ở nền ngay
+# sau khi bot chạy để ảnh QR đầu tiên không phải chờ
+PREWARM_QR_TOOLS = True
+
+# Ảnh QR gửi dạng photo: tải bản nhỏ nhất có cạnh dài >= giá trị này trước,
+# chỉ tải bản gốc lớn nhất khi không đọc được QR
+QR_PHOTO_TARGET_SIDE = 800
+
+# Album ảnh (media group): chờ tối đa chừng này giây không có ảnh mới rồi xử
+# lý cả album một lần, trả lời bằng một tin nhắn
+MEDIA_GROUP_WINDOW = 1.0
+
+# Pool process giải mã ZIP/PDF dùng chung, tạo ở lần dùng đầu và giữ đến khi bot
+# tắt. 0 = số core chia cho số worker (BOT_WORKERS)
+DECODE_POOL_WORKERS = 0
+
+# Thêm hàng loạt từ file ZIP ảnh QR: số process của pool một ZIP dùng cùng lúc
+# (0 = cả pool, 1 = giải mã ngay trong bot) và số ảnh tối đa đọc trong một ZIP
+ZIP_DECODE_WORKERS = 0
+ZIP_MAX_IMAGES = 500
+
+# Thêm hàng loạt từ PDF voucher (cần pypdfium2): số process của pool một PDF dùng
+# cùng lúc (0 = cả pool, 1 = đọc ngay trong bot) và số trang tối đa đọc trong một PDF
+PDF_DECODE_WORKERS = 0
+PDF_MAX_PAGES = 500
+
+# Giới hạn giải mã ảnh QR (mọi nguồn: photo, file, URL)
+# - Ảnh lớn hơn QR_MAX_IMAGE_PIXELS bị từ chối ngay từ header
+# - Ảnh lớn hơn QR_DECODE_TARGET_PIXELS được giải mã thu nhỏ 2/4/8 lần
+# - Tổng bộ nhớ các lượt giải mã đồng thời trong một process không vượt
+#   QR_DECODE_MEMORY_BUDGET_MB, lượt vượt phải chờ
+QR_MAX_IMAGE_PIXELS = 50_000_000
+QR_DECODE_TARGET_PIXELS = 12_000_000
+QR_DECODE_MEMORY_BUDGET_MB = 256
+
+# Cache HTTP cho ảnh QR tải từ URL (SQLite): tôn trọng Cache-Control/ETag/
+# Last-Modified, ảnh còn tươi không tải lại, hết tươi chỉ hỏi lại server (304)
+# và dùng lại kết quả đã giải mã. Vượt HTTP_CACHE_MAX_MB thì xóa URL lâu không
+# dùng nhất; 0 = tắt cache
+HTTP_CACHE_DB = os.getenv('HTTP_CACHE_DB', 'http_cache.db')
+HTTP_CACHE_MAX_MB = 64
+
+# =============================================================================
+# METRICS
+# =============================================================================
+
+# Đo thời gian xử lý handler, truy vấn kho và tạo/đọc QR (histogram p50/p95/p99
+# trong RAM). Tắt thì gần như không tốn chi phí
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '0') == '1'
+
+# Port HTTP cho GET /metrics (định dạng Prometheus); 0 = tắt. Khi chạy nhiều
+# worker, worker thứ i dùng METRICS_PORT + i. Đặt port cũng tự bật đo.
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+# Không có xác thực: chỉ nên nghe ở localhost/mạng nội bộ
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+
+# =============================================================================
+# PERSISTENCE
+# =============================================================================
+
+# Chu kỳ (giây) lưu trạng thái hội thoại/user_data vào database để bot khởi
+# động lại không mất thao tác đang dở (ví dụ đang thêm hàng loạt)
+PERSISTENCE_UPDATE_INTERVAL = 5
+
+# =============================================================================
+# BACKUP
+# =============================================================================
+
+# Thư mục chứa snapshot database (tự tạo trước khi xóa hàng loạt và khi /backup)
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+
+# Số snapshot giữ lại, bản cũ hơn sẽ tự xóa
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+
+# =============================================================================
+# XÓA MỀM & DỌN DẸP
+# =============================================================================
+
+# Thời gian giữ eSIM đã xóa để có thể hoàn tác, sau đó mới xóa hẳn
+TOMBSTONE_RETENTION_HOURS = 24
+
+# Chu kỳ chạy tác vụ dọn tombstone và thu hồi dung lượng database
+COMPACT_INTERVAL_MINUTES = 30
+
+# eSIM đã dùng quá số ngày này được chuyển sang bảng archive (0 = tắt)
+ARCHIVE_AFTER_DAYS = 90
+
 # =============================================================================
 # MESSAGES
 # =============================================================================
@@ -0,0 +1,80 @@
+import datetime
+import gzip
+import logging
+import os
+import re
+import shutil
+import threading
+from typing import List, Optional
+
+from esim_storage import eSIMStorage
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PREFIX = "esim_storage_"
+SNAPSHOT_SUFFIX = ".db.gz"
+
+
+class SnapshotManager:
+    """Tạo và xoay vòng các bản snapshot nén của database kho eSIM."""
+
+    def __init__(
+        self,
+        backup_dir: str = "backups",
+        keep: int = 7,
+    ):
+        self.backup_dir = backup_dir
+        self.keep = max(1, int(keep))
+        # Một snapshot tại một thời điểm là đủ; tránh hai lần backup chồng nhau
+        self._lock = threading.Lock()
+
+    def create_snapshot(self, storage: eSIMStorage, reason: str = "manual") -> str:
+        """Backup online rồi nén gzip. Trả về đường dẫn file ``.db.gz``.
+
+        Chạy blocking (I/O + nén) nên bot gọi qua ``asyncio.to_thread``.
+        """
+        reason = re.sub(r"[^a-z0-9_-]+", "", (reason or "manual").lower()) or "manual"
+
+        with self._lock:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            base = os.path.join(self.backup_dir, f"{SNAPSHOT_PREFIX}{stamp}_{reason}")
+            raw_path = base + ".db.tmp"
+            final_path = base + SNAPSHOT_SUFFIX
+
+            try:
+                storage.backup_to(raw_path)
+                with open(raw_path, "rb") as src, gzip.open(final_path + ".tmp", "wb") as dst:
+                    shutil.copyfileobj(src, dst, length=1024 * 1024)
+                os.replace(final_path + ".tmp", final_path)
+            finally:
+                for leftover in (raw_path, final_path + ".tmp"):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+
+            logger.info(f"Created snapshot {final_path} ({reason})")
+            self._rotate()
+            return final_path
+
+    def list_snapshots(self) -> List[str]:
+        """Danh sách snapshot, mới nhất trước."""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        names = [
+            name for name in os.listdir(self.backup_dir)
+            if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)
+        ]
+        # Tên file chứa timestamp nên sort theo tên là sort theo thời gian
+        return [os.path.join(self.backup_dir, name) for name in sorted(names, reverse=True)]
+
+    def latest_snapshot(self) -> Optional[str]:
+        snapshots = self.list_snapshots()
+        return snapshots[0] if snapshots else None
+
+    def _rotate(self):
+        for old_path in self.list_snapshots()[self.keep:]:
+            try:
+                os.remove(old_path)
+                logger.info(f"Removed old snapshot {old_path}")
+            except OSError as e:
+                logger.warning(f"Could not remove snapshot {old_path}: {e}")
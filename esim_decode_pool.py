@@ -0,0 +1,72 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from esim_image_guard import decode_admission
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker(max_pixels: int, target_pixels: int, memory_budget: int):
+    """Process con (spawn) nhận lại giới hạn giải mã mà process bot đã cấu hình."""
+    decode_admission.configure(max_pixels, target_pixels, memory_budget)
+
+
+class DecodePool:
+    """Pool process giải mã dùng chung cho ZIP và PDF trong một process bot.
+
+    Pool được tạo ở lần dùng đầu tiên và giữ đến ``shutdown()``: spawn một
+    process rồi import OpenCV mất cỡ một giây, không nên trả giá đó cho mỗi
+    file. Mỗi process con nhận giới hạn của ``decode_admission`` với ngân sách
+    bộ nhớ chia đều, nên tổng vẫn không vượt cấu hình. Pool hỏng (process con
+    bị kill) được tạo lại ở lần dùng sau.
+    """
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """Số process của pool (``workers = 0`` dùng số core của máy)."""
+        return self.workers or os.cpu_count() or 1
+
+    def configure(self, workers: int):
+        """Đổi số process; pool cũ (nếu có) đóng lại và được tạo mới khi cần."""
+        with self._lock:
+            self.workers = workers
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is not None and getattr(self._pool, '_broken', False):
+                logger.warning("Decode pool is broken, starting a new one")
+                self._pool.shutdown(wait=False)
+                self._pool = None
+            if self._pool is None:
+                size = self.size
+                limits = (decode_admission.max_pixels, decode_admission.target_pixels,
+                          decode_admission.budget.limit // size)
+                # spawn thay vì fork: process bot có nhiều thread đang chạy
+                self._pool = ProcessPoolExecutor(
+                    max_workers=size, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker, initargs=limits,
+                )
+                logger.info(f"Decode pool started with {size} processes")
+            return self._pool
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+
+# Dùng chung trong process bot (bot cấu hình số process lúc khởi động)
+decode_pool = DecodePool()
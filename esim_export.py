@@ -0,0 +1,147 @@
+import csv
+import datetime
+import json
+import os
+import tempfile
+from typing import Dict, IO, Iterable, List, Tuple
+
+from esim_storage import eSIMEntry, eSIMStorage
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+EXPORT_FIELDS = [
+    'id',
+    'sm_dp_address',
+    'activation_code',
+    'iccid',
+    'lpa_string',
+    'description',
+    'status',
+    'added_date',
+    'used_date',
+    'used_by',
+    'used_note',
+]
+
+_STATUS_ALIASES = {
+    'all': None,
+    'tatca': None,
+    'available': 'available',
+    'con': 'available',
+    'used': 'used',
+    'dadung': 'used',
+}
+
+
+def parse_export_args(args: List[str]) -> Dict:
+    """Phân tích tham số lệnh ``/export``.
+
+    Cú pháp: ``/export [csv|jsonl] [all|available|used] [from:YYYY-MM-DD]
+    [to:YYYY-MM-DD] [smdp:<address>]``. Thứ tự tham số tự do.
+    Raise ``ValueError`` với thông báo tiếng Việt nếu tham số sai.
+    """
+    options = {
+        'fmt': 'csv',
+        'status': None,
+        'date_from': None,
+        'date_to': None,
+        'sm_dp_address': None,
+    }
+
+    for raw in args or []:
+        arg = raw.strip()
+        lowered = arg.lower()
+        if not arg:
+            continue
+
+        if lowered in EXPORT_FORMATS:
+            options['fmt'] = lowered
+        elif lowered in _STATUS_ALIASES:
+            options['status'] = _STATUS_ALIASES[lowered]
+        elif ':' in arg or '=' in arg:
+            key, _, value = arg.replace('=', ':', 1).partition(':')
+            key = key.strip().lower()
+            value = value.strip()
+            if key in ('from', 'tu'):
+                options['date_from'] = _parse_date(value)
+            elif key in ('to', 'den'):
+                options['date_to'] = _parse_date(value)
+            elif key in ('smdp', 'sm-dp', 'sm_dp'):
+                options['sm_dp_address'] = value
+            else:
+                raise ValueError(f"Tham số không hợp lệ: {arg}")
+        else:
+            raise ValueError(f"Tham số không hợp lệ: {arg}")
+
+    if options['date_from'] and options['date_to'] and options['date_from'] > options['date_to']:
+        raise ValueError("Ngày bắt đầu phải trước ngày kết thúc")
+
+    return options
+
+
+def _parse_date(value: str) -> datetime.date:
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Ngày không hợp lệ: {value} (định dạng YYYY-MM-DD)")
+
+
+def write_export(entries: Iterable[eSIMEntry], fmt: str, out: IO[str]) -> int:
+    """Ghi lần lượt từng eSIM ra ``out`` theo định dạng CSV/JSONL.
+
+    Không giữ danh sách trong bộ nhớ; trả về số dòng đã ghi.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Định dạng export không hỗ trợ: {fmt}")
+
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(EXPORT_FIELDS)
+        for entry in entries:
+            writer.writerow([getattr(entry, field) or '' for field in EXPORT_FIELDS])
+            count += 1
+    else:
+        for entry in entries:
+            record = {field: getattr(entry, field) for field in EXPORT_FIELDS}
+            out.write(json.dumps(record, ensure_ascii=False))
+            out.write('\n')
+            count += 1
+
+    return count
+
+
+def export_to_tempfile(
+    storage: eSIMStorage,
+    fmt: str = 'csv',
+    status: str = None,
+    date_from=None,
+    date_to=None,
+    sm_dp_address: str = None,
+) -> Tuple[str, int]:
+    """Stream eSIM từ storage ra file tạm. Trả về ``(path, số dòng)``.
+
+    Người gọi chịu trách nhiệm xóa file sau khi gửi.
+    """
+    fd, path = tempfile.mkstemp(prefix='esim_export_', suffix=f'.{fmt}')
+    try:
+        # utf-8-sig để Excel mở CSV tiếng Việt không lỗi font
+        encoding = 'utf-8-sig' if fmt == 'csv' else 'utf-8'
+        with os.fdopen(fd, 'w', encoding=encoding, newline='') as out:
+            entries = storage.iter_esims(
+                status=status,
+                date_from=date_from,
+                date_to=date_to,
+                sm_dp_address=sm_dp_address,
+            )
+            count = write_export(entries, fmt, out)
+    except Exception:
+        os.remove(path)
+        raise
+
+    return path, count
+
+
+def build_export_filename(fmt: str, status: str = None) -> str:
+    stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M')
+    return f"esim_{status or 'all'}_{stamp}.{fmt}"
@@ -0,0 +1,285 @@
+import email.utils
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+BUSY_TIMEOUT_SECONDS = 5
+
+# Không có Cache-Control/Expires: tươi trong 10% thời gian kể từ Last-Modified
+# (heuristic của RFC 9111), tối đa một ngày
+HEURISTIC_FRACTION = 0.1
+HEURISTIC_MAX_SECONDS = 24 * 3600
+
+# last_access chỉ được ghi lại khi cũ hơn chừng này giây: đủ cho LRU, và lượt
+# trúng cache liên tiếp không phải mở transaction ghi
+ACCESS_RESOLUTION_SECONDS = 60
+
+SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS http_cache (
+        url TEXT PRIMARY KEY,
+        body BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        expires_at REAL NOT NULL,
+        last_access REAL NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_http_cache_last_access ON http_cache(last_access)',
+    '''
+    CREATE TABLE IF NOT EXISTS http_cache_results (
+        url TEXT NOT NULL,
+        key TEXT NOT NULL,
+        result TEXT NOT NULL,
+        PRIMARY KEY (url, key)
+    )
+    ''',
+)
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """``"max-age=60, no-cache"`` -> ``{'max-age': '60', 'no-cache': None}`` (tên viết thường)."""
+    directives: Dict[str, Optional[str]] = {}
+    for part in (value or '').split(','):
+        name, _, arg = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip().strip('"') or None
+    return directives
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_deadline(headers: Mapping[str, str], now: float) -> Optional[float]:
+    """Thời điểm response hết tươi, hoặc None nếu không được lưu (``no-store``).
+
+    Thứ tự: ``no-cache`` (lưu nhưng lần nào cũng hỏi lại server), ``max-age``
+    (trừ ``Age``), ``Expires``, rồi heuristic theo ``Last-Modified``.
+    """
+    directives = parse_cache_control(headers.get('Cache-Control'))
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return now
+    if 'max-age' in directives:
+        try:
+            max_age = int(directives['max-age'] or 0)
+        except ValueError:
+            return now
+        try:
+            age = int(headers.get('Age') or 0)
+        except ValueError:
+            age = 0
+        return now + max(0, max_age - age)
+    if 'Expires' in headers:
+        # Expires sai định dạng (ví dụ "0") nghĩa là đã hết hạn
+        return _http_date(headers['Expires']) or now
+    last_modified = _http_date(headers.get('Last-Modified'))
+    if last_modified is not None:
+        served = _http_date(headers.get('Date')) or now
+        return now + min(HEURISTIC_MAX_SECONDS, max(0.0, served - last_modified) * HEURISTIC_FRACTION)
+    return now
+
+
+@dataclass
+class CachedResponse:
+    """Metadata của một URL đã lưu; ``body`` chỉ có khi vừa tải về (xem ``HTTPCache.body``)."""
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    expires_at: float
+    body: Optional[bytes] = None
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        return self.expires_at > (time.time() if now is None else now)
+
+    def validators(self) -> Dict[str, str]:
+        """Header cho request có điều kiện; server trả 304 nếu nội dung không đổi."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HTTPCache:
+    """Cache HTTP cục bộ trong SQLite cho ảnh QR tải từ URL.
+
+    Lưu body kèm ``ETag``/``Last-Modified`` và hạn tươi tính từ
+    ``Cache-Control``/``Expires``. Response còn tươi dùng luôn, hết tươi thì
+    hỏi lại server bằng request có điều kiện (304 chỉ gia hạn). Tổng dung lượng
+    body không vượt ``max_bytes``: vượt thì xóa các URL lâu không dùng nhất
+    (LRU). Mỗi URL còn giữ kết quả đã giải mã (``get_result``/``put_result``),
+    bị xóa khi body thay đổi.
+    """
+
+    def __init__(self, db_path: str, max_bytes: int = 64 * 1024 * 1024,
+                 access_resolution: float = ACCESS_RESOLUTION_SECONDS):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.access_resolution = access_resolution
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_SECONDS)
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    for statement in SCHEMA:
+                        conn.execute(statement)
+                    conn.commit()
+                    self._initialized = True
+        return conn
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        """Metadata đã lưu của ``url`` (còn tươi hay không, không kèm body), đồng thời đánh dấu vừa dùng."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT etag, last_modified, expires_at, last_access FROM http_cache WHERE url = ?', (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[3] >= self.access_resolution:
+                with conn:
+                    conn.execute('UPDATE http_cache SET last_access = ? WHERE url = ?', (now, url))
+        finally:
+            conn.close()
+        return CachedResponse(url, row[0], row[1], row[2])
+
+    def body(self, url: str) -> Optional[bytes]:
+        """Body đã lưu của ``url``; chỉ đọc khi thật sự cần giải mã lại."""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT body FROM http_cache WHERE url = ?', (url,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def store(self, url: str, body: bytes, headers: Mapping[str, str]) -> Optional[CachedResponse]:
+        """Lưu response 200 mới; trả về None nếu response không lưu được.
+
+        Không lưu khi ``no-store``, khi body lớn hơn cả cache, hoặc khi response
+        vừa hết tươi mà không có validator (lần sau vẫn phải tải lại toàn bộ).
+        Kết quả giải mã cũ của URL bị xóa vì body có thể đã khác.
+        """
+        now = time.time()
+        expires_at = freshness_deadline(headers, now)
+        entry = None
+        if expires_at is not None and len(body) <= self.max_bytes:
+            entry = CachedResponse(url, headers.get('ETag'), headers.get('Last-Modified'), expires_at, bytes(body))
+            if not entry.is_fresh(now) and not entry.validators():
+                entry = None
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM http_cache_results WHERE url = ?', (url,))
+                if entry is None:
+                    conn.execute('DELETE FROM http_cache WHERE url = ?', (url,))
+                    return None
+                conn.execute(
+                    'INSERT OR REPLACE INTO http_cache '
+                    '(url, body, size, etag, last_modified, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (url, entry.body, len(entry.body), entry.etag, entry.last_modified, entry.expires_at, now),
+                )
+                self._evict(conn)
+        finally:
+            conn.close()
+        return entry
+
+    def refresh(self, url: str, headers: Mapping[str, str]) -> Optional[CachedResponse]:
+        """Server trả 304: gia hạn theo header mới, giữ body và kết quả đã giải mã (trả về metadata)."""
+        entry = self.get(url)
+        if entry is None:
+            return None
+        expires_at = freshness_deadline(headers, time.time())
+        if expires_at is None:
+            # no-store: dùng body lần này rồi bỏ khỏi cache
+            entry.body = self.body(url)
+            self.delete(url)
+            return entry
+        entry.expires_at = expires_at
+        entry.etag = headers.get('ETag') or entry.etag
+        entry.last_modified = headers.get('Last-Modified') or entry.last_modified
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'UPDATE http_cache SET etag = ?, last_modified = ?, expires_at = ? WHERE url = ?',
+                    (entry.etag, entry.last_modified, entry.expires_at, url),
+                )
+        finally:
+            conn.close()
+        return entry
+
+    def delete(self, url: str):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM http_cache WHERE url = ?', (url,))
+                conn.execute('DELETE FROM http_cache_results WHERE url = ?', (url,))
+        finally:
+            conn.close()
+
+    def get_result(self, url: str, key: str) -> Optional[Dict]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT result FROM http_cache_results WHERE url = ? AND key = ?', (url, key)
+            ).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else None
+
+    def put_result(self, url: str, key: str, result: Dict):
+        """Gắn kết quả giải mã (JSON) với body đang lưu của ``url``."""
+        conn = self._connect()
+        try:
+            with conn:
+                if conn.execute('SELECT 1 FROM http_cache WHERE url = ?', (url,)).fetchone() is None:
+                    return
+                conn.execute(
+                    'INSERT OR REPLACE INTO http_cache_results (url, key, result) VALUES (?, ?, ?)',
+                    (url, key, json.dumps(result, ensure_ascii=False)),
+                )
+        finally:
+            conn.close()
+
+    def total_bytes(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute('SELECT COALESCE(SUM(size), 0) FROM http_cache').fetchone()[0]
+        finally:
+            conn.close()
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM http_cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for url, size in conn.execute('SELECT url, size FROM http_cache ORDER BY last_access'):
+            if total <= self.max_bytes:
+                break
+            evicted.append((url,))
+            total -= size
+        conn.executemany('DELETE FROM http_cache WHERE url = ?', evicted)
+        conn.executemany('DELETE FROM http_cache_results WHERE url = ?', evicted)
+        logger.info(f"HTTP cache evicted {len(evicted)} URLs")
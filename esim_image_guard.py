@@ -0,0 +1,182 @@
+import io
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+
+from esim_metrics import metrics, timer
+
+logger = logging.getLogger(__name__)
+
+# Định dạng OpenCV giải mã thu nhỏ được ngay trong bước IDCT (IMREAD_REDUCED_*);
+# định dạng khác vẫn giải mã đủ kích thước rồi mới resize
+REDUCIBLE_FORMATS = {'JPEG', 'MPO'}
+REDUCE_SCALES = (1, 2, 4, 8)
+
+# Byte mỗi pixel khi giải mã: ảnh màu BGR (3) + ảnh xám (1) + ảnh xám tăng tương phản (1)
+DECODE_BYTES_PER_PIXEL = 5
+
+
+class ImageRejected(Exception):
+    """Ảnh bị từ chối trước khi giải mã (quá lớn, không nhận dạng được, hết ngân sách bộ nhớ)."""
+
+
+@dataclass
+class DecodePlan:
+    """Kết quả xét duyệt một ảnh: kích thước gốc, hệ số thu nhỏ và bộ nhớ dự kiến."""
+    width: int
+    height: int
+    format: str
+    scale: int
+    cost: int
+
+    def imread_flag(self, cv2) -> int:
+        if self.scale == 1:
+            return cv2.IMREAD_COLOR
+        return getattr(cv2, f'IMREAD_REDUCED_COLOR_{self.scale}')
+
+
+class BufferReader(io.RawIOBase):
+    """File object chỉ đọc trên một buffer sẵn có (``io.BytesIO`` sẽ copy cả buffer)."""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast('B')
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        chunk = self._view[self._pos:self._pos + len(b)]
+        b[:len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+
+def probe_image(buffer) -> Tuple[int, int, str]:
+    """Đọc ``(width, height, format)`` từ header ảnh bằng Pillow, không giải mã pixel."""
+    from PIL import Image
+
+    reader = BufferReader(buffer)
+    try:
+        with Image.open(reader) as image:
+            width, height = image.size
+            return width, height, image.format or ''
+    except Image.DecompressionBombError as e:
+        raise ImageRejected(f"Ảnh quá lớn: {e}")
+    except Exception:
+        raise ImageRejected("Không nhận dạng được định dạng ảnh")
+    finally:
+        reader.close()
+
+
+class MemoryBudget:
+    """Semaphore tính theo byte: tổng bộ nhớ các lượt giải mã đồng thời không vượt ``limit``."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_use + nbytes <= self.limit, timeout):
+                return False
+            self.in_use += nbytes
+            return True
+
+    def release(self, nbytes: int):
+        with self._cond:
+            self.in_use -= nbytes
+            self._cond.notify_all()
+
+
+class DecodeAdmission:
+    """Xét duyệt ảnh trước ``cv2.imdecode`` để một ảnh độc hại không làm bot hết RAM.
+
+    - Đọc kích thước từ header; quá ``max_pixels`` thì từ chối.
+    - Ảnh lớn hơn ``target_pixels`` được giải mã thu nhỏ 2/4/8 lần
+      (``IMREAD_REDUCED_COLOR_*``).
+    - Mỗi lượt giải mã giữ ``cost`` byte trong ``budget`` dùng chung của process;
+      hết ngân sách thì chờ tối đa ``wait_timeout`` giây.
+    """
+
+    def __init__(self, max_pixels: int = 50_000_000, target_pixels: int = 12_000_000,
+                 memory_budget: int = 256 * 1024 * 1024, wait_timeout: float = 30):
+        self.max_pixels = max_pixels
+        self.target_pixels = target_pixels
+        self.wait_timeout = wait_timeout
+        self.budget = MemoryBudget(memory_budget)
+
+    def configure(self, max_pixels: int, target_pixels: int, memory_budget: int):
+        self.max_pixels = max_pixels
+        self.target_pixels = target_pixels
+        self.budget.limit = memory_budget
+
+    def plan(self, buffer) -> DecodePlan:
+        width, height, image_format = probe_image(buffer)
+        pixels = width * height
+        if pixels > self.max_pixels:
+            raise ImageRejected(
+                f"Ảnh quá lớn ({width}x{height}, tối đa {self.max_pixels / 1e6:.0f} MP)"
+            )
+        scale = next((s for s in REDUCE_SCALES if pixels / (s * s) <= self.target_pixels), REDUCE_SCALES[-1])
+        decoded = -(-width // scale) * -(-height // scale)
+        cost = memoryview(buffer).nbytes + decoded * DECODE_BYTES_PER_PIXEL
+        if scale > 1 and image_format not in REDUCIBLE_FORMATS:
+            # OpenCV giải mã đủ ảnh BGR rồi mới thu nhỏ
+            cost += pixels * 3
+        if cost > self.budget.limit:
+            raise ImageRejected(f"Ảnh {width}x{height} cần quá nhiều bộ nhớ để giải mã")
+        return DecodePlan(width, height, image_format, scale, cost)
+
+    @contextmanager
+    def admit(self, buffer) -> Iterator[DecodePlan]:
+        """Giữ ngân sách bộ nhớ trong suốt khối ``with``; ảnh bị từ chối raise ``ImageRejected``."""
+        try:
+            plan = self.plan(buffer)
+        except ImageRejected:
+            metrics.inc('image_admission_total', labels={'result': 'rejected'})
+            raise
+        with self.hold(plan.cost):
+            metrics.inc('image_admission_total', labels={'result': 'downscaled' if plan.scale > 1 else 'accepted'})
+            if plan.scale > 1:
+                logger.info(f"Decoding {plan.width}x{plan.height} {plan.format} image at 1/{plan.scale}")
+            yield plan
+
+    def max_render_pixels(self) -> int:
+        """Số pixel lớn nhất được render cho một ảnh không đi qua header (ví dụ trang PDF)."""
+        return min(self.target_pixels, self.budget.limit // DECODE_BYTES_PER_PIXEL)
+
+    @contextmanager
+    def hold(self, cost: int) -> Iterator[int]:
+        """Giữ ``cost`` byte ngân sách trong khối ``with``; chờ quá ``wait_timeout`` thì raise ``ImageRejected``."""
+        with timer('decode.budget_wait'):
+            acquired = self.budget.acquire(cost, self.wait_timeout)
+        if not acquired:
+            metrics.inc('image_admission_total', labels={'result': 'busy'})
+            raise ImageRejected("Bot đang xử lý nhiều ảnh, vui lòng thử lại sau ít phút")
+        try:
+            yield cost
+        finally:
+            self.budget.release(cost)
+
+
+# Dùng chung cho mọi lượt giải mã trong process (bot cấu hình lại theo config lúc khởi động)
+decode_admission = DecodeAdmission()
@@ -0,0 +1,56 @@
+import asyncio
+import datetime
+import logging
+from typing import Dict, Optional
+
+from esim_storage import eSIMStorage
+
+logger = logging.getLogger(__name__)
+
+
+class StorageCompactor:
+    """Định kỳ archive eSIM đã dùng lâu, dọn tombstone và thu hồi dung lượng database."""
+
+    def __init__(
+        self,
+        storage: eSIMStorage,
+        retention: datetime.timedelta = datetime.timedelta(hours=24),
+        interval_seconds: float = 1800,
+        batch_size: int = 500,
+        vacuum_pages: int = 1000,
+        archive_after: Optional[datetime.timedelta] = None,
+        lease=None,
+    ):
+        self.storage = storage
+        self.retention = retention
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        # None = không archive
+        self.archive_after = archive_after
+        # LeaderLease khi chạy nhiều worker: chỉ process giữ lease mới bảo trì
+        self.lease = lease
+
+    def run_once(self) -> Dict:
+        """Một lượt bảo trì (blocking). Trả về số bản ghi archive/purge và kiểu vacuum."""
+        archived = 0
+        if self.archive_after is not None:
+            archived = self.storage.archive_used_esims(self.archive_after, batch_size=self.batch_size)
+        purged = self.storage.purge_deleted(self.retention, batch_size=self.batch_size)
+        vacuum = self.storage.reclaim_space(self.vacuum_pages) if purged or archived else None
+        return {'archived': archived, 'purged': purged, 'vacuum': vacuum}
+
+    async def run_forever(self):
+        """Vòng lặp nền cho bot; mỗi lượt chạy off-thread để không block event loop."""
+        while True:
+            try:
+                if self.lease is None or await asyncio.to_thread(self.lease.acquire):
+                    result = await asyncio.to_thread(self.run_once)
+                    if result['archived'] or result['purged']:
+                        logger.info(
+                            f"Compactor archived {result['archived']} | purged {result['purged']} "
+                            f"tombstones | vacuum: {result['vacuum']}"
+                        )
+            except Exception as e:
+                logger.error(f"Compactor error: {e}")
+            await asyncio.sleep(self.interval_seconds)
@@ -0,0 +1,314 @@
+import asyncio
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def _log_buckets(start: float, factor: float, limit: float) -> List[float]:
+    bounds = []
+    value = start
+    while value < limit:
+        bounds.append(round(value, 9))
+        value *= factor
+    return bounds
+
+
+# Biên trên các bucket (giây): 50µs -> ~60s, mỗi bucket lớn hơn 25%, nên
+# percentile ước lượng từ bucket sai lệch không quá vài chục phần trăm
+DEFAULT_BUCKETS = _log_buckets(0.00005, 1.25, 60)
+
+# Bucket cho histogram đo byte: 1KB -> 2GB, gấp đôi mỗi bucket
+BYTE_BUCKETS = _log_buckets(1024, 2, 2 ** 31)
+
+
+class Histogram:
+    """Histogram bucket cố định (bộ nhớ không tăng theo số lần đo), thread-safe.
+
+    ``unit`` là đơn vị của giá trị đo (``seconds`` hoặc ``bytes``).
+    """
+
+    def __init__(self, buckets: List[float] = DEFAULT_BUCKETS, unit: str = 'seconds'):
+        self.buckets = list(buckets)
+        self.unit = unit
+        # Bucket cuối là +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, q: float) -> float:
+        """Ước lượng percentile ``q`` (0-100), nội suy tuyến tính trong bucket."""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+            maximum = self.max
+        if not total:
+            return 0.0
+        rank = q / 100 * total
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else maximum
+                value = lower + (upper - lower) * (rank - seen) / bucket_count
+                return min(value, maximum)
+            seen += bucket_count
+        return maximum
+
+    def state(self) -> Tuple[List[int], int, float]:
+        """Bản chụp nhất quán ``(counts theo bucket, count, sum)``."""
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+class MetricsRegistry:
+    """Histogram, counter và gauge theo tên.
+
+    Khi ``enabled = False`` mọi lần đo/đếm gần như miễn phí. Gauge là callback
+    chỉ được gọi lúc xuất số liệu (``/metrics``, ``/perf``).
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1, labels: Optional[Dict[str, str]] = None):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def counter_value(self, name: str, labels: Optional[Dict[str, str]] = None) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def counters(self) -> Dict[str, Dict[LabelKey, float]]:
+        with self._lock:
+            return {name: dict(series) for name, series in sorted(self._counters.items())}
+
+    def register_gauge(self, name: str, callback: Callable[[], float]):
+        with self._lock:
+            self._gauges[name] = callback
+
+    def gauges(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            items = sorted(self._gauges.items())
+        values = {}
+        for name, callback in items:
+            try:
+                values[name] = float(callback())
+            except Exception:
+                values[name] = None
+        return values
+
+    def histogram(self, name: str, buckets: List[float] = DEFAULT_BUCKETS, unit: str = 'seconds') -> Histogram:
+        """Histogram theo tên; ``buckets``/``unit`` chỉ có tác dụng ở lần tạo đầu tiên."""
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram(buckets, unit))
+        return histogram
+
+    def observe(self, name: str, seconds: float):
+        if self.enabled:
+            self.histogram(name).observe(seconds)
+
+    def observe_bytes(self, name: str, nbytes: int):
+        if self.enabled:
+            self.histogram(name, BYTE_BUCKETS, 'bytes').observe(nbytes)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            items = list(self._histograms.items())
+        return {name: histogram.summary() for name, histogram in sorted(items)}
+
+    def histograms(self) -> Dict[str, Histogram]:
+        with self._lock:
+            return dict(sorted(self._histograms.items()))
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+# Registry dùng chung của bot (bật bằng METRICS_ENABLED trong config)
+metrics = MetricsRegistry()
+
+
+@contextmanager
+def timer(name: str, registry: Optional[MetricsRegistry] = None):
+    """Đo thời gian một khối lệnh: ``with timer('qr.render'): ...``."""
+    registry = registry or metrics
+    if not registry.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.histogram(name).observe(time.perf_counter() - start)
+
+
+def timed(name: str, registry: Optional[MetricsRegistry] = None) -> Callable:
+    """Decorator đo thời gian hàm sync, async hoặc generator (tính cả lúc lặp hết)."""
+
+    def decorator(func):
+        reg = registry or metrics
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not reg.enabled:
+                    return await func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    reg.histogram(name).observe(time.perf_counter() - start)
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                if not reg.enabled:
+                    return (yield from func(*args, **kwargs))
+                start = time.perf_counter()
+                try:
+                    return (yield from func(*args, **kwargs))
+                finally:
+                    reg.histogram(name).observe(time.perf_counter() - start)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not reg.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                reg.histogram(name).observe(time.perf_counter() - start)
+        return wrapper
+
+    return decorator
+
+
+def instrument_methods(prefix: str, include: Optional[Callable[[str, Callable], bool]] = None,
+                       registry: Optional[MetricsRegistry] = None) -> Callable:
+    """Class decorator: bọc ``timed('<prefix>.<method>')`` quanh các method của class.
+
+    Mặc định bọc mọi method public (không bắt đầu bằng ``_``) khai báo trực
+    tiếp trong class; ``include(name, func)`` để chọn khác. Bỏ qua
+    staticmethod/classmethod/property.
+    """
+
+    def should_wrap(name, func):
+        if include is not None:
+            return include(name, func)
+        return not name.startswith('_')
+
+    def decorator(cls):
+        for name, value in list(vars(cls).items()):
+            if inspect.isfunction(value) and should_wrap(name, value):
+                setattr(cls, name, timed(f"{prefix}.{name}", registry)(value))
+        return cls
+
+    return decorator
+
+
+# ----------------------------------------------------------------------
+# Xuất theo định dạng text của Prometheus
+# ----------------------------------------------------------------------
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(pairs) -> str:
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape_label(v)}"' for k, v in pairs) + '}'
+
+
+def format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render_prometheus(registry: Optional[MetricsRegistry] = None, namespace: str = 'esim') -> str:
+    """Xuất toàn bộ số liệu dạng text exposition (``/metrics``).
+
+    Histogram tên ``storage.get_available_esims`` thành họ
+    ``esim_storage_duration_seconds{op="get_available_esims"}``; histogram đo
+    byte như ``memory.qr_decode_peak`` thành ``esim_memory_bytes{op=...}``.
+    """
+    registry = registry or metrics
+    lines: List[str] = []
+
+    families: Dict[str, List[Tuple[str, Histogram]]] = {}
+    for name, histogram in registry.histograms().items():
+        family, _, op = name.partition('.')
+        suffix = 'duration_seconds' if histogram.unit == 'seconds' else histogram.unit
+        families.setdefault(f'{namespace}_{family}_{suffix}', []).append((op, histogram))
+    for metric, series in families.items():
+        lines.append(f'# TYPE {metric} histogram')
+        for op, histogram in series:
+            base = [('op', op)] if op else []
+            counts, total, total_sum = histogram.state()
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + [float('inf')], counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{metric}_bucket{format_labels(base + [("le", le)])} {cumulative}')
+            lines.append(f'{metric}_sum{format_labels(base)} {total_sum!r}')
+            lines.append(f'{metric}_count{format_labels(base)} {total}')
+
+    for name, series in registry.counters().items():
+        metric = f'{namespace}_{name}'
+        lines.append(f'# TYPE {metric} counter')
+        for key, value in series.items():
+            lines.append(f'{metric}{format_labels(key)} {format_value(value)}')
+
+    for name, value in registry.gauges().items():
+        if value is None:
+            continue
+        metric = f'{namespace}_{name}'
+        lines.append(f'# TYPE {metric} gauge')
+        lines.append(f'{metric} {format_value(value)}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,262 @@
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Số dòng mỗi transaction khi backfill và thời gian nghỉ giữa hai lô, để bot
+# (và worker khác) vẫn ghi được trong lúc migrate database lớn
+BACKFILL_BATCH_SIZE = 500
+BACKFILL_PAUSE_SECONDS = 0.01
+
+
+@dataclass(frozen=True)
+class Backfill:
+    """Cập nhật dữ liệu theo lô: ``UPDATE table SET assignments WHERE where``.
+
+    ``where`` phải không còn khớp với dòng đã cập nhật, nhờ vậy backfill chạy
+    lại sau khi bị ngắt giữa chừng sẽ tiếp tục từ chỗ dừng.
+    """
+    table: str
+    assignments: str
+    where: str
+
+
+@dataclass(frozen=True)
+class Migration:
+    """Một bước nâng schema lên ``version``.
+
+    Thứ tự chạy: ``statements`` + ``apply`` trong một transaction; rồi từng
+    ``backfills`` theo lô; rồi mỗi ``indexes`` một transaction riêng (SQLite
+    không build index song song được, nên tách nhỏ để không giữ khóa ghi lâu);
+    cuối cùng mới ghi ``user_version``. Mọi bước phải chạy lại được an toàn.
+    """
+    version: int
+    name: str
+    statements: Tuple[str, ...] = ()
+    apply: Optional[Callable[[sqlite3.Connection], None]] = None
+    backfills: Tuple[Backfill, ...] = ()
+    indexes: Tuple[str, ...] = ()
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def user_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def add_column(conn: sqlite3.Connection, table: str, column: str, definition: str):
+    """``ALTER TABLE ADD COLUMN`` nếu cột chưa có (database cũ trước khi có version)."""
+    existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if column not in existing:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        logger.info(f"Migrated {table}: added {column} column")
+
+
+# ----------------------------------------------------------------------
+# Danh sách migration, version tăng dần, không sửa migration đã phát hành
+# ----------------------------------------------------------------------
+def _baseline(conn: sqlite3.Connection):
+    # Schema trước khi có user_version: database cũ có thể thiếu vài cột
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS esim_entries (
+            id TEXT PRIMARY KEY,
+            sm_dp_address TEXT NOT NULL,
+            activation_code TEXT,
+            description TEXT,
+            added_date TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'available',
+            used_date TEXT,
+            used_by TEXT,
+            lpa_string TEXT,
+            iccid TEXT,
+            used_note TEXT,
+            deleted_at TEXT
+        )
+    ''')
+    add_column(conn, 'esim_entries', 'iccid', 'TEXT')
+    add_column(conn, 'esim_entries', 'used_note', 'TEXT')
+    add_column(conn, 'esim_entries', 'deleted_at', 'TEXT')
+
+    # Bảng archive: eSIM đã dùng lâu được chuyển sang đây để bảng chính nhỏ gọn
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS esim_entries_archive (
+            id TEXT PRIMARY KEY,
+            sm_dp_address TEXT NOT NULL,
+            activation_code TEXT,
+            description TEXT,
+            added_date TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'used',
+            used_date TEXT,
+            used_by TEXT,
+            lpa_string TEXT,
+            iccid TEXT,
+            used_note TEXT,
+            deleted_at TEXT,
+            archived_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_archive_used_date
+        ON esim_entries_archive(used_date) WHERE deleted_at IS NULL
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_archive_tombstones
+        ON esim_entries_archive(deleted_at) WHERE deleted_at IS NOT NULL
+    ''')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_status ON esim_entries(status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_added_date ON esim_entries(added_date)')
+    # Partial index: chỉ chứa bản ghi chưa xóa mềm / chỉ chứa tombstone
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_live_status_added
+        ON esim_entries(status, added_date) WHERE deleted_at IS NULL
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_live_used_date
+        ON esim_entries(used_date) WHERE status = 'used' AND deleted_at IS NULL
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tombstones
+        ON esim_entries(deleted_at) WHERE deleted_at IS NOT NULL
+    ''')
+
+
+_LPA_FROM_PARTS = "lpa_string = 'LPA:1$' || sm_dp_address || '$' || COALESCE(activation_code, '')"
+_MISSING_LPA = "lpa_string IS NULL OR lpa_string = ''"
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'baseline', apply=_baseline),
+    Migration(
+        2,
+        'bot_state_tables',
+        statements=(
+            '''
+            CREATE TABLE IF NOT EXISTS bot_persistence (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (kind, key)
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS leader_leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            ''',
+        ),
+    ),
+    Migration(
+        3,
+        'lpa_backfill_iccid_smdp_indexes',
+        # eSIM cũ thiếu LPA string: dựng lại từ SM-DP+ và activation code
+        backfills=(
+            Backfill('esim_entries', _LPA_FROM_PARTS, _MISSING_LPA),
+            Backfill('esim_entries_archive', _LPA_FROM_PARTS, _MISSING_LPA),
+        ),
+        # Tra ICCID chính xác (chống trùng khi nhập) và lọc theo SM-DP+ khi xuất
+        indexes=(
+            '''
+            CREATE INDEX IF NOT EXISTS idx_live_iccid
+            ON esim_entries(iccid) WHERE iccid IS NOT NULL AND iccid != '' AND deleted_at IS NULL
+            ''',
+            '''
+            CREATE INDEX IF NOT EXISTS idx_live_smdp_status
+            ON esim_entries(sm_dp_address, status) WHERE deleted_at IS NULL
+            ''',
+        ),
+    ),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def _run_backfill(conn: sqlite3.Connection, backfill: Backfill, batch_size: int, pause: float) -> int:
+    total = 0
+    while True:
+        with _transaction(conn):
+            changed = conn.execute(f'''
+                UPDATE {backfill.table} SET {backfill.assignments}
+                WHERE rowid IN (
+                    SELECT rowid FROM {backfill.table} WHERE {backfill.where} LIMIT ?
+                )
+            ''', (batch_size,)).rowcount
+        total += changed
+        if changed < batch_size:
+            return total
+        # Nhả khóa ghi giữa hai lô
+        if pause:
+            time.sleep(pause)
+
+
+def _run_migration(conn: sqlite3.Connection, migration: Migration, batch_size: int, pause: float) -> bool:
+    """Chạy một migration. Trả về False nếu process khác đã chạy xong nó."""
+    finalize_now = not migration.backfills and not migration.indexes
+    with _transaction(conn):
+        if user_version(conn) >= migration.version:
+            return False
+        for statement in migration.statements:
+            conn.execute(statement)
+        if migration.apply is not None:
+            migration.apply(conn)
+        if finalize_now:
+            conn.execute(f'PRAGMA user_version = {migration.version}')
+    if finalize_now:
+        return True
+
+    for backfill in migration.backfills:
+        changed = _run_backfill(conn, backfill, batch_size, pause)
+        if changed:
+            logger.info(f"Migration {migration.version}: backfilled {changed} rows in {backfill.table}")
+    for index_sql in migration.indexes:
+        with _transaction(conn):
+            conn.execute(index_sql)
+    with _transaction(conn):
+        if user_version(conn) < migration.version:
+            conn.execute(f'PRAGMA user_version = {migration.version}')
+    return True
+
+
+def migrate(
+    conn: sqlite3.Connection,
+    migrations: Sequence[Migration] = MIGRATIONS,
+    batch_size: int = BACKFILL_BATCH_SIZE,
+    pause: float = BACKFILL_PAUSE_SECONDS,
+) -> Tuple[int, int]:
+    """Nâng database lên version mới nhất. Trả về ``(version_cũ, version_mới)``.
+
+    ``conn`` phải ở chế độ autocommit (``isolation_level=None``) vì hàm tự quản
+    lý transaction.
+    """
+    start = user_version(conn)
+    target = max((m.version for m in migrations), default=0)
+    if start >= target:
+        return start, start
+
+    if start == 0:
+        # Database mới: bật incremental vacuum để compactor trả lại dung lượng
+        # mà không cần VACUUM toàn bộ (không có tác dụng với database cũ)
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    # WAL: nhiều process đọc song song với một writer, không chặn nhau
+    conn.execute('PRAGMA journal_mode = WAL')
+
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version <= start:
+            continue
+        if _run_migration(conn, migration, batch_size, pause):
+            logger.info(f"Applied migration {migration.version} ({migration.name})")
+    return start, user_version(conn)
@@ -0,0 +1,158 @@
+import logging
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+from esim_decode_pool import decode_pool
+from esim_image_guard import DECODE_BYTES_PER_PIXEL, decode_admission
+from esim_metrics import metrics
+from esim_qr_decode import ImageSource, find_all_codes, image_buffer, load_backends, run_strategies
+
+logger = logging.getLogger(__name__)
+
+# DPI render thử lần lượt: 72 DPI (1 pt = 1 px) đủ cho QR cỡ voucher và không phải
+# cắt ô; trang không đọc được mới render lại nét hơn
+PDF_RENDER_DPI = (72, 200)
+MAX_PAGES = 500
+
+# pdfium không an toàn khi nhiều thread dùng cùng lúc (bot chạy decode trong to_thread)
+_pdfium_lock = threading.Lock()
+
+# Tài liệu đang được đọc trong process (xem ``_decode_pages``)
+_document = None
+_render_dpi: Sequence[int] = PDF_RENDER_DPI
+
+
+def _load_pdfium():
+    try:
+        import pypdfium2
+    except ImportError:
+        raise ValueError("Cần cài pypdfium2 để đọc file PDF (pip install pypdfium2)")
+    return pypdfium2
+
+
+@dataclass
+class PdfPage:
+    """QR đọc được trên một trang; ``iccids`` song song với ``codes`` (rỗng nếu không rõ)."""
+    number: int
+    codes: List[str] = field(default_factory=list)
+    iccids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class PdfReport:
+    pages: List[PdfPage] = field(default_factory=list)
+    skipped_pages: int = 0
+
+    @property
+    def codes(self) -> List[str]:
+        return [code for page in self.pages for code in page.codes]
+
+    @property
+    def iccids(self) -> List[str]:
+        return [iccid for page in self.pages for iccid in page.iccids]
+
+    @property
+    def empty_pages(self) -> List[int]:
+        return [page.number for page in self.pages if not page.codes]
+
+
+def _page_iccids(text: str, count: int) -> List[str]:
+    """Ghép ICCID in trên trang với các QR khi số lượng khớp nhau (theo thứ tự đọc)."""
+    from esim_tools import esim_tools
+
+    iccids = esim_tools.extract_iccids(text)
+    return iccids if len(iccids) == count else [''] * count
+
+
+def _decode_page(index: int) -> PdfPage:
+    """Render một trang (tăng dần DPI) và đọc mọi QR trên đó, kèm ICCID trong phần chữ.
+
+    Giữ ngân sách bộ nhớ của ``decode_admission`` cho lần render lớn nhất
+    trước khi render, như mọi ảnh giải mã khác.
+    """
+    cv2, _, pyzbar = load_backends()
+    page = _document[index]
+    try:
+        textpage = page.get_textpage()
+        try:
+            text = textpage.get_text_bounded()
+        finally:
+            textpage.close()
+        width, height = page.get_size()
+        area = max(1.0, width * height)
+        # Không render vượt target_pixels (và ngân sách) của decode_admission
+        scales = [min(dpi / 72, math.sqrt(decode_admission.max_render_pixels() / area)) for dpi in _render_dpi]
+        codes: List[str] = []
+        with decode_admission.hold(int(area * max(scales) ** 2) * DECODE_BYTES_PER_PIXEL):
+            gray = None
+            for scale in scales:
+                gray = page.render(scale=scale, grayscale=True).to_numpy()
+                codes = find_all_codes(cv2, pyzbar, gray)
+                if codes:
+                    break
+            if not codes and gray is not None:
+                # Trang một mã khó đọc: thử thêm các chiến lược của decode_qr_from_image
+                code = run_strategies(cv2, pyzbar, gray, gray, 'pdf')
+                codes = [code] if code else []
+    finally:
+        page.close()
+    return PdfPage(index + 1, codes, _page_iccids(text, len(codes)))
+
+
+def _decode_pages(data: bytes, render_dpi: Sequence[int], indices: Sequence[int]) -> List[PdfPage]:
+    """Mở PDF rồi đọc các trang ``indices`` (chạy trong thread gọi hoặc process của pool)."""
+    global _document, _render_dpi
+    with _pdfium_lock:
+        _document, _render_dpi = _load_pdfium().PdfDocument(data), render_dpi
+        try:
+            return [_decode_page(index) for index in indices]
+        finally:
+            _document.close()
+            _document, _render_dpi = None, PDF_RENDER_DPI
+
+
+def decode_pdf(source: ImageSource, workers: int = 0, max_pages: int = MAX_PAGES,
+               render_dpi: Optional[Sequence[int]] = None) -> PdfReport:
+    """Đọc QR trên mọi trang của một PDF voucher, chia trang cho ``decode_pool``.
+
+    Các trang được chia xen kẽ thành ``workers`` phần, mỗi phần là một task
+    mang theo PDF và tự mở PDF một lần. ``workers`` giới hạn số process của
+    pool mà một PDF dùng cùng lúc: ``0`` dùng cả pool; ``1`` (hoặc PDF một
+    trang) đọc ngay trong thread gọi. Trang vượt ``max_pages`` bị bỏ qua và
+    đếm vào ``skipped_pages``.
+    """
+    pdfium = _load_pdfium()
+    data = bytes(image_buffer(source))
+    render_dpi = tuple(render_dpi or PDF_RENDER_DPI)
+
+    with _pdfium_lock:
+        try:
+            document = pdfium.PdfDocument(data)
+        except pdfium.PdfiumError as e:
+            raise ValueError(f"File PDF không hợp lệ: {e}")
+        total = len(document)
+        document.close()
+    count = min(total, max_pages)
+    workers = min(workers or decode_pool.size, decode_pool.size, max(count, 1))
+
+    if workers == 1:
+        pages = _decode_pages(data, render_dpi, range(count))
+    else:
+        pool = decode_pool.executor()
+        futures = [pool.submit(_decode_pages, data, render_dpi, range(i, count, workers)) for i in range(workers)]
+        try:
+            pages = sorted((page for future in futures for page in future.result()), key=lambda p: p.number)
+        finally:
+            # Một phần lỗi: bỏ các phần chưa chạy, pool vẫn dùng tiếp
+            for future in futures:
+                future.cancel()
+
+    report = PdfReport(pages, skipped_pages=total - count)
+    metrics.inc('pdf_pages_total', count)
+    logger.info(
+        f"PDF decoded: {count} pages, {len(report.codes)} QR, "
+        f"{len(report.empty_pages)} empty, {report.skipped_pages} skipped"
+    )
+    return report
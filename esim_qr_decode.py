@@ -0,0 +1,507 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+
+from esim_image_guard import DECODE_BYTES_PER_PIXEL, decode_admission
+from esim_metrics import instrument_methods, metrics, timer
+
+logger = logging.getLogger(__name__)
+
+# (cv2, numpy, pyzbar | None), nạp ở lần giải mã đầu tiên
+_backends = None
+_backends_lock = threading.Lock()
+
+
+def load_backends():
+    """Import OpenCV, numpy và pyzbar (tùy chọn) khi cần; các lần sau dùng lại."""
+    global _backends
+    if _backends is None:
+        with _backends_lock:
+            if _backends is None:
+                import cv2
+                import numpy as np
+                try:
+                    from pyzbar import pyzbar
+                except (ImportError, FileNotFoundError):
+                    # Không print warning vì có thể gây lỗi encoding trên Windows
+                    pyzbar = None
+                _backends = (cv2, np, pyzbar)
+    return _backends
+
+
+def __getattr__(name):
+    # Chỉ biết pyzbar có dùng được hay không sau khi thử import
+    if name == 'PYZBAR_AVAILABLE':
+        return load_backends()[2] is not None
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Ảnh đầu vào: bytes-like, hoặc file object (``io.BytesIO``, ``bot_media.ByteBuffer``, file mở dạng ``rb``)
+ImageSource = Union[bytes, bytearray, memoryview, BinaryIO]
+
+
+def image_buffer(source: ImageSource):
+    """Trả về object hỗ trợ buffer protocol cho ``np.frombuffer``, tránh copy khi có thể.
+
+    bytes-like dùng nguyên; object có ``getbuffer()`` (``BytesIO``,
+    ``ByteBuffer``) cho memoryview trỏ vào bộ nhớ sẵn có; file object khác
+    đành phải ``read()`` toàn bộ.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    if hasattr(source, 'getbuffer'):
+        return source.getbuffer()
+    if hasattr(source, 'read'):
+        return source.read()
+    raise TypeError(f"Unsupported image source: {type(source).__name__}")
+
+
+# Chiến lược tiền xử lý thêm cho ảnh khó (ngưỡng thích nghi, làm nét, đảo màu
+# cho screenshot dark mode): chỉ chạy sau các chiến lược cơ bản và khi thống kê
+# cho thấy chúng có ích (xem ``StrategyStats``)
+EXTRA_STRATEGIES = ('adaptive_threshold', 'sharpened', 'inverted')
+
+
+def decode_strategies(cv2, pyzbar) -> List[Tuple[str, Callable]]:
+    """Các cách thử giải mã theo thứ tự mặc định: ``(tên, hàm(img, gray) -> str | None)``.
+
+    pyzbar nhanh và ổn định hơn nên thử trước; OpenCV QRCodeDetector là
+    fallback, rồi thử trên ảnh đã tăng tương phản. Cuối cùng là các chiến lược
+    trong ``EXTRA_STRATEGIES``.
+    """
+    detector = cv2.QRCodeDetector()
+
+    def zbar(image) -> Optional[str]:
+        codes = pyzbar.decode(image)
+        return codes[0].data.decode('utf-8') if codes else None
+
+    def opencv(image) -> Optional[str]:
+        data, _, _ = detector.detectAndDecode(image)
+        return data or None
+
+    read = zbar if pyzbar is not None else opencv
+
+    def sharpen(gray):
+        # Unsharp mask: bù ảnh chụp hơi mờ/rung tay
+        return cv2.addWeighted(gray, 1.5, cv2.GaussianBlur(gray, (0, 0), 3), -0.5, 0)
+
+    strategies = []
+    if pyzbar is not None:
+        strategies += [
+            ('pyzbar_gray', lambda img, gray: zbar(gray)),
+            ('pyzbar_color', lambda img, gray: zbar(img)),
+        ]
+    strategies += [
+        ('opencv_color', lambda img, gray: opencv(img)),
+        ('opencv_gray', lambda img, gray: opencv(gray)),
+        ('opencv_equalized', lambda img, gray: opencv(cv2.equalizeHist(gray))),
+        ('adaptive_threshold', lambda img, gray: read(cv2.adaptiveThreshold(
+            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10))),
+        ('sharpened', lambda img, gray: read(sharpen(gray))),
+        ('inverted', lambda img, gray: read(cv2.bitwise_not(gray))),
+    ]
+    return strategies
+
+
+def size_bucket(gray) -> str:
+    """Nhóm cỡ ảnh theo cạnh dài, dùng làm một chiều của ngữ cảnh thống kê."""
+    side = max(gray.shape[:2])
+    if side < 1000:
+        return 'small'
+    if side < 2500:
+        return 'medium'
+    return 'large'
+
+
+class StrategyStats:
+    """Tỉ lệ thành công và thời gian của từng chiến lược theo ngữ cảnh ảnh (nguồn, cỡ ảnh).
+
+    Chỉ các lượt chạy hết danh sách (``exhaustive``) được ghi vào thống kê: khi
+    ngữ cảnh còn chưa đủ ``min_trials`` lượt như vậy, và mỗi lượt thứ
+    ``explore_every`` sau đó. Lượt chạy hết vẫn trả kết quả ngay khi đọc được;
+    các chiến lược còn lại chạy tiếp ở thread nền (``explore_later``), không nằm
+    trên đường xử lý request.
+
+    ``plan`` sắp xếp các chiến lược đã có đủ ``min_trials`` lần thử theo thời
+    gian kỳ vọng cho một lần đọc được (thời gian trung bình / tỉ lệ thành công),
+    chiến lược chưa đủ dữ liệu giữ thứ tự mặc định phía sau. Việc bỏ qua dựa
+    trên tỉ lệ "cứu": tỉ lệ đọc được trên những ảnh mà mọi chiến lược chạy trước
+    nó đều trượt. Chiến lược như ``inverted`` gần như không bao giờ đọc được ảnh
+    thường (tỉ lệ chung ~0) nhưng lại là cách duy nhất đọc ảnh dark mode; nó chỉ
+    bị bỏ khi đã gặp đủ ``min_trials`` ảnh khó mà vẫn cứu được dưới ``skip_rate``.
+    """
+
+    def __init__(self, min_trials: int = 20, skip_rate: float = 0.02, explore_every: int = 50):
+        self.min_trials = min_trials
+        self.skip_rate = skip_rate
+        self.explore_every = explore_every
+        # False: giữ nguyên thứ tự đã học, không chạy hết danh sách nữa (benchmark)
+        self.exploring = True
+        self._lock = threading.Lock()
+        # (ngữ cảnh, chiến lược) -> [số lần thử, số lần thành công, tổng giây,
+        #                            số lần mọi chiến lược trước đều trượt, số lần cứu được]
+        self._stats: Dict[Tuple[str, str], List[float]] = {}
+        self._calls: Dict[str, int] = {}
+        self._runs: Dict[str, int] = {}
+        self._explorer: Optional[ThreadPoolExecutor] = None
+        self._exploring_future = None
+
+    def record_run(self, context: str, outcomes: List[Tuple[str, bool, float]]):
+        """Ghi một lượt chạy hết danh sách: ``(chiến lược, đọc được, giây)`` theo thứ tự đã chạy."""
+        with self._lock:
+            self._runs[context] = self._runs.get(context, 0) + 1
+            missed_so_far = True
+            for name, success, seconds in outcomes:
+                stat = self._stats.setdefault((context, name), [0, 0, 0.0, 0, 0])
+                stat[0] += 1
+                stat[1] += int(success)
+                stat[2] += seconds
+                if missed_so_far:
+                    stat[3] += 1
+                    stat[4] += int(success)
+                    missed_so_far = not success
+
+    def plan(self, context: str, names: List[str]) -> Tuple[List[str], bool]:
+        """Thứ tự chiến lược nên thử cho ảnh trong ``context``, và lượt này có phải chạy hết không.
+
+        Chiến lược trong ``EXTRA_STRATEGIES`` luôn đứng sau các chiến lược cơ bản.
+        """
+        with self._lock:
+            calls = self._calls[context] = self._calls.get(context, 0) + 1
+            exhaustive = self.exploring and (
+                self._runs.get(context, 0) < self.min_trials or calls % self.explore_every == 0
+            )
+            order = []
+            for group in ([n for n in names if n not in EXTRA_STRATEGIES],
+                          [n for n in names if n in EXTRA_STRATEGIES]):
+                learned, unlearned = [], []
+                for index, name in enumerate(group):
+                    attempts, successes, seconds, reached, rescued = self._stats.get(
+                        (context, name), (0, 0, 0.0, 0, 0))
+                    if attempts < self.min_trials:
+                        unlearned.append(name)
+                        continue
+                    if reached >= self.min_trials and rescued / reached < self.skip_rate and not exhaustive:
+                        continue
+                    # Chiến lược chưa từng thành công xếp cuối nhóm đã học
+                    rate = successes / attempts
+                    cost = seconds / attempts / rate if rate else float('inf')
+                    learned.append((cost, index, name))
+                order += [name for _, _, name in sorted(learned)] + unlearned
+        return order, exhaustive
+
+    def explore_later(self, context: str, outcomes: List[Tuple[str, bool, float]],
+                      prepare: Callable[[], Callable[[], List[Tuple[str, bool, float]]]], cost: int) -> bool:
+        """Chạy nốt lượt chạy hết danh sách ở thread nền rồi ghi cả lượt.
+
+        ``prepare`` chạy ngay trong thread gọi (ví dụ copy ảnh) và trả về hàm
+        chạy các chiến lược còn lại. Chỉ một lượt nền tại một thời điểm, và phải
+        giữ được ``cost`` byte ngân sách giải mã ngay; nếu không thì bỏ lượt này
+        (không ghi gì).
+        """
+        with self._lock:
+            if self._exploring_future is not None and not self._exploring_future.done():
+                return False
+            if not decode_admission.budget.acquire(cost, timeout=0):
+                return False
+            try:
+                rest = prepare()
+            except Exception:
+                decode_admission.budget.release(cost)
+                raise
+            if self._explorer is None:
+                self._explorer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='qr-explore')
+
+            def explore():
+                try:
+                    self.record_run(context, outcomes + rest())
+                except Exception as e:
+                    logger.warning(f"QR strategy exploration failed: {e}")
+                finally:
+                    decode_admission.budget.release(cost)
+
+            self._exploring_future = self._explorer.submit(explore)
+        return True
+
+    def drain(self):
+        """Chờ lượt chạy nền đang dở (test/benchmark)."""
+        future = self._exploring_future
+        if future is not None:
+            future.result()
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """``{ngữ cảnh: {chiến lược: {attempts, success_rate, rescue_rate, mean_seconds}}}`` cho báo cáo."""
+        with self._lock:
+            items = [(key, list(stat)) for key, stat in self._stats.items()]
+        result: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for (context, name), (attempts, successes, seconds, reached, rescued) in items:
+            result.setdefault(context, {})[name] = {
+                'attempts': attempts,
+                'success_rate': successes / attempts,
+                'rescue_rate': rescued / reached if reached else 0.0,
+                'mean_seconds': seconds / attempts,
+            }
+        return result
+
+    def reset(self):
+        self.drain()
+        with self._lock:
+            self._stats.clear()
+            self._calls.clear()
+            self._runs.clear()
+
+
+# Dùng chung trong process: mọi lượt decode_qr_from_image học chung một bảng
+strategy_stats = StrategyStats()
+
+
+def _run_strategy(strategies, name: str, img, gray) -> Tuple[Optional[str], float]:
+    started = time.perf_counter()
+    with timer(f'qr_strategy.{name}'):
+        try:
+            data = strategies[name](img, gray)
+        except Exception as e:
+            logger.warning(f"QR strategy {name} failed: {e}")
+            data, result = None, 'error'
+        else:
+            result = 'success' if data else 'miss'
+    metrics.inc('qr_decode_total', labels={'strategy': name, 'result': result})
+    return data, time.perf_counter() - started
+
+
+def run_strategies(cv2, pyzbar, img, gray, source: str = 'other') -> Optional[str]:
+    """Thử các chiến lược theo thứ tự ``strategy_stats`` gợi ý, trả về QR đầu tiên đọc được.
+
+    Ngữ cảnh thống kê là ``<source>:<size_bucket>``. Ở lượt chạy hết danh sách
+    (xem ``StrategyStats``), các chiến lược sau chiến lược đọc được chạy tiếp
+    ở thread nền trên bản copy của ảnh. Thời gian từng chiến lược ghi vào
+    ``qr_strategy.<tên>``, kết quả vào ``qr_decode_total{strategy, result}``.
+    """
+    context = f"{source}:{size_bucket(gray)}"
+    strategies = dict(decode_strategies(cv2, pyzbar))
+    order, exhaustive = strategy_stats.plan(context, list(strategies))
+    outcomes = []
+    for position, name in enumerate(order):
+        data, seconds = _run_strategy(strategies, name, img, gray)
+        outcomes.append((name, bool(data), seconds))
+        if data:
+            rest = order[position + 1:]
+            if exhaustive and rest:
+                def prepare():
+                    # Ảnh có thể là view vào bộ nhớ sắp được giải phóng: thread nền dùng bản copy
+                    img_copy = img.copy()
+                    gray_copy = img_copy if gray is img else gray.copy()
+                    return lambda: [(n, bool(d), t) for n in rest
+                                    for d, t in [_run_strategy(strategies, n, img_copy, gray_copy)]]
+
+                cost = gray.shape[0] * gray.shape[1] * DECODE_BYTES_PER_PIXEL
+                strategy_stats.explore_later(context, outcomes, prepare, cost)
+            elif exhaustive:
+                strategy_stats.record_run(context, outcomes)
+            return data
+    if exhaustive:
+        strategy_stats.record_run(context, outcomes)
+    return None
+
+
+# Ảnh lớn hơn cỡ này được cắt thành các ô chồng nhau khi tìm nhiều QR
+MULTI_TILE_SIDE = 1024
+MULTI_TILE_OVERLAP = 0.25
+
+# (nội dung QR, (x, y, cạnh) của khung bao trong ảnh)
+Found = Tuple[str, Tuple[int, int, int]]
+
+
+def _tile_starts(length: int, side: int, step: int) -> List[int]:
+    if length <= side:
+        return [0]
+    starts = list(range(0, length - side + 1, step))
+    if starts[-1] + side < length:
+        starts.append(length - side)
+    return starts
+
+
+def tile_regions(width: int, height: int, side: int = MULTI_TILE_SIDE,
+                 overlap: float = MULTI_TILE_OVERLAP) -> List[Tuple[int, int, int, int]]:
+    """Các ô ``(x, y, w, h)`` phủ kín ảnh, ô kề nhau chồng lên ``overlap`` cạnh ô.
+
+    QR nằm trên đường cắt vẫn trọn vẹn trong ít nhất một ô nếu nhỏ hơn phần
+    chồng. Ảnh không lớn hơn ``side`` thì không cần cắt (trả về rỗng).
+    """
+    if max(width, height) <= side:
+        return []
+    step = max(1, int(side * (1 - overlap)))
+    return [
+        (x, y, min(side, width - x), min(side, height - y))
+        for y in _tile_starts(height, side, step)
+        for x in _tile_starts(width, side, step)
+    ]
+
+
+def _zbar_all(pyzbar, image, offset=(0, 0)) -> List[Found]:
+    codes = pyzbar.decode(image, symbols=[pyzbar.ZBarSymbol.QRCODE])
+    return [
+        (code.data.decode('utf-8'), (offset[0] + code.rect.left, offset[1] + code.rect.top, code.rect.height))
+        for code in codes
+    ]
+
+
+def _opencv_all(cv2, image, offset=(0, 0), scale: float = 1.0) -> List[Found]:
+    ok, decoded, points, _ = cv2.QRCodeDetector().detectAndDecodeMulti(image)
+    if not ok:
+        return []
+    found = []
+    for data, corners in zip(decoded, points):
+        if data:
+            x, y = corners.min(axis=0) * scale
+            size = (corners[:, 1].max() - corners[:, 1].min()) * scale
+            found.append((data, (offset[0] + int(x), offset[1] + int(y), int(size))))
+    return found
+
+
+def _reading_order(found: List[Found]) -> List[str]:
+    """Bỏ trùng rồi xếp theo hàng (trên xuống), trong hàng từ trái sang.
+
+    Hai mã cùng hàng nếu đỉnh lệch nhau chưa tới nửa cạnh mã.
+    """
+    boxes: Dict[str, Tuple[int, int, int]] = {}
+    for data, (x, y, size) in found:
+        seen = boxes.get(data)
+        if seen is None or (y, x) < (seen[1], seen[0]):
+            boxes[data] = (x, y, size)
+    rows: List[List[Tuple[int, str]]] = []
+    row_top = None
+    for data, (x, y, size) in sorted(boxes.items(), key=lambda item: item[1][1]):
+        if row_top is None or y - row_top > max(size, 1) / 2:
+            rows.append([])
+            row_top = y
+        rows[-1].append((x, data))
+    return [data for row in rows for _, data in sorted(row)]
+
+
+def find_all_codes(cv2, pyzbar, gray, workers: Optional[int] = None) -> List[str]:
+    """Mọi QR trong ảnh xám, không trùng, xếp theo vị trí (trên xuống, trái sang).
+
+    Ảnh lớn hơn ``MULTI_TILE_SIDE`` được quét theo từng ô (``tile_regions``)
+    song song trên ``workers`` thread, vì cả zbar lẫn OpenCV nhả GIL khi chạy.
+    Cả ảnh còn được quét một lượt (pyzbar ở độ phân giải gốc,
+    ``detectAndDecodeMulti`` trên bản thu nhỏ vì rất chậm khi ảnh có nhiều
+    mã) để bắt các QR lớn nằm vắt qua ranh giới ô.
+    """
+    height, width = gray.shape[:2]
+    regions = tile_regions(width, height, MULTI_TILE_SIDE)
+
+    found: List[Found] = []
+    if pyzbar is not None:
+        found += _zbar_all(pyzbar, gray)
+    if regions:
+        scale = max(width, height) / MULTI_TILE_SIDE
+        overview = cv2.resize(gray, (round(width / scale), round(height / scale)), interpolation=cv2.INTER_AREA)
+        found += _opencv_all(cv2, overview, scale=scale)
+    else:
+        found += _opencv_all(cv2, gray)
+
+    def scan(region):
+        x, y, w, h = region
+        if pyzbar is not None:
+            return _zbar_all(pyzbar, gray[y:y + h, x:x + w], (x, y))
+        return _opencv_all(cv2, gray[y:y + h, x:x + w], (x, y))
+
+    if regions:
+        workers = workers or min(len(regions), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='qr-tile') as executor:
+            for tile_found in executor.map(scan, regions):
+                found += tile_found
+
+    return _reading_order(found)
+
+
+@instrument_methods('qr')
+class QRDecodeTools:
+    """Đọc QR từ ảnh. OpenCV/numpy/pyzbar chỉ được import khi giải mã lần đầu."""
+
+    def decode_qr_from_image(self, image_data: ImageSource, source: str = 'other') -> str:
+        """Đọc QR code từ ảnh (bytes-like hoặc file object, xem ``image_buffer``).
+
+        ``np.frombuffer`` đọc thẳng buffer gốc, không copy. Ảnh phải qua
+        ``decode_admission`` (giới hạn pixel, thu nhỏ khi giải mã, ngân sách bộ
+        nhớ) trước khi ``cv2.imdecode``. Ước lượng bộ nhớ đỉnh (buffer nén + ảnh
+        màu + ảnh xám) ghi vào ``memory.qr_decode_peak``.
+
+        ``source`` (``photo``/``document``/``url``/...) cùng cỡ ảnh là ngữ cảnh để
+        ``strategy_stats`` chọn thứ tự thử các chiến lược.
+        """
+        cv2, np, pyzbar = load_backends()
+
+        try:
+            buffer = image_buffer(image_data)
+            with decode_admission.admit(buffer) as plan:
+                # Convert bytes to numpy array
+                nparr = np.frombuffer(buffer, np.uint8)
+
+                # Decode image
+                img = cv2.imdecode(nparr, plan.imread_flag(cv2))
+                if img is None:
+                    raise Exception("Không thể đọc ảnh")
+                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                metrics.observe_bytes('memory.qr_decode_peak', nparr.nbytes + img.nbytes + gray.nbytes)
+
+                data = run_strategies(cv2, pyzbar, img, gray, source)
+                if data:
+                    return data
+
+            raise Exception("Không tìm thấy QR code trong ảnh")
+            
+        except Exception as e:
+            raise Exception(f"Lỗi đọc QR từ ảnh: {e}")
+
+    def decode_all_qr_from_image(self, image_data: ImageSource) -> List[str]:
+        """Đọc mọi QR trong một ảnh (tờ voucher, bản scan nhiều mã), xem ``find_all_codes``.
+
+        Ảnh cũng phải qua ``decode_admission`` như ``decode_qr_from_image``.
+        Trả về danh sách rỗng nếu không có QR nào.
+        """
+        cv2, np, pyzbar = load_backends()
+
+        try:
+            buffer = image_buffer(image_data)
+            with decode_admission.admit(buffer) as plan:
+                img = cv2.imdecode(np.frombuffer(buffer, np.uint8), plan.imread_flag(cv2))
+                if img is None:
+                    raise Exception("Không thể đọc ảnh")
+                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                del img
+                codes = find_all_codes(cv2, pyzbar, gray)
+        except Exception as e:
+            raise Exception(f"Lỗi đọc QR từ ảnh: {e}")
+
+        metrics.inc('qr_multi_codes_total', len(codes))
+        return codes
+
+    def analyze_qr_image(self, image_data: ImageSource, source: str = 'other') -> Dict:
+        """Phân tích QR code từ ảnh và trả về thông tin chi tiết"""
+        try:
+            # Đọc QR data từ ảnh
+            qr_data = self.decode_qr_from_image(image_data, source)
+            
+            # Phân tích QR data
+            analysis = self.create_detailed_qr_info(qr_data)
+            
+            # Thêm thông tin về việc đọc từ ảnh
+            analysis['source'] = 'image'
+            analysis['qr_detected'] = True
+            
+            return analysis
+            
+        except Exception as e:
+            return {
+                'source': 'image',
+                'qr_detected': False,
+                'error': str(e),
+                'sm_dp_address': '',
+                'activation_code': '',
+                'format_type': 'error'
+            }
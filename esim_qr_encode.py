@@ -0,0 +1,103 @@
+from io import BytesIO
+from typing import Tuple
+
+from esim_metrics import instrument_methods
+
+
+@instrument_methods('qr')
+class QREncodeTools:
+    """Tạo ảnh QR dạng PNG.
+
+    ``qrcode`` (kéo theo Pillow) chỉ được import ở lần tạo QR đầu tiên.
+    """
+
+    def create_qr_from_sm_dp(self, sm_dp_address: str, activation_code: str = None) -> Tuple[BytesIO, str]:
+        """Tạo QR code từ SM-DP+ address và activation code"""
+        import qrcode
+
+        try:
+            # Tạo LPA string
+            if activation_code and activation_code.strip():
+                lpa_string = f"LPA:1${sm_dp_address}${activation_code}"
+            else:
+                lpa_string = f"LPA:1${sm_dp_address}$"
+            
+            # Tạo QR code
+            qr = qrcode.QRCode(
+                version=1,
+                error_correction=qrcode.constants.ERROR_CORRECT_L,
+                box_size=10,
+                border=4,
+            )
+            qr.add_data(lpa_string)
+            qr.make(fit=True)
+            
+            # Tạo hình ảnh
+            img = qr.make_image(fill_color="black", back_color="white")
+            
+            # Convert to BytesIO
+            bio = BytesIO()
+            img.save(bio, format='PNG')
+            bio.seek(0)
+            
+            return bio, lpa_string
+        except Exception as e:
+            raise Exception(f"Lỗi tạo QR code: {e}")
+
+    def create_qr_from_lpa(self, lpa_string: str) -> Tuple[BytesIO, str]:
+        """Tạo QR code trực tiếp từ LPA string"""
+        import qrcode
+
+        try:
+            # Validate LPA string
+            is_valid, message = self.validate_lpa_string(lpa_string)
+            if not is_valid:
+                raise ValueError(message)
+
+            # Create QR code
+            qr = qrcode.QRCode(
+                version=1,
+                error_correction=qrcode.constants.ERROR_CORRECT_L,
+                box_size=10,
+                border=4,
+            )
+            qr.add_data(lpa_string)
+            qr.make(fit=True)
+
+            # Create image
+            img = qr.make_image(fill_color="black", back_color="white")
+
+            # Convert to BytesIO
+            bio = BytesIO()
+            img.save(bio, format='PNG')
+            bio.seek(0)
+
+            return bio, lpa_string
+        except Exception as e:
+            raise Exception(f"Lỗi tạo QR từ LPA string: {e}")
+
+    def generate_qr_with_logo(self, esim_data: str, logo_text: str = "eSIM") -> BytesIO:
+        """Tạo QR code với logo text"""
+        import qrcode
+
+        try:
+            qr = qrcode.QRCode(
+                version=1,
+                error_correction=qrcode.constants.ERROR_CORRECT_L,
+                box_size=10,
+                border=4,
+            )
+            qr.add_data(esim_data)
+            qr.make(fit=True)
+            
+            # Tạo QR image
+            img = qr.make_image(fill_color="black", back_color="white")
+            
+            # Convert to BytesIO
+            bio = BytesIO()
+            img.save(bio, format='PNG')
+            bio.seek(0)
+            
+            return bio
+        except Exception as e:
+            raise Exception(f"Lỗi tạo QR với logo: {e}")
@@ -2,16 +2,41 @@ import json
 import os
 import sqlite3
 import datetime
+import threading
+import time
 import uuid
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Iterator, Optional, Tuple, Union
 from dataclasses import dataclass, asdict
 import logging
 
+from esim_metrics import instrument_methods
+from esim_migrations import SCHEMA_VERSION, migrate
+
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Số dòng lấy mỗi lần khi đọc dạng stream (fetchmany)
+STREAM_BATCH_SIZE = 500
+
+# Thời gian chờ khóa ghi khi nhiều worker cùng ghi vào một database
+BUSY_TIMEOUT_SECONDS = 30
+
+# backup_to: số lần thử khi database bị khóa và thời gian chờ giữa hai lần
+BACKUP_ATTEMPTS = 3
+BACKUP_RETRY_DELAY = 1.0
+
+# Cột của eSIMEntry theo đúng thứ tự, dùng chung cho bảng chính và bảng archive
+ENTRY_COLUMNS = (
+    'id, sm_dp_address, activation_code, description, added_date, status, '
+    'used_date, used_by, lpa_string, iccid, used_note'
+)
+
+@dataclass(slots=True)
 class eSIMEntry:
-    """Class đại diện cho một eSIM entry"""
+    """Class đại diện cho một eSIM entry.
+
+    Dùng ``__slots__`` (không có ``__dict__``) để giảm bộ nhớ khi đọc nhiều dòng.
+    Thứ tự field khớp ``ENTRY_COLUMNS`` để dựng thẳng từ tuple của SQLite.
+    """
     id: str
     sm_dp_address: str
     activation_code: str
@@ -31,58 +56,70 @@ class eSIMEntry:
     def from_dict(cls, data: Dict) -> 'eSIMEntry':
         return cls(**data)
 
+
+def entry_row_factory(cursor: sqlite3.Cursor, row: tuple) -> eSIMEntry:
+    """Row factory dùng chung: dựng eSIMEntry trực tiếp từ tuple ``ENTRY_COLUMNS``."""
+    return eSIMEntry(*row)
+
+@instrument_methods('storage')
 class eSIMStorage:
     """Class quản lý lưu trữ eSIM"""
     
-    def __init__(self, db_path: str = "esim_storage.db"):
+    def __init__(self, db_path: str = "esim_storage.db", lazy: bool = False):
         self.db_path = db_path
-        self.init_database()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        # lazy=True: chưa chạm tới file database cho tới lần dùng đầu tiên
+        if not lazy:
+            self.init_database()
+
+    def configure(self, db_path: str):
+        """Đổi đường dẫn database; schema sẽ được kiểm tra lại ở lần dùng tiếp theo."""
+        with self._init_lock:
+            self.db_path = db_path
+            self._initialized = False
+
+    def _open(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_SECONDS)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Mở kết nối SQLite tới database kho (khởi tạo schema nếu chưa).
+
+        Chờ khóa tối đa ``BUSY_TIMEOUT_SECONDS`` thay vì lỗi ``database is locked``
+        khi worker khác đang ghi.
+        """
+        if not self._initialized:
+            self.init_database()
+        return self._open()
+
+    def _connect_entries(self) -> sqlite3.Connection:
+        """Kết nối trả về eSIMEntry cho mỗi dòng (query phải SELECT ``ENTRY_COLUMNS``)."""
+        conn = self._connect()
+        conn.row_factory = entry_row_factory
+        return conn
     
     def init_database(self):
-        """Khởi tạo database"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Tạo bảng esim_entries
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS esim_entries (
-                    id TEXT PRIMARY KEY,
-                    sm_dp_address TEXT NOT NULL,
-                    activation_code TEXT,
-                    description TEXT,
-                    added_date TEXT NOT NULL,
-                    status TEXT NOT NULL DEFAULT 'available',
-                    used_date TEXT,
-                    used_by TEXT,
-                    lpa_string TEXT,
-                    iccid TEXT,
-                    used_note TEXT
-                )
-            ''')
-            
-            # Migration: thêm cột mới cho database cũ chưa có
-            cursor.execute("PRAGMA table_info(esim_entries)")
-            existing_columns = {row[1] for row in cursor.fetchall()}
-            if 'iccid' not in existing_columns:
-                cursor.execute('ALTER TABLE esim_entries ADD COLUMN iccid TEXT')
-                logger.info("Migrated esim_entries: added iccid column")
-            if 'used_note' not in existing_columns:
-                cursor.execute('ALTER TABLE esim_entries ADD COLUMN used_note TEXT')
-                logger.info("Migrated esim_entries: added used_note column")
-            
-            # Tạo index cho tìm kiếm nhanh
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_status ON esim_entries(status)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_added_date ON esim_entries(added_date)')
-            
-            conn.commit()
-            conn.close()
-            logger.info("Database initialized successfully")
-            
-        except Exception as e:
-            logger.error(f"Error initializing database: {e}")
-            raise
-    
+        """Khởi tạo database và chạy các migration còn thiếu (xem ``esim_migrations``).
+
+        Database đã ở ``SCHEMA_VERSION`` chỉ tốn một lần đọc ``PRAGMA user_version``.
+        """
+        with self._init_lock:
+            if self._initialized:
+                return
+            try:
+                conn = self._open()
+                conn.isolation_level = None
+                try:
+                    old_version, new_version = migrate(conn)
+                finally:
+                    conn.close()
+                if new_version != old_version:
+                    logger.info(f"Database schema migrated {old_version} -> {new_version}")
+            except Exception as e:
+                logger.error(f"Error initializing database: {e}")
+                raise
+            self._initialized = True
+
     def add_esim(self, sm_dp_address: str, activation_code: str = "", description: str = "", iccid: str = "") -> str:
         """Thêm eSIM mới vào kho"""
         try:
@@ -108,7 +145,7 @@ class eSIMStorage:
             )
             
             # Lưu vào database
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -163,7 +200,7 @@ class eSIMStorage:
             )
             
             # Lưu vào database
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -198,7 +235,7 @@ class eSIMStorage:
             return added_ids
 
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
             now = datetime.datetime.now().isoformat()
@@ -233,109 +270,64 @@ class eSIMStorage:
     def get_available_esims(self) -> List[eSIMEntry]:
         """Lấy danh sách eSIM còn available"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT * FROM esim_entries 
-                WHERE status = 'available' 
+            conn = self._connect_entries()
+            entries = conn.execute(f'''
+                SELECT {ENTRY_COLUMNS} FROM esim_entries
+                WHERE status = 'available' AND deleted_at IS NULL
                 ORDER BY added_date DESC
-            ''')
-            
-            rows = cursor.fetchall()
+            ''').fetchall()
             conn.close()
-            
-            # Convert to eSIMEntry objects
-            entries = []
-            for row in rows:
-                entry_dict = {
-                    'id': row[0],
-                    'sm_dp_address': row[1],
-                    'activation_code': row[2],
-                    'description': row[3],
-                    'added_date': row[4],
-                    'status': row[5],
-                    'used_date': row[6],
-                    'used_by': row[7],
-                    'lpa_string': row[8],
-                    'iccid': row[9] if len(row) > 9 else None,
-                    'used_note': row[10] if len(row) > 10 else None
-                }
-                entries.append(eSIMEntry.from_dict(entry_dict))
-            
+
             return entries
-            
+
         except Exception as e:
             logger.error(f"Error getting available eSIMs: {e}")
             return []
     
-    def get_used_esims(self) -> List[eSIMEntry]:
-        """Lấy danh sách eSIM đã sử dụng"""
+    def get_used_esims(self, limit: Optional[int] = None) -> List[eSIMEntry]:
+        """Lấy danh sách eSIM đã sử dụng (gồm cả archive), mới dùng trước"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT * FROM esim_entries 
-                WHERE status = 'used' 
+            conn = self._connect_entries()
+            query = f'''
+                SELECT {ENTRY_COLUMNS} FROM esim_entries
+                WHERE status = 'used' AND deleted_at IS NULL
+                UNION ALL
+                SELECT {ENTRY_COLUMNS} FROM esim_entries_archive
+                WHERE deleted_at IS NULL
                 ORDER BY used_date DESC
-            ''')
-            
-            rows = cursor.fetchall()
+            '''
+            params = ()
+            if limit is not None:
+                query += ' LIMIT ?'
+                params = (limit,)
+
+            entries = conn.execute(query, params).fetchall()
             conn.close()
-            
-            # Convert to eSIMEntry objects
-            entries = []
-            for row in rows:
-                entry_dict = {
-                    'id': row[0],
-                    'sm_dp_address': row[1],
-                    'activation_code': row[2],
-                    'description': row[3],
-                    'added_date': row[4],
-                    'status': row[5],
-                    'used_date': row[6],
-                    'used_by': row[7],
-                    'lpa_string': row[8],
-                    'iccid': row[9] if len(row) > 9 else None,
-                    'used_note': row[10] if len(row) > 10 else None
-                }
-                entries.append(eSIMEntry.from_dict(entry_dict))
-            
+
             return entries
-            
+
         except Exception as e:
             logger.error(f"Error getting used eSIMs: {e}")
             return []
     
     def get_esim_by_id(self, esim_id: str) -> Optional[eSIMEntry]:
-        """Lấy eSIM theo ID"""
+        """Lấy eSIM theo ID (tìm cả trong archive)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT * FROM esim_entries WHERE id = ?', (esim_id,))
-            row = cursor.fetchone()
+            conn = self._connect_entries()
+            entry = conn.execute(
+                f'SELECT {ENTRY_COLUMNS} FROM esim_entries WHERE id = ? AND deleted_at IS NULL',
+                (esim_id,)
+            ).fetchone()
+            if entry is None:
+                entry = conn.execute(
+                    f'SELECT {ENTRY_COLUMNS} FROM esim_entries_archive '
+                    'WHERE id = ? AND deleted_at IS NULL',
+                    (esim_id,)
+                ).fetchone()
             conn.close()
-            
-            if row:
-                entry_dict = {
-                    'id': row[0],
-                    'sm_dp_address': row[1],
-                    'activation_code': row[2],
-                    'description': row[3],
-                    'added_date': row[4],
-                    'status': row[5],
-                    'used_date': row[6],
-                    'used_by': row[7],
-                    'lpa_string': row[8],
-                    'iccid': row[9] if len(row) > 9 else None,
-                    'used_note': row[10] if len(row) > 10 else None
-                }
-                return eSIMEntry.from_dict(entry_dict)
-            
-            return None
-            
+
+            return entry
+
         except Exception as e:
             logger.error(f"Error getting eSIM by ID: {e}")
             return None
@@ -343,13 +335,13 @@ class eSIMStorage:
     def mark_esim_used(self, esim_id: str, used_by: str, used_note: str = "") -> bool:
         """Đánh dấu eSIM là đã sử dụng, kèm ghi chú (cài cho ai)."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
             
             cursor.execute('''
                 UPDATE esim_entries 
                 SET status = 'used', used_date = ?, used_by = ?, used_note = ?
-                WHERE id = ? AND status = 'available'
+                WHERE id = ? AND status = 'available' AND deleted_at IS NULL
             ''', (datetime.datetime.now().isoformat(), used_by, used_note, esim_id))
             
             rows_affected = cursor.rowcount
@@ -367,14 +359,25 @@ class eSIMStorage:
             logger.error(f"Error marking eSIM as used: {e}")
             return False
     
-    def delete_esim(self, esim_id: str) -> bool:
-        """Xóa eSIM khỏi kho"""
+    @staticmethod
+    def new_tombstone() -> str:
+        """Tạo mốc ``deleted_at`` cho một lần xóa; dùng lại mốc này để hoàn tác."""
+        return datetime.datetime.now().isoformat()
+
+    def delete_esim(self, esim_id: str, deleted_at: Optional[str] = None) -> bool:
+        """Xóa mềm eSIM khỏi kho (đặt ``deleted_at``, có thể hoàn tác)"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
             
-            cursor.execute('DELETE FROM esim_entries WHERE id = ?', (esim_id,))
-            rows_affected = cursor.rowcount
+            tombstone = deleted_at or self.new_tombstone()
+            rows_affected = 0
+            for table in ('esim_entries', 'esim_entries_archive'):
+                cursor.execute(
+                    f'UPDATE {table} SET deleted_at = ? WHERE id = ? AND deleted_at IS NULL',
+                    (tombstone, esim_id)
+                )
+                rows_affected += cursor.rowcount
             conn.commit()
             conn.close()
             
@@ -390,46 +393,40 @@ class eSIMStorage:
             return False
     
     def get_all_esims(self) -> List[eSIMEntry]:
-        """Lấy toàn bộ eSIM (cả còn trống và đã dùng), mới nhất trước."""
+        """Lấy toàn bộ eSIM (cả còn trống, đã dùng và archive), mới nhất trước."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('SELECT * FROM esim_entries ORDER BY added_date DESC')
-            rows = cursor.fetchall()
+            conn = self._connect_entries()
+            entries = conn.execute(f'''
+                SELECT {ENTRY_COLUMNS} FROM esim_entries WHERE deleted_at IS NULL
+                UNION ALL
+                SELECT {ENTRY_COLUMNS} FROM esim_entries_archive WHERE deleted_at IS NULL
+                ORDER BY added_date DESC
+            ''').fetchall()
             conn.close()
 
-            entries = []
-            for row in rows:
-                entry_dict = {
-                    'id': row[0],
-                    'sm_dp_address': row[1],
-                    'activation_code': row[2],
-                    'description': row[3],
-                    'added_date': row[4],
-                    'status': row[5],
-                    'used_date': row[6],
-                    'used_by': row[7],
-                    'lpa_string': row[8],
-                    'iccid': row[9] if len(row) > 9 else None,
-                    'used_note': row[10] if len(row) > 10 else None
-                }
-                entries.append(eSIMEntry.from_dict(entry_dict))
-
             return entries
 
         except Exception as e:
             logger.error(f"Error getting all eSIMs: {e}")
             return []
 
-    def delete_used_esims(self) -> int:
-        """Xóa toàn bộ eSIM đã dùng. Trả về số bản ghi đã xóa."""
+    def delete_used_esims(self, deleted_at: Optional[str] = None) -> int:
+        """Xóa mềm toàn bộ eSIM đã dùng. Trả về số bản ghi đã xóa."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
-            cursor.execute("DELETE FROM esim_entries WHERE status = 'used'")
+            tombstone = deleted_at or self.new_tombstone()
+            cursor.execute(
+                "UPDATE esim_entries SET deleted_at = ? WHERE status = 'used' AND deleted_at IS NULL",
+                (tombstone,)
+            )
             rows_affected = cursor.rowcount
+            cursor.execute(
+                "UPDATE esim_entries_archive SET deleted_at = ? WHERE deleted_at IS NULL",
+                (tombstone,)
+            )
+            rows_affected += cursor.rowcount
             conn.commit()
             conn.close()
 
@@ -440,14 +437,20 @@ class eSIMStorage:
             logger.error(f"Error deleting used eSIMs: {e}")
             return 0
 
-    def delete_all_esims(self) -> int:
-        """Xóa toàn bộ eSIM trong kho. Trả về số bản ghi đã xóa."""
+    def delete_all_esims(self, deleted_at: Optional[str] = None) -> int:
+        """Xóa mềm toàn bộ eSIM trong kho. Trả về số bản ghi đã xóa."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
-            cursor.execute("DELETE FROM esim_entries")
-            rows_affected = cursor.rowcount
+            tombstone = deleted_at or self.new_tombstone()
+            rows_affected = 0
+            for table in ('esim_entries', 'esim_entries_archive'):
+                cursor.execute(
+                    f"UPDATE {table} SET deleted_at = ? WHERE deleted_at IS NULL",
+                    (tombstone,)
+                )
+                rows_affected += cursor.rowcount
             conn.commit()
             conn.close()
 
@@ -458,19 +461,270 @@ class eSIMStorage:
             logger.error(f"Error deleting all eSIMs: {e}")
             return 0
 
+    def backup_to(
+        self,
+        dest_path: str,
+        attempts: int = BACKUP_ATTEMPTS,
+        retry_delay: float = BACKUP_RETRY_DELAY,
+    ) -> None:
+        """Sao chép database sang ``dest_path`` bằng SQLite online backup API.
+
+        Copy toàn bộ trong một bước (``pages=-1``), tức là trong một read
+        transaction: kho chạy WAL nên bot vẫn ghi được trong lúc backup, và bản
+        copy là snapshot tại lúc bắt đầu. Copy từng nhóm trang thì mỗi lần ghi
+        xen giữa các bước làm backup chạy lại từ đầu, có thể không bao giờ xong
+        khi kho bận. Lỗi khóa được thử lại tối đa ``attempts`` lần.
+        """
+        for attempt in range(1, attempts + 1):
+            src = self._connect()
+            dst = sqlite3.connect(dest_path)
+            try:
+                src.backup(dst, pages=-1)
+                return
+            except sqlite3.OperationalError as e:
+                if attempt >= attempts:
+                    raise
+                logger.warning(f"Backup attempt {attempt}/{attempts} failed, retrying: {e}")
+            finally:
+                dst.close()
+                src.close()
+            time.sleep(retry_delay)
+
+    @staticmethod
+    def _date_bound(value: Union[str, datetime.date, None], end: bool = False) -> Optional[str]:
+        """Chuẩn hóa mốc ngày lọc thành chuỗi ISO để so sánh với cột ngày.
+
+        Mốc ``end`` là inclusive: ``2024-05-31`` được đổi thành ``2024-06-01``
+        để dùng với ``<`` mà vẫn lấy đủ cả ngày cuối.
+        """
+        if value is None or value == "":
+            return None
+        if isinstance(value, datetime.datetime):
+            return value.isoformat()
+        if isinstance(value, str):
+            value = datetime.date.fromisoformat(value.strip()[:10])
+        if end:
+            value = value + datetime.timedelta(days=1)
+        return value.isoformat()
+
+    def iter_esims(
+        self,
+        status: Optional[str] = None,
+        date_from: Union[str, datetime.date, None] = None,
+        date_to: Union[str, datetime.date, None] = None,
+        sm_dp_address: Optional[str] = None,
+        batch_size: int = STREAM_BATCH_SIZE,
+    ) -> Iterator[eSIMEntry]:
+        """Duyệt eSIM theo bộ lọc, đọc từng lô bằng ``fetchmany``.
+
+        Bộ nhớ không phụ thuộc kích thước bảng nên dùng được cho export lớn.
+        Khoảng ngày áp lên ``used_date`` khi ``status='used'``, còn lại áp lên
+        ``added_date``. ``date_to`` tính cả ngày cuối.
+        """
+        if status not in (None, 'available', 'used'):
+            raise ValueError(f"Trạng thái không hợp lệ: {status}")
+
+        date_column = 'used_date' if status == 'used' else 'added_date'
+        clauses = ['deleted_at IS NULL']
+        params: List[str] = []
+
+        if status:
+            clauses.append('status = ?')
+            params.append(status)
+        if sm_dp_address:
+            clauses.append('sm_dp_address = ?')
+            params.append(sm_dp_address.strip())
+
+        start = self._date_bound(date_from)
+        end = self._date_bound(date_to, end=True)
+        if start:
+            clauses.append(f'{date_column} >= ?')
+            params.append(start)
+        if end:
+            clauses.append(f'{date_column} < ?')
+            params.append(end)
+
+        where = ' AND '.join(clauses)
+        query = f'SELECT {ENTRY_COLUMNS} FROM esim_entries WHERE {where}'
+        if status != 'available':
+            # Bảng archive chỉ chứa eSIM đã dùng
+            query += f' UNION ALL SELECT {ENTRY_COLUMNS} FROM esim_entries_archive WHERE {where}'
+            params = params * 2
+        query += f' ORDER BY {date_column}'
+
+        conn = self._connect_entries()
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                entries = cursor.fetchmany(batch_size)
+                if not entries:
+                    break
+                yield from entries
+        finally:
+            conn.close()
+
+    def archive_used_esims(self, older_than: datetime.timedelta, batch_size: int = 500) -> int:
+        """Chuyển eSIM đã dùng lâu hơn ``older_than`` sang ``esim_entries_archive``.
+
+        Mỗi lô chuyển và xóa trong cùng một transaction ngắn, nên bảng chính
+        (dùng để cấp phát) luôn nhỏ dù lịch sử kéo dài nhiều năm.
+        """
+        cutoff = (datetime.datetime.now() - older_than).isoformat()
+        total = 0
+
+        conn = self._connect()
+        try:
+            while True:
+                ids = [row[0] for row in conn.execute('''
+                    SELECT id FROM esim_entries
+                    WHERE status = 'used' AND deleted_at IS NULL AND used_date < ?
+                    LIMIT ?
+                ''', (cutoff, batch_size))]
+                if not ids:
+                    break
+
+                placeholders = ','.join('?' * len(ids))
+                archived_at = datetime.datetime.now().isoformat()
+                with conn:
+                    conn.execute(f'''
+                        INSERT OR REPLACE INTO esim_entries_archive ({ENTRY_COLUMNS}, archived_at)
+                        SELECT {ENTRY_COLUMNS}, ? FROM esim_entries WHERE id IN ({placeholders})
+                    ''', [archived_at, *ids])
+                    conn.execute(f'DELETE FROM esim_entries WHERE id IN ({placeholders})', ids)
+                total += len(ids)
+                if len(ids) < batch_size:
+                    break
+        finally:
+            conn.close()
+
+        if total:
+            logger.info(f"Archived {total} used eSIMs older than {cutoff}")
+        return total
+
+    def search_esims(self, term: str, limit: int = 20) -> List[eSIMEntry]:
+        """Tìm eSIM (cả bảng chính và archive) theo ID, ICCID, mã kích hoạt, mô tả, ghi chú."""
+        term = (term or '').strip()
+        if not term:
+            return []
+
+        pattern = f"%{term}%"
+        condition = '''
+            deleted_at IS NULL AND (
+                id = ? OR iccid LIKE ? OR activation_code LIKE ?
+                OR description LIKE ? OR used_note LIKE ?
+            )
+        '''
+        params = [term, pattern, pattern, pattern, pattern]
+        try:
+            conn = self._connect_entries()
+            entries = conn.execute(f'''
+                SELECT {ENTRY_COLUMNS} FROM esim_entries WHERE {condition}
+                UNION ALL
+                SELECT {ENTRY_COLUMNS} FROM esim_entries_archive WHERE {condition}
+                ORDER BY added_date DESC
+                LIMIT ?
+            ''', [*params, *params, limit]).fetchall()
+            conn.close()
+
+            return entries
+
+        except Exception as e:
+            logger.error(f"Error searching eSIMs: {e}")
+            return []
+
+    def restore_deleted(self, deleted_at: str) -> int:
+        """Hoàn tác một lần xóa theo mốc ``deleted_at``. Trả về số bản ghi khôi phục."""
+        try:
+            conn = self._connect()
+            rows_affected = 0
+            for table in ('esim_entries', 'esim_entries_archive'):
+                cursor = conn.execute(
+                    f'UPDATE {table} SET deleted_at = NULL WHERE deleted_at = ?',
+                    (deleted_at,)
+                )
+                rows_affected += cursor.rowcount
+            conn.commit()
+            conn.close()
+
+            logger.info(f"Restored {rows_affected} eSIMs deleted at {deleted_at}")
+            return rows_affected
+
+        except Exception as e:
+            logger.error(f"Error restoring deleted eSIMs: {e}")
+            return 0
+
+    def purge_deleted(self, older_than: datetime.timedelta, batch_size: int = 500) -> int:
+        """Xóa hẳn các tombstone cũ hơn ``older_than`` theo từng lô nhỏ.
+
+        Mỗi lô là một transaction ngắn để không giữ write lock lâu.
+        """
+        cutoff = (datetime.datetime.now() - older_than).isoformat()
+        total = 0
+
+        conn = self._connect()
+        try:
+            for table in ('esim_entries', 'esim_entries_archive'):
+                while True:
+                    cursor = conn.execute(f'''
+                        DELETE FROM {table} WHERE rowid IN (
+                            SELECT rowid FROM {table}
+                            WHERE deleted_at IS NOT NULL AND deleted_at < ?
+                            LIMIT ?
+                        )
+                    ''', (cutoff, batch_size))
+                    conn.commit()
+                    total += cursor.rowcount
+                    if cursor.rowcount < batch_size:
+                        break
+        finally:
+            conn.close()
+
+        if total:
+            logger.info(f"Purged {total} tombstoned eSIMs")
+        return total
+
+    def reclaim_space(self, max_pages: int = 1000) -> str:
+        """Trả dung lượng trống về cho hệ điều hành.
+
+        Database đã bật ``auto_vacuum=INCREMENTAL`` chỉ cần ``incremental_vacuum``
+        từng phần. Database cũ được chuyển mode bằng một lần ``VACUUM`` đầy đủ.
+        Trả về ``'incremental'`` hoặc ``'full'``.
+        """
+        conn = self._connect()
+        try:
+            mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+            if mode == 2:
+                conn.execute(f'PRAGMA incremental_vacuum({int(max_pages)})').fetchall()
+                return 'incremental'
+
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+            logger.info("Converted database to incremental auto_vacuum")
+            return 'full'
+        finally:
+            conn.close()
+
     def get_storage_stats(self) -> Dict[str, int]:
         """Lấy thống kê kho eSIM"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
             
             # Đếm available
-            cursor.execute('SELECT COUNT(*) FROM esim_entries WHERE status = "available"')
+            cursor.execute(
+                'SELECT COUNT(*) FROM esim_entries WHERE status = "available" AND deleted_at IS NULL'
+            )
             available_count = cursor.fetchone()[0]
             
             # Đếm used
-            cursor.execute('SELECT COUNT(*) FROM esim_entries WHERE status = "used"')
+            cursor.execute(
+                'SELECT COUNT(*) FROM esim_entries WHERE status = "used" AND deleted_at IS NULL'
+            )
             used_count = cursor.fetchone()[0]
+
+            # Đếm used đã archive
+            cursor.execute('SELECT COUNT(*) FROM esim_entries_archive WHERE deleted_at IS NULL')
+            used_count += cursor.fetchone()[0]
             
             # Tổng
             total_count = available_count + used_count
@@ -487,5 +741,17 @@ class eSIMStorage:
             logger.error(f"Error getting storage stats: {e}")
             return {'total': 0, 'available': 0, 'used': 0}
 
-# Khởi tạo storage instance
-esim_storage = eSIMStorage()
+# Storage dùng chung của bot. Không tạo/migrate database lúc import: đường dẫn
+# được đặt qua configure_storage() khi khởi động, schema chạy ở lần dùng đầu.
+esim_storage = eSIMStorage(lazy=True)
+
+
+def configure_storage(db_path: str) -> eSIMStorage:
+    """Bootstrap khi khởi động: trỏ ``esim_storage`` tới ``db_path`` và migrate ngay.
+
+    Lỗi database (sai quyền, file hỏng...) lộ ra lúc khởi động thay vì ở update đầu tiên.
+    """
+    esim_storage.configure(db_path)
+    esim_storage.init_database()
+    return esim_storage
+
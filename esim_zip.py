@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import posixpath
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Tuple
+
+from esim_decode_pool import decode_pool
+from esim_image_guard import BufferReader
+from esim_qr_decode import ImageSource, image_buffer
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif')
+MAX_MEMBERS = 500
+MAX_MEMBER_BYTES = 10 * 1024 * 1024
+
+
+@dataclass
+class ArchiveFile:
+    """Kết quả cho một file trong ZIP: ``ok``, ``duplicate``, ``error`` hoặc ``skipped``."""
+    name: str
+    status: str
+    codes: List[str] = field(default_factory=list)
+    reason: str = ''
+
+
+@dataclass
+class ArchiveReport:
+    files: List[ArchiveFile] = field(default_factory=list)
+
+    @property
+    def codes(self) -> List[str]:
+        """Nội dung QR của mọi file đọc được, theo thứ tự tên file."""
+        return [code for f in self.files if f.status == 'ok' for code in f.codes]
+
+    def count(self, status: str) -> int:
+        return sum(1 for f in self.files if f.status == status)
+
+
+def iter_image_members(archive: zipfile.ZipFile, report: ArchiveReport, max_members: int = MAX_MEMBERS,
+                       max_member_bytes: int = MAX_MEMBER_BYTES) -> Iterator[Tuple[str, bytes]]:
+    """Đọc lần lượt từng ảnh trong ZIP vào RAM (không giải nén ra đĩa).
+
+    File không phải ảnh, vượt ``max_member_bytes`` hoặc vượt quá ``max_members``
+    ảnh được ghi vào ``report`` với trạng thái ``skipped``. Kích thước khai báo
+    trong ZIP không đáng tin (zip bomb) nên lúc giải nén cũng chỉ đọc tối đa
+    ``max_member_bytes + 1`` byte.
+    """
+    taken = 0
+    for info in archive.infolist():
+        name = info.filename
+        basename = posixpath.basename(name)
+        if info.is_dir() or name.startswith('__MACOSX/') or basename.startswith('.'):
+            continue
+        if not basename.lower().endswith(IMAGE_EXTENSIONS):
+            report.files.append(ArchiveFile(name, 'skipped', reason='Không phải ảnh'))
+            continue
+        if taken >= max_members:
+            report.files.append(ArchiveFile(name, 'skipped', reason=f'Vượt quá {max_members} ảnh mỗi ZIP'))
+            continue
+        if info.file_size > max_member_bytes:
+            report.files.append(ArchiveFile(name, 'skipped', reason='File quá lớn'))
+            continue
+        try:
+            with archive.open(info) as member:
+                data = member.read(max_member_bytes + 1)
+        except (zipfile.BadZipFile, RuntimeError, NotImplementedError, OSError) as e:
+            # RuntimeError: file có mật khẩu; NotImplementedError: kiểu nén không hỗ trợ
+            report.files.append(ArchiveFile(name, 'error', reason=f'Không giải nén được: {e}'))
+            continue
+        if len(data) > max_member_bytes:
+            report.files.append(ArchiveFile(name, 'skipped', reason='File quá lớn'))
+            continue
+        taken += 1
+        yield name, data
+
+
+def decode_member(data: bytes) -> Tuple[List[str], str]:
+    """Đọc mọi QR trong một ảnh; trả về ``(codes, lỗi)``. Chạy trong process con."""
+    from esim_tools import esim_tools
+
+    try:
+        codes = esim_tools.decode_all_qr_from_image(data)
+        if not codes:
+            # Ảnh một mã chụp kém: thử thêm các chiến lược của decode_qr_from_image
+            codes = [esim_tools.decode_qr_from_image(data, 'zip')]
+        return codes, ''
+    except Exception as e:
+        return [], str(e)
+
+
+def decode_zip_archive(source: ImageSource, workers: int = 0, max_members: int = MAX_MEMBERS,
+                       max_member_bytes: int = MAX_MEMBER_BYTES) -> ArchiveReport:
+    """Giải mã QR của mọi ảnh trong một ZIP, song song trên ``decode_pool``.
+
+    Ảnh được đọc dần từ ZIP và chỉ giữ tối đa ``2 * workers`` ảnh đang chờ giải
+    mã, nên bộ nhớ không tăng theo kích thước ZIP. Ảnh trùng nội dung (SHA-256)
+    chỉ giải mã một lần. ``workers`` giới hạn số process của pool mà một ZIP
+    dùng cùng lúc: ``0`` dùng cả pool; ``1`` giải mã ngay trong thread gọi.
+    """
+    workers = min(workers or decode_pool.size, decode_pool.size)
+    report = ArchiveReport()
+    results: Dict[str, ArchiveFile] = {}
+    first_by_digest: Dict[str, str] = {}
+
+    def unique_members(archive) -> Iterator[Tuple[str, bytes]]:
+        for name, data in iter_image_members(archive, report, max_members, max_member_bytes):
+            digest = hashlib.sha256(data).hexdigest()
+            if digest in first_by_digest:
+                report.files.append(ArchiveFile(name, 'duplicate', reason=f'Trùng nội dung {first_by_digest[digest]}'))
+                continue
+            first_by_digest[digest] = name
+            yield name, data
+
+    def record(name: str, outcome: Tuple[List[str], str]):
+        codes, error = outcome
+        results[name] = ArchiveFile(name, 'error', reason=error) if error else ArchiveFile(name, 'ok', codes)
+
+    reader = BufferReader(image_buffer(source))
+    try:
+        with zipfile.ZipFile(reader) as archive:
+            if workers == 1:
+                for name, data in unique_members(archive):
+                    record(name, decode_member(data))
+            else:
+                pool = decode_pool.executor()
+                in_flight = {}
+                try:
+                    for name, data in unique_members(archive):
+                        if len(in_flight) >= 2 * workers:
+                            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                record(in_flight.pop(future), future.result())
+                        in_flight[pool.submit(decode_member, data)] = name
+                    for future in wait(in_flight).done:
+                        record(in_flight[future], future.result())
+                finally:
+                    # ZIP lỗi giữa chừng: bỏ các ảnh chưa chạy, pool vẫn dùng tiếp
+                    for future in in_flight:
+                        future.cancel()
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"File ZIP không hợp lệ: {e}")
+    finally:
+        reader.close()
+
+    report.files.extend(results.values())
+    report.files.sort(key=lambda f: f.name)
+    logger.info(
+        f"ZIP decoded: {report.count('ok')} ok, {report.count('duplicate')} duplicate, "
+        f"{report.count('error')} error, {report.count('skipped')} skipped"
+    )
+    return report
+
+
+def format_archive_report(report: ArchiveReport) -> str:
+    """Báo cáo từng file dạng TSV (tên, trạng thái, số QR, lý do) để gửi kèm cho admin."""
+    lines = ['file\tstatus\tqr\treason']
+    for f in report.files:
+        lines.append(f"{f.name}\t{f.status}\t{len(f.codes)}\t{f.reason}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,194 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from bot_cluster import LeaderLease, SharedUpdateQueue, consume_updates, partition_key_for
+from bot_media import MediaGroupCollector
+from bot_webhook import build_fake_update
+from esim_storage import eSIMStorage
+
+
+class PartitionKeyTest(unittest.TestCase):
+    def test_message_and_callback_use_chat_id(self):
+        self.assertEqual(partition_key_for(build_fake_update("/start", user_id=5, chat_id=-100)), 100)
+        callback = {
+            "update_id": 1,
+            "callback_query": {
+                "id": "q", "from": {"id": 9}, "chat_instance": "c", "data": "x",
+                "message": {"message_id": 1, "date": 0, "chat": {"id": 77, "type": "private"}},
+            },
+        }
+        self.assertEqual(partition_key_for(callback), 77)
+
+
+class SharedUpdateQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.queue = SharedUpdateQueue(os.path.join(self.tmpdir, "queue.db"), lease_seconds=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_workers_claim_disjoint_partitions_in_order(self):
+        self.queue.enqueue_many(
+            [build_fake_update(f"m{i}", user_id=1000 + (i % 4), update_id=i) for i in range(8)]
+        )
+
+        even = self.queue.claim(0, 2, "w0")
+        odd = self.queue.claim(1, 2, "w1")
+
+        self.assertEqual([p["update_id"] for _, p in even], [0, 2, 4, 6])
+        self.assertEqual([p["update_id"] for _, p in odd], [1, 3, 5, 7])
+        self.assertEqual(self.queue.claim(0, 2, "w0"), [])
+
+    def test_unacked_updates_are_reclaimed_after_lease(self):
+        self.queue.enqueue(build_fake_update("hi", user_id=1, update_id=1))
+        first = self.queue.claim(0, 1, "w0")
+
+        with mock.patch("bot_cluster.time.time", return_value=10 ** 10):
+            again = self.queue.claim(0, 1, "w0-restarted")
+
+        self.assertEqual([row_id for row_id, _ in again], [row_id for row_id, _ in first])
+        self.assertEqual(self.queue.ack([first[0][0]]), 1)
+        self.assertEqual(self.queue.pending_count(), 0)
+
+    def test_renew_only_extends_own_claims(self):
+        self.queue.enqueue(build_fake_update("hi", user_id=1, update_id=1))
+        [(row_id, _)] = self.queue.claim(0, 1, "w0")
+
+        self.assertEqual(self.queue.renew([row_id], "w1"), 0)
+        self.assertEqual(self.queue.renew([row_id], "w0"), 1)
+
+
+class LeaderLeaseTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.storage = eSIMStorage(db_path=os.path.join(self.tmpdir, "esim.db"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_only_one_holder_until_lease_expires(self):
+        a = LeaderLease(self.storage, "compactor", holder="a", ttl_seconds=60)
+        b = LeaderLease(self.storage, "compactor", holder="b", ttl_seconds=60)
+
+        self.assertTrue(a.acquire())
+        self.assertTrue(a.acquire())
+        self.assertFalse(b.acquire())
+
+        with mock.patch("bot_cluster.time.time", return_value=10 ** 10):
+            self.assertTrue(b.acquire())
+        a.release()
+        self.assertFalse(a.acquire())
+
+    def test_concurrent_mark_used_assigns_esim_once(self):
+        esim_id = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$RACE")
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda n=n: results.append(
+                    eSIMStorage(self.storage.db_path).mark_esim_used(esim_id, f"worker-{n}")
+                )
+            )
+            for n in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(sorted(results), [False, False, False, True])
+
+
+class ConsumeUpdatesTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.queue = SharedUpdateQueue(os.path.join(self.tmpdir, "queue.db"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    async def test_processes_and_acks_own_partition(self):
+        self.queue.enqueue_many(
+            [build_fake_update(f"m{i}", user_id=10 + (i % 2), update_id=i) for i in range(6)]
+        )
+        stop_event = asyncio.Event()
+        seen = []
+
+        class FakeApplication:
+            bot = None
+
+            async def process_update(self, update):
+                seen.append(update.update_id)
+                if len(seen) == 3:
+                    stop_event.set()
+
+        processed = await consume_updates(FakeApplication(), self.queue, 0, 2, stop_event, idle_sleep=0.01)
+
+        self.assertEqual(processed, 3)
+        self.assertEqual(seen, [0, 2, 4])
+        self.assertEqual(self.queue.pending_count(), 3)
+
+    async def test_album_split_across_claims_is_collected_once(self):
+        def album_photo(update_id):
+            payload = build_fake_update("", user_id=10, update_id=update_id)
+            payload["message"]["message_id"] = update_id
+            payload["message"]["media_group_id"] = "album-1"
+            return payload
+
+        self.queue.enqueue_many([album_photo(1), album_photo(2)])
+        stop_event = asyncio.Event()
+        collector = MediaGroupCollector(window=0.3)
+        albums = []
+
+        class FakeApplication:
+            bot = None
+
+            async def process_update(self, update):
+                group = await collector.collect(update.message)
+                if group is not None:
+                    albums.append([m.message_id for m in group])
+                    stop_event.set()
+
+        async def late_photo():
+            # Ảnh cuối tới sau khi worker đã claim hai ảnh đầu
+            await asyncio.sleep(0.1)
+            await asyncio.to_thread(self.queue.enqueue, album_photo(3))
+
+        processed, _ = await asyncio.gather(
+            consume_updates(FakeApplication(), self.queue, 0, 1, stop_event, idle_sleep=0.01),
+            late_photo(),
+        )
+
+        self.assertEqual(albums, [[1, 2, 3]])
+        self.assertEqual(processed, 3)
+        self.assertEqual(self.queue.pending_count(), 0)
+
+    async def test_lease_is_renewed_while_update_is_processing(self):
+        queue = SharedUpdateQueue(os.path.join(self.tmpdir, "short-lease.db"), lease_seconds=0.3)
+        queue.enqueue(build_fake_update("slow", user_id=10, update_id=1))
+        stop_event = asyncio.Event()
+        stolen = []
+
+        class FakeApplication:
+            bot = None
+
+            async def process_update(self, update):
+                # Handler chạy lâu hơn vài lần lease: worker khác không được claim lại
+                await asyncio.sleep(1.0)
+                stolen.extend(await asyncio.to_thread(queue.claim, 0, 1, "other-worker"))
+                stop_event.set()
+
+        processed = await consume_updates(FakeApplication(), queue, 0, 1, stop_event, idle_sleep=0.01)
+
+        self.assertEqual(stolen, [])
+        self.assertEqual(processed, 1)
+        self.assertEqual(queue.pending_count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
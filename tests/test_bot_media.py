@@ -0,0 +1,369 @@
+import asyncio
+import functools
+import http.server
+import io
+import os
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from unittest.mock import AsyncMock
+
+import bot_media
+from bot_media import (BufferPool, ByteBuffer, MediaGroupCollector, SingleFlight, analyze_telegram_file,
+                       analyze_url_image, call_key, configure_url_cache, decode_photo_progressively, fetch_url_into,
+                       photo_candidates, render_qr)
+
+
+def make_file(payload):
+    return SimpleNamespace(download_to_memory=AsyncMock(side_effect=lambda out: out.write(payload)))
+
+
+def make_photo(width, height, payload=b""):
+    file = make_file(payload or b"%d" % width)
+    return SimpleNamespace(width=width, height=height, get_file=AsyncMock(return_value=file))
+
+
+def telegram_sizes():
+    # Telegram gửi các bản từ nhỏ tới lớn
+    return [make_photo(90, 68), make_photo(320, 240), make_photo(800, 600), make_photo(1280, 960),
+            make_photo(2560, 1920)]
+
+
+class PhotoCandidatesTest(unittest.TestCase):
+    def test_smallest_sufficient_then_largest(self):
+        sizes = telegram_sizes()
+
+        self.assertEqual([p.width for p in photo_candidates(sizes, 800)], [800, 2560])
+
+    def test_small_image_downloads_once(self):
+        sizes = [make_photo(90, 90), make_photo(370, 370)]
+
+        self.assertEqual([p.width for p in photo_candidates(sizes, 800)], [370])
+
+    def test_empty(self):
+        self.assertEqual(photo_candidates([], 800), [])
+
+
+class ProgressiveDecodeTest(unittest.IsolatedAsyncioTestCase):
+    async def test_stops_at_first_successful_size(self):
+        sizes = telegram_sizes()
+        seen = []
+
+        def analyze(buffer):
+            seen.append(bytes(buffer.getbuffer()))
+            return {"qr_detected": True}
+
+        analysis = await decode_photo_progressively(sizes, analyze, 800)
+
+        self.assertTrue(analysis["qr_detected"])
+        self.assertEqual(seen, [b"800"])
+        sizes[-1].get_file.assert_not_awaited()
+
+    async def test_escalates_to_largest_when_not_found(self):
+        sizes = telegram_sizes()
+        seen = []
+
+        def analyze(buffer):
+            seen.append(bytes(buffer.getbuffer()))
+            return {"qr_detected": seen[-1] == b"2560"}
+
+        analysis = await decode_photo_progressively(sizes, analyze, 800)
+
+        self.assertTrue(analysis["qr_detected"])
+        self.assertEqual(seen, [b"800", b"2560"])
+
+
+class MediaGroupCollectorTest(unittest.IsolatedAsyncioTestCase):
+    async def test_first_message_receives_whole_album(self):
+        collector = MediaGroupCollector(window=0.05)
+        album = [SimpleNamespace(media_group_id="g1", message_id=i) for i in (3, 1, 2)]
+
+        async def arrive(message, delay):
+            await asyncio.sleep(delay)
+            return await collector.collect(message)
+
+        results = await asyncio.gather(*(arrive(m, i * 0.02) for i, m in enumerate(album)))
+
+        self.assertEqual([m.message_id for m in results[0]], [1, 2, 3])
+        self.assertEqual(results[1:], [None, None])
+
+    async def test_single_message_is_not_delayed(self):
+        collector = MediaGroupCollector(window=10)
+        message = SimpleNamespace(media_group_id=None, message_id=1)
+
+        self.assertEqual(await asyncio.wait_for(collector.collect(message), 1), [message])
+
+
+class ByteBufferTest(unittest.TestCase):
+    def test_write_and_grow(self):
+        buffer = ByteBuffer(capacity=4)
+        buffer.write(b"abc")
+        view = buffer.getbuffer()
+        buffer.write(memoryview(b"defgh"))
+
+        self.assertEqual(bytes(buffer.getbuffer()), b"abcdefgh")
+        self.assertGreaterEqual(buffer.capacity, 8)
+        self.assertEqual(bytes(view), b"abc")  # view cũ vẫn đọc được sau khi buffer tăng
+
+    def test_pool_reuses_buffers(self):
+        pool = BufferPool(size=1, capacity=16, max_retained=64)
+        with pool.buffer() as first:
+            first.write(b"x" * 10)
+        with pool.buffer() as second:
+            self.assertIs(second, first)
+            self.assertEqual(len(second), 0)
+            second.write(b"x" * 100)  # phình quá max_retained: không giữ lại
+
+        self.assertEqual(pool.retained_bytes(), 0)
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_calls_share_one_run(self):
+        flight = SingleFlight("test")
+        runs = []
+
+        async def work(value):
+            runs.append(value)
+            await asyncio.sleep(0.01)
+            return value * 2
+
+        results = await asyncio.gather(
+            flight.do("a", lambda: work(1)), flight.do("a", lambda: work(1)), flight.do("b", lambda: work(5))
+        )
+
+        self.assertEqual(results, [2, 2, 10])
+        self.assertEqual(runs, [1, 5])
+        self.assertEqual(flight.in_flight(), 0)
+        # Xong rồi thì lời gọi sau chạy lại
+        self.assertEqual(await flight.do("a", lambda: work(3)), 6)
+
+    async def test_error_is_shared(self):
+        flight = SingleFlight("test")
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+
+        self.assertEqual([str(r) for r in results], ["boom", "boom"])
+
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        flight = SingleFlight("test")
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.create_task(flight.do("k", slow))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(flight.do("k", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+
+        self.assertEqual(await second, "done")
+
+    def test_partial_keys_compare_by_arguments(self):
+        def analyze(buffer, source):
+            return source
+
+        self.assertEqual(call_key(functools.partial(analyze, source="url")),
+                         call_key(functools.partial(analyze, source="url")))
+        self.assertNotEqual(call_key(functools.partial(analyze, source="url")),
+                            call_key(functools.partial(analyze, source="photo")))
+
+    async def test_forwarded_file_is_downloaded_once(self):
+        payload = b"same image"
+        calls = []
+
+        def analyze(buffer):
+            calls.append(bytes(buffer.getbuffer()))
+            return {"qr_detected": True}
+
+        files = [make_file(payload) for _ in range(3)]
+        for file in files:
+            file.file_unique_id = "AgADforwarded"
+
+        results = await asyncio.gather(*(analyze_telegram_file(file, analyze) for file in files))
+
+        self.assertEqual(results, [{"qr_detected": True}] * 3)
+        self.assertEqual(calls, [payload])
+        self.assertEqual(sum(file.download_to_memory.await_count for file in files), 1)
+
+    async def test_render_qr_gives_each_caller_own_stream(self):
+        renders = []
+
+        def create(lpa):
+            renders.append(lpa)
+            return io.BytesIO(b"png of " + lpa.encode()), lpa
+
+        (first, lpa), (second, _) = await asyncio.gather(
+            render_qr(create, "LPA:1$a.b$C"), render_qr(create, "LPA:1$a.b$C")
+        )
+
+        self.assertEqual(renders, ["LPA:1$a.b$C"])
+        self.assertIsNot(first, second)
+        self.assertEqual(first.read(), second.read())
+        self.assertEqual(lpa, "LPA:1$a.b$C")
+
+
+class _ImageHandler(http.server.BaseHTTPRequestHandler):
+    payload = b"\x89PNG" + b"0" * 200_000
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.payload)))
+        self.end_headers()
+        self.wfile.write(self.payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class FetchUrlTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _ImageHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/qr.png"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_streams_into_buffer(self):
+        buffer = ByteBuffer(capacity=1024)
+
+        self.assertEqual(fetch_url_into(self.url, buffer), len(_ImageHandler.payload))
+        self.assertEqual(bytes(buffer.getbuffer()), _ImageHandler.payload)
+
+    def test_rejects_oversized_body(self):
+        with self.assertRaises(ValueError):
+            fetch_url_into(self.url, ByteBuffer(), max_bytes=1000)
+
+    async def test_analyze_url_image(self):
+        analysis = await analyze_url_image(self.url, lambda buffer: {"size": len(buffer)})
+
+        self.assertEqual(analysis, {"size": len(_ImageHandler.payload)})
+
+    async def test_concurrent_url_lookups_download_once(self):
+        def analyze(buffer):
+            return {"size": len(buffer)}
+
+        _ImageHandler.requests = 0
+        results = await asyncio.gather(*(analyze_url_image(self.url, analyze) for _ in range(5)))
+
+        self.assertEqual(results, [{"size": len(_ImageHandler.payload)}] * 5)
+        self.assertEqual(_ImageHandler.requests, 1)
+
+
+class _CachedImageHandler(http.server.BaseHTTPRequestHandler):
+    """Máy chủ ảnh QR giả: trả ETag và Cache-Control theo ``cache_control``, 304 khi ETag khớp."""
+    payload = b"\x89PNG" + b"1" * 5000
+    etag = '"v1"'
+    cache_control = "max-age=0"
+    statuses = []
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == self.etag:
+            type(self).statuses.append(304)
+            self.send_response(304)
+            self.send_header("ETag", self.etag)
+            self.send_header("Cache-Control", self.cache_control)
+            self.end_headers()
+            return
+        type(self).statuses.append(200)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.payload)))
+        self.send_header("ETag", self.etag)
+        self.send_header("Cache-Control", self.cache_control)
+        self.end_headers()
+        self.wfile.write(self.payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class CachedUrlTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        _CachedImageHandler.statuses = []
+        _CachedImageHandler.etag = '"v1"'
+        _CachedImageHandler.cache_control = "max-age=0"
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _CachedImageHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/qr.png"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.previous_cache = bot_media.url_cache
+        configure_url_cache(os.path.join(self.tmp.name, "http_cache.db"), 1024 * 1024)
+        self.decodes = 0
+
+    def tearDown(self):
+        bot_media.url_cache = self.previous_cache
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def analyze(self, buffer):
+        self.decodes += 1
+        return {"size": len(buffer)}
+
+    async def lookup(self):
+        return await analyze_url_image(self.url, self.analyze, result_key="size")
+
+    async def test_stale_entry_is_revalidated(self):
+        first = await self.lookup()
+        second = await self.lookup()
+
+        self.assertEqual(first, second)
+        self.assertEqual(_CachedImageHandler.statuses, [200, 304])
+        # 304: body không đổi nên dùng lại kết quả đã giải mã
+        self.assertEqual(self.decodes, 1)
+
+    async def test_fresh_entry_skips_network(self):
+        _CachedImageHandler.cache_control = "max-age=300"
+
+        await self.lookup()
+        with mock.patch.object(bot_media.url_cache, "body") as body:
+            await self.lookup()
+
+        self.assertEqual(_CachedImageHandler.statuses, [200])
+        self.assertEqual(self.decodes, 1)
+        # Kết quả đã giải mã có sẵn: không đọc BLOB ảnh từ cache
+        body.assert_not_called()
+
+    async def test_changed_image_is_decoded_again(self):
+        await self.lookup()
+        _CachedImageHandler.etag = '"v2"'
+
+        await self.lookup()
+
+        self.assertEqual(_CachedImageHandler.statuses, [200, 200])
+        self.assertEqual(self.decodes, 2)
+
+    async def test_error_results_are_not_cached(self):
+        def analyze(buffer):
+            self.decodes += 1
+            return {"error": "busy"}
+
+        for _ in range(2):
+            await analyze_url_image(self.url, analyze, result_key="size")
+
+        self.assertEqual(_CachedImageHandler.statuses, [200, 304])
+        self.assertEqual(self.decodes, 2)
+
+    async def test_no_store_bypasses_cache(self):
+        _CachedImageHandler.cache_control = "no-store"
+
+        first = await self.lookup()
+        await self.lookup()
+
+        self.assertEqual(first, {"size": len(_CachedImageHandler.payload)})
+        self.assertEqual(_CachedImageHandler.statuses, [200, 200])
+        self.assertEqual(bot_media.url_cache.total_bytes(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import asyncio
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+from telegram import Update
+
+from bot_perf import LoopLagMonitor, MetricsServer, format_perf_report, update_kind
+from bot_webhook import build_fake_update
+from esim_metrics import MetricsRegistry, render_prometheus
+
+
+def _fetch(url, method="GET"):
+    request = urllib.request.Request(url, method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, response.headers.get("Content-Type"), response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, None, ""
+
+
+def _registry():
+    registry = MetricsRegistry(enabled=True)
+    for ms in (1, 2, 3, 40):
+        registry.observe("storage.get_available_esims", ms / 1000)
+    registry.observe("qr.generate_qr_code", 0.02)
+    registry.inc("qr_decode_total", labels={"strategy": "pyzbar_gray", "result": "success"})
+    registry.inc("qr_decode_total", labels={"strategy": "pyzbar_gray", "result": "miss"})
+    registry.inc("updates_total", 3, labels={"type": "message"})
+    registry.register_gauge("update_queue_depth", lambda: 5)
+    registry.observe_bytes("memory.qr_decode_peak", 3 * 1024 * 1024)
+    return registry
+
+
+class RenderPrometheusTest(unittest.TestCase):
+    def test_histograms_counters_and_gauges(self):
+        text = render_prometheus(_registry())
+
+        self.assertIn("# TYPE esim_storage_duration_seconds histogram", text)
+        self.assertIn('esim_storage_duration_seconds_bucket{op="get_available_esims",le="+Inf"} 4', text)
+        self.assertIn('esim_storage_duration_seconds_count{op="get_available_esims"} 4', text)
+        self.assertIn('esim_qr_decode_total{result="miss",strategy="pyzbar_gray"} 1', text)
+        self.assertIn('esim_updates_total{type="message"} 3', text)
+        self.assertIn("esim_update_queue_depth 5", text)
+        self.assertIn('esim_memory_bytes_count{op="qr_decode_peak"} 1', text)
+        self.assertNotIn("esim_memory_duration_seconds", text)
+
+    def test_buckets_are_cumulative(self):
+        text = render_prometheus(_registry())
+        counts = [
+            int(line.rsplit(" ", 1)[1])
+            for line in text.splitlines()
+            if line.startswith('esim_storage_duration_seconds_bucket{op="get_available_esims"')
+        ]
+
+        self.assertEqual(counts, sorted(counts))
+        self.assertEqual(counts[-1], 4)
+
+    def test_failing_gauge_is_skipped(self):
+        registry = MetricsRegistry(enabled=True)
+        registry.register_gauge("broken", lambda: 1 / 0)
+
+        self.assertNotIn("esim_broken", render_prometheus(registry))
+
+
+class PerfReportTest(unittest.TestCase):
+    def test_report_lists_slowest_first(self):
+        report = format_perf_report(_registry())
+
+        lines = report.splitlines()
+        self.assertTrue(lines[1].startswith("storage.get_availabl"))
+        self.assertTrue(lines[2].startswith("qr.generate_qr_code"))
+        self.assertIn("updates_total{type=\"message\"} 3", report)
+        self.assertIn("update_queue_depth 5", report)
+        self.assertIn("memory.qr_decode_pea", report.split("Bộ nhớ (KB)")[1])
+
+    def test_empty_registry(self):
+        self.assertIn("chưa có số liệu", format_perf_report(MetricsRegistry(enabled=True)))
+
+    def test_update_kind(self):
+        update = Update.de_json(build_fake_update("/start"), None)
+
+        self.assertEqual(update_kind(update), "message")
+
+
+class LoopLagMonitorTest(unittest.IsolatedAsyncioTestCase):
+    async def test_blocking_call_is_reported_as_stall(self):
+        registry = MetricsRegistry(enabled=True)
+        monitor = LoopLagMonitor(interval=0.01, stall_threshold=0.05, registry=registry, log_stalls=False)
+        monitor.start()
+        await asyncio.sleep(0.03)
+        time.sleep(0.12)  # code đồng bộ chặn loop
+        await asyncio.sleep(0.03)
+        await monitor.stop()
+
+        self.assertEqual(monitor.stalls, 1)
+        self.assertGreaterEqual(monitor.histogram.max, 0.05)
+        self.assertEqual(registry.counter_value("loop_stalls_total"), 1)
+        self.assertIn("loop.lag", registry.snapshot())
+
+
+class MetricsServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = MetricsServer(_registry(), host="127.0.0.1", port=0)
+        await self.server.start()
+        self.base_url = f"http://127.0.0.1:{self.server.bound_port}"
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    async def test_metrics_endpoint(self):
+        status, content_type, body = await asyncio.to_thread(_fetch, self.base_url + "/metrics")
+
+        self.assertEqual(status, 200)
+        self.assertTrue(content_type.startswith("text/plain; version=0.0.4"))
+        self.assertIn("esim_updates_total", body)
+
+    async def test_unknown_path_and_method(self):
+        status, _, _ = await asyncio.to_thread(_fetch, self.base_url + "/nope")
+        self.assertEqual(status, 404)
+
+        status, _, _ = await asyncio.to_thread(_fetch, self.base_url + "/metrics", "POST")
+        self.assertEqual(status, 405)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from telegram.ext import Application
+
+import bot as botmod
+from bot_handlers import setup_bot_handlers
+from bot_persistence import SQLitePersistence
+from esim_storage import eSIMStorage
+
+
+class SQLitePersistenceTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.storage = eSIMStorage(db_path=os.path.join(self.tmpdir, "esim.db"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _row_count(self):
+        conn = sqlite3.connect(self.storage.db_path)
+        count = conn.execute("SELECT COUNT(*) FROM bot_persistence").fetchone()[0]
+        conn.close()
+        return count
+
+    async def test_user_data_and_conversations_survive_restart(self):
+        persistence = SQLitePersistence(self.storage)
+        await persistence.update_user_data(1000, {"bulk_sm_dp": "rsp.esim.exchange"})
+        await persistence.update_conversation("bulk_add_esim", (1000, 1000), 17)
+        await persistence.flush()
+
+        restarted = SQLitePersistence(self.storage)
+
+        self.assertEqual(
+            await restarted.get_user_data(), {1000: {"bulk_sm_dp": "rsp.esim.exchange"}}
+        )
+        self.assertEqual(
+            await restarted.get_conversations("bulk_add_esim"), {(1000, 1000): 17}
+        )
+        self.assertEqual(await restarted.get_conversations("use_esim"), {})
+
+    async def test_batch_from_one_persistence_run_is_one_write(self):
+        persistence = SQLitePersistence(self.storage)
+
+        with mock.patch.object(persistence, "_write_batch", wraps=persistence._write_batch) as write_batch:
+            # PTB gọi các update_* của một lượt bằng asyncio.gather
+            await asyncio.gather(
+                persistence.update_user_data(1, {"use_esim_id": "abc"}),
+                persistence.update_user_data(2, {"last_lpa_string": "LPA:1$a.b$C"}),
+                persistence.update_conversation("use_esim", (1, 1), 2),
+            )
+
+        self.assertEqual(write_batch.call_count, 1)
+        self.assertEqual(self._row_count(), 3)
+
+    async def test_failed_write_is_retried_by_flush(self):
+        persistence = SQLitePersistence(self.storage)
+
+        with mock.patch.object(self.storage, "_connect", side_effect=sqlite3.OperationalError("locked")):
+            with self.assertRaises(sqlite3.OperationalError):
+                await persistence.update_user_data(1, {"x": 1})
+        await persistence.flush()
+
+        self.assertEqual(self._row_count(), 1)
+
+    async def test_ended_conversation_and_dropped_user_are_removed(self):
+        persistence = SQLitePersistence(self.storage)
+        await persistence.update_user_data(1, {"x": 1})
+        await persistence.update_conversation("add_esim", (1, 1), 3)
+        await persistence.flush()
+
+        await persistence.drop_user_data(1)
+        await persistence.update_conversation("add_esim", (1, 1), None)
+        await persistence.flush()
+
+        self.assertEqual(self._row_count(), 0)
+
+    def _setup_handlers(self):
+        application = (
+            Application.builder()
+            .token("123456:TEST")
+            .persistence(SQLitePersistence(self.storage))
+            .build()
+        )
+        bot = botmod.eSIMBot()
+        bot.application = application
+        setup_bot_handlers(bot)
+        return bot, application
+
+    def test_persistent_conversation_handlers_register(self):
+        bot, application = self._setup_handlers()
+
+        names = {
+            handler.name
+            for handlers in application.handlers.values()
+            for handler in handlers
+            if getattr(handler, "persistent", False)
+        }
+        self.assertEqual(names, {"create_link_qr", "add_esim", "use_esim", "bulk_add_esim"})
+
+    def test_create_link_qr_accepts_qr_photos(self):
+        bot, application = self._setup_handlers()
+
+        conversation = next(
+            handler
+            for handlers in application.handlers.values()
+            for handler in handlers
+            if getattr(handler, "name", None) == "create_link_qr"
+        )
+        for state in (botmod.WAITING_SM_DP_LINK, botmod.WAITING_QR_IMAGE):
+            callbacks = [handler.callback for handler in conversation.states[state]]
+            self.assertIn(bot.handle_qr_image, callbacks)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+from telegram.ext import Application
+
+from bot_webhook import WebhookServer, build_fake_update, post_fake_update
+
+
+def _raw_request(port, data):
+    """Gửi bytes thô và trả về dòng status của response."""
+    import socket
+
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as sock:
+        sock.sendall(data)
+        return sock.makefile("rb").readline()
+
+
+def _get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+class WebhookServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.application = Application.builder().token("123:ABC").build()
+        self.server = WebhookServer(
+            self.application, secret_token="s3cret", path="/telegram", host="127.0.0.1", port=0
+        )
+        await self.server.start()
+        self.base_url = f"http://127.0.0.1:{self.server.bound_port}"
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    async def test_valid_update_is_queued(self):
+        status = await asyncio.to_thread(
+            post_fake_update,
+            self.base_url + "/telegram",
+            "s3cret",
+            build_fake_update("/start", user_id=42, update_id=7),
+        )
+
+        self.assertEqual(status, 200)
+        update = self.application.update_queue.get_nowait()
+        self.assertEqual(update.update_id, 7)
+        self.assertEqual(update.effective_user.id, 42)
+        self.assertEqual(update.message.text, "/start")
+
+    async def test_wrong_secret_is_rejected(self):
+        status = await asyncio.to_thread(
+            post_fake_update, self.base_url + "/telegram", "wrong", build_fake_update("/start")
+        )
+
+        self.assertEqual(status, 403)
+        self.assertTrue(self.application.update_queue.empty())
+
+    async def test_invalid_json_returns_400(self):
+        request = urllib.request.Request(
+            self.base_url + "/telegram",
+            data=b"{not json",
+            headers={"X-Telegram-Bot-Api-Secret-Token": "s3cret"},
+            method="POST",
+        )
+
+        def send():
+            try:
+                urllib.request.urlopen(request, timeout=5)
+            except urllib.error.HTTPError as e:
+                return e.code
+
+        self.assertEqual(await asyncio.to_thread(send), 400)
+
+    async def test_non_ascii_secret_is_rejected(self):
+        request = (
+            "POST /telegram HTTP/1.1\r\nHost: x\r\nContent-Length: 2\r\n"
+            "X-Telegram-Bot-Api-Secret-Token: s\u00e9cret\r\n\r\n{}"
+        ).encode("latin-1")
+
+        status_line = await asyncio.to_thread(_raw_request, self.server.bound_port, request)
+
+        self.assertTrue(status_line.startswith(b"HTTP/1.1 403"), status_line)
+
+    async def test_malformed_framing_returns_400(self):
+        for framing in (
+            b"Content-Length: abc\r\n",
+            b"Content-Length: -1\r\n",
+            b"Transfer-Encoding: chunked\r\n",
+        ):
+            request = (
+                b"POST /telegram HTTP/1.1\r\nHost: x\r\n" + framing
+                + b"X-Telegram-Bot-Api-Secret-Token: s3cret\r\n\r\n2\r\n{}\r\n0\r\n\r\n"
+            )
+            with self.subTest(framing=framing):
+                status_line = await asyncio.to_thread(_raw_request, self.server.bound_port, request)
+                self.assertTrue(status_line.startswith(b"HTTP/1.1 400"), status_line)
+        self.assertTrue(self.application.update_queue.empty())
+
+    async def test_health_and_readiness(self):
+        self.assertEqual(await asyncio.to_thread(_get, self.base_url + "/healthz"), 200)
+        self.assertEqual(await asyncio.to_thread(_get, self.base_url + "/readyz"), 503)
+
+        self.server.ready = True
+        with mock.patch.object(
+            Application, "running", new_callable=mock.PropertyMock, return_value=True
+        ):
+            self.assertEqual(await asyncio.to_thread(_get, self.base_url + "/readyz"), 200)
+
+    async def test_unknown_path_returns_404(self):
+        self.assertEqual(await asyncio.to_thread(_get, self.base_url + "/other"), 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
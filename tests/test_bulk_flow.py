@@ -1,6 +1,11 @@
+import asyncio
+import importlib.util
 import os
+import shutil
+import sys
 import tempfile
 import unittest
+from unittest import mock
 from unittest.mock import AsyncMock, MagicMock
 
 import bot as botmod
@@ -9,6 +14,7 @@ from bot_constants import (
     WAITING_BULK_SM_DP_CUSTOM,
     WAITING_BULK_SMDP_CHOICE,
 )
+from esim_backup import SnapshotManager
 from esim_storage import eSIMStorage
 from telegram.ext import ConversationHandler
 
@@ -44,6 +50,17 @@ def make_message_update(text, user_id=ADMIN_ID):
     return update
 
 
+def make_image_update(image, media_group_id=None, message_id=1):
+    update = make_message_update(None)
+    update.message.photo = []
+    update.message.media_group_id = media_group_id
+    update.message.message_id = message_id
+    update.message.reply_text = AsyncMock(return_value=MagicMock(delete=AsyncMock()))
+    file = MagicMock(download_to_memory=AsyncMock(side_effect=lambda out: out.write(image)))
+    update.message.document.get_file = AsyncMock(return_value=file)
+    return update
+
+
 def make_context():
     context = MagicMock()
     context.user_data = {}
@@ -131,6 +148,73 @@ class BulkFlowIntegrationTest(unittest.IsolatedAsyncioTestCase):
             available[0].lpa_string, "LPA:1$rsp.custom-provider.com$ABC-1"
         )
 
+    async def test_bulk_add_from_voucher_sheet_image(self):
+        from test_esim_tools import voucher_sheet
+
+        image, lpas = voucher_sheet(4, 2)
+        update = make_image_update(image)
+
+        state = await self.bot.handle_bulk_image(update, make_context())
+
+        self.assertEqual(state, ConversationHandler.END)
+        stored = {e.lpa_string for e in self.storage.get_available_esims()}
+        self.assertEqual(stored, set(lpas))
+
+    async def test_album_is_saved_as_one_batch_with_one_reply(self):
+        from test_esim_tools import voucher_sheet
+
+        self.bot.media_groups.window = 0.05
+        first, first_lpas = voucher_sheet(2, 2)
+        second, _ = voucher_sheet(3, 3)  # 2 mã trùng ảnh đầu
+        updates = [make_image_update(first, "album", 1), make_image_update(second, "album", 2)]
+
+        states = await asyncio.gather(*(self.bot.handle_bulk_image(u, make_context()) for u in updates))
+
+        self.assertEqual(states, [ConversationHandler.END, None])
+        self.assertEqual(len(self.storage.get_available_esims()), 3)
+        # Một tin "đang xử lý" + một bảng kết quả cho cả album
+        self.assertEqual(updates[0].message.reply_text.await_count, 2)
+        updates[1].message.reply_text.assert_not_awaited()
+
+    async def test_bulk_add_from_zip_sends_file_report(self):
+        from test_esim_zip import sample_zip
+
+        update = make_image_update(sample_zip())
+        update.message.reply_document = AsyncMock()
+
+        with mock.patch.object(botmod.config, "ZIP_DECODE_WORKERS", 1, create=True):
+            state = await self.bot.handle_bulk_zip(update, make_context())
+
+        self.assertEqual(state, ConversationHandler.END)
+        stored = {e.lpa_string for e in self.storage.get_available_esims()}
+        self.assertEqual(stored, {"LPA:1$rsp.esim.exchange$ZIP-001", "LPA:1$rsp.esim.exchange$ZIP-002"})
+        report = update.message.reply_document.await_args.kwargs
+        self.assertEqual(report["filename"], "zip_report.tsv")
+        self.assertIn("1 lỗi", report["caption"])
+
+    async def test_invalid_zip_stays_in_state(self):
+        update = make_image_update(b"not a zip")
+
+        state = await self.bot.handle_bulk_zip(update, make_context())
+
+        self.assertEqual(state, WAITING_BULK_LIST)
+        self.assertEqual(self.storage.get_available_esims(), [])
+
+    @unittest.skipUnless(importlib.util.find_spec("pypdfium2"), "pypdfium2 chưa được cài")
+    async def test_bulk_add_from_pdf_keeps_iccid(self):
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+        from fixtures import voucher_pdf
+
+        pdf, vouchers = voucher_pdf(3)
+        update = make_image_update(pdf)
+
+        with mock.patch.object(botmod.config, "PDF_DECODE_WORKERS", 1, create=True):
+            state = await self.bot.handle_bulk_pdf(update, make_context())
+
+        self.assertEqual(state, ConversationHandler.END)
+        stored = {(e.lpa_string, e.iccid) for e in self.storage.get_available_esims()}
+        self.assertEqual(stored, set(vouchers))
+
     async def test_invalid_custom_sm_dp_stays_in_state(self):
         context = make_context()
         context.user_data["bulk_sm_dp"] = ""
@@ -216,5 +300,57 @@ class UseEsimNoteFlowTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(entry.status, "available")
 
 
+class DeleteUndoFlowTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.storage = eSIMStorage(db_path=os.path.join(self.tmpdir, "esim.db"))
+        self._original_storage = botmod.esim_storage
+        botmod.esim_storage = self.storage
+        self.bot = botmod.eSIMBot()
+        self.bot.snapshots = SnapshotManager(os.path.join(self.tmpdir, "backups"))
+        self.available_id = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$A1")
+        used_id = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$U1")
+        self.storage.mark_esim_used(used_id, "1000 (@admin)")
+
+    def tearDown(self):
+        botmod.esim_storage = self._original_storage
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _undo_callback(self, update):
+        markup = update.callback_query.edit_message_text.call_args.kwargs["reply_markup"]
+        return next(
+            button.callback_data
+            for row in markup.inline_keyboard
+            for button in row
+            if button.callback_data.startswith("undo_del_")
+        )
+
+    async def test_delete_all_snapshots_then_undo_restores(self):
+        context = make_context()
+        update = make_callback_update("confirm_del_all")
+
+        await self.bot.do_delete_all(update, context)
+
+        self.assertEqual(self.storage.get_storage_stats()["total"], 0)
+        self.assertEqual(len(self.bot.snapshots.list_snapshots()), 1)
+
+        await self.bot.undo_delete(
+            make_callback_update(self._undo_callback(update)), context
+        )
+        self.assertEqual(self.storage.get_storage_stats()["total"], 2)
+
+    async def test_delete_single_esim_can_be_undone(self):
+        context = make_context()
+        update = make_callback_update(f"confirm_del_esim_{self.available_id}")
+
+        await self.bot.do_delete_esim(update, context)
+        self.assertIsNone(self.storage.get_esim_by_id(self.available_id))
+
+        await self.bot.undo_delete(
+            make_callback_update(self._undo_callback(update)), context
+        )
+        self.assertIsNotNone(self.storage.get_esim_by_id(self.available_id))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,96 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from esim_backup import SnapshotManager
+from esim_storage import eSIMStorage
+
+
+class SnapshotManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, "esim_storage.db")
+        self.backup_dir = os.path.join(self.tmpdir, "backups")
+        self.storage = eSIMStorage(db_path=self.db_path)
+        self.manager = SnapshotManager(self.backup_dir, keep=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _restore(self, snapshot_path):
+        restored = os.path.join(self.tmpdir, "restored.db")
+        with gzip.open(snapshot_path, "rb") as src, open(restored, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        return restored
+
+    def test_snapshot_is_compressed_copy_of_database(self):
+        esim_id = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$CODE-1")
+
+        path = self.manager.create_snapshot(self.storage, "manual")
+
+        self.assertTrue(path.endswith(".db.gz"))
+        conn = sqlite3.connect(self._restore(path))
+        ids = [row[0] for row in conn.execute("SELECT id FROM esim_entries")]
+        conn.close()
+        self.assertEqual(ids, [esim_id])
+
+    def test_keeps_only_newest_snapshots(self):
+        paths = [
+            self.manager.create_snapshot(self.storage, f"run{i}") for i in range(4)
+        ]
+
+        self.assertEqual(self.manager.list_snapshots(), [paths[3], paths[2]])
+        self.assertEqual(self.manager.latest_snapshot(), paths[3])
+
+    def test_no_temp_files_left_behind(self):
+        self.manager.create_snapshot(self.storage, "delete_all")
+
+        leftovers = [n for n in os.listdir(self.backup_dir) if n.endswith(".tmp")]
+        self.assertEqual(leftovers, [])
+
+    def test_snapshot_finishes_while_database_is_written(self):
+        for i in range(2000):
+            self.storage.add_esim_from_lpa(f"LPA:1$rsp.esim.exchange$SEED-{i}")
+        stop = threading.Event()
+
+        def write():
+            i = 0
+            while not stop.is_set():
+                self.storage.add_esim_from_lpa(f"LPA:1$rsp.esim.exchange$LIVE-{i}")
+                i += 1
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            path = self.manager.create_snapshot(self.storage, "busy")
+        finally:
+            stop.set()
+            writer.join()
+
+        conn = sqlite3.connect(self._restore(path))
+        count = conn.execute("SELECT COUNT(*) FROM esim_entries").fetchone()[0]
+        conn.close()
+        self.assertGreaterEqual(count, 2000)
+
+    def test_locked_database_is_retried_a_limited_number_of_times(self):
+        conn = mock.Mock()
+        conn.backup.side_effect = sqlite3.OperationalError("database is locked")
+        dest = os.path.join(self.tmpdir, "copy.db")
+
+        with mock.patch.object(self.storage, "_connect", return_value=conn), \
+                mock.patch("esim_storage.time.sleep") as sleep:
+            with self.assertRaises(sqlite3.OperationalError):
+                self.storage.backup_to(dest, attempts=3)
+
+        self.assertEqual(conn.backup.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+        conn.backup.assert_called_with(mock.ANY, pages=-1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+
+from esim_decode_pool import DecodePool
+from esim_image_guard import decode_admission
+
+
+def _budget_limit():
+    return decode_admission.budget.limit
+
+
+class DecodePoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = DecodePool(workers=2)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_pool_is_created_once_and_reused(self):
+        executor = self.pool.executor()
+
+        self.assertIs(self.pool.executor(), executor)
+        self.assertEqual(self.pool.size, 2)
+
+    def test_workers_get_a_share_of_the_memory_budget(self):
+        limit = self.pool.executor().submit(_budget_limit).result(timeout=60)
+
+        self.assertEqual(limit, decode_admission.budget.limit // 2)
+
+    def test_broken_pool_is_replaced(self):
+        executor = self.pool.executor()
+        with self.assertRaises(BrokenProcessPool):
+            executor.submit(os._exit, 1).result(timeout=60)
+
+        replacement = self.pool.executor()
+
+        self.assertIsNot(replacement, executor)
+        self.assertEqual(replacement.submit(_budget_limit).result(timeout=60), decode_admission.budget.limit // 2)
+
+    def test_configure_replaces_pool(self):
+        executor = self.pool.executor()
+
+        self.pool.configure(1)
+
+        self.assertIsNot(self.pool.executor(), executor)
+        self.assertEqual(self.pool.size, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
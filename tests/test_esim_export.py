@@ -0,0 +1,112 @@
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from esim_export import export_to_tempfile, parse_export_args
+from esim_storage import eSIMStorage
+
+
+class ExportArgsTest(unittest.TestCase):
+    def test_defaults_to_csv_all(self):
+        options = parse_export_args([])
+
+        self.assertEqual(options["fmt"], "csv")
+        self.assertIsNone(options["status"])
+
+    def test_parses_format_status_dates_and_smdp(self):
+        options = parse_export_args(
+            ["jsonl", "used", "from:2024-06-01", "to:2024-06-07", "smdp:rsp.esim.exchange"]
+        )
+
+        self.assertEqual(options["fmt"], "jsonl")
+        self.assertEqual(options["status"], "used")
+        self.assertEqual(options["date_from"], datetime.date(2024, 6, 1))
+        self.assertEqual(options["date_to"], datetime.date(2024, 6, 7))
+        self.assertEqual(options["sm_dp_address"], "rsp.esim.exchange")
+
+    def test_rejects_unknown_argument_and_bad_date(self):
+        with self.assertRaises(ValueError):
+            parse_export_args(["xml"])
+        with self.assertRaises(ValueError):
+            parse_export_args(["from:06/01/2024"])
+
+
+class ExportStreamTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        os.remove(self.db_path)
+        self.storage = eSIMStorage(db_path=self.db_path)
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths + [self.db_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _seed(self):
+        a1 = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$A1", iccid="111")
+        u1 = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$U1")
+        u2 = self.storage.add_esim_from_lpa("LPA:1$rsp.billionconnect.com$U2")
+        self.storage.mark_esim_used(u1, "1000 (@admin)", "Khách 1")
+        self.storage.mark_esim_used(u2, "1000 (@admin)", "Khách 2")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "UPDATE esim_entries SET used_date = ? WHERE id = ?",
+            ("2024-06-03T10:00:00", u1),
+        )
+        conn.execute(
+            "UPDATE esim_entries SET used_date = ? WHERE id = ?",
+            ("2024-07-01T10:00:00", u2),
+        )
+        conn.commit()
+        conn.close()
+        return a1, u1, u2
+
+    def test_iter_esims_filters_used_by_date_range_inclusive(self):
+        _, u1, _ = self._seed()
+
+        rows = list(self.storage.iter_esims(
+            status="used", date_from="2024-06-01", date_to="2024-06-03", batch_size=1
+        ))
+
+        self.assertEqual([e.id for e in rows], [u1])
+
+    def test_iter_esims_filters_by_smdp(self):
+        self._seed()
+
+        rows = list(self.storage.iter_esims(sm_dp_address="rsp.billionconnect.com"))
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0].activation_code, "U2")
+
+    def test_export_csv_writes_header_and_rows(self):
+        self._seed()
+
+        path, count = export_to_tempfile(self.storage, "csv", status="used")
+        self.paths.append(path)
+
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(count, 2)
+        self.assertEqual({r["used_note"] for r in rows}, {"Khách 1", "Khách 2"})
+
+    def test_export_jsonl_one_record_per_line(self):
+        a1, _, _ = self._seed()
+
+        path, count = export_to_tempfile(self.storage, "jsonl", status="available")
+        self.paths.append(path)
+
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(count, 1)
+        self.assertEqual(records[0]["id"], a1)
+        self.assertEqual(records[0]["iccid"], "111")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from esim_http_cache import HTTPCache, freshness_deadline, parse_cache_control
+
+NOW = 1_700_000_000.0
+
+
+class FreshnessTest(unittest.TestCase):
+    def test_parse_cache_control(self):
+        self.assertEqual(
+            parse_cache_control('Max-Age=60, no-cache, private="x"'),
+            {"max-age": "60", "no-cache": None, "private": "x"},
+        )
+
+    def test_max_age_minus_age(self):
+        self.assertEqual(freshness_deadline({"Cache-Control": "max-age=60", "Age": "20"}, NOW), NOW + 40)
+
+    def test_no_store_and_no_cache(self):
+        self.assertIsNone(freshness_deadline({"Cache-Control": "no-store"}, NOW))
+        self.assertEqual(freshness_deadline({"Cache-Control": "no-cache, max-age=60"}, NOW), NOW)
+
+    def test_expires(self):
+        self.assertEqual(freshness_deadline({"Expires": "Tue, 14 Nov 2023 22:15:00 GMT"}, NOW), NOW + 100)
+        self.assertEqual(freshness_deadline({"Expires": "0"}, NOW), NOW)
+
+    def test_last_modified_heuristic(self):
+        headers = {"Date": "Tue, 14 Nov 2023 22:13:20 GMT", "Last-Modified": "Tue, 14 Nov 2023 22:11:40 GMT"}
+
+        self.assertEqual(freshness_deadline(headers, NOW), NOW + 10)
+
+
+class HTTPCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = HTTPCache(os.path.join(self.tmp.name, "http_cache.db"), max_bytes=1000, access_resolution=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_store_and_get(self):
+        self.cache.store("http://a/qr.png", b"abc", {"Cache-Control": "max-age=60", "ETag": '"v1"'})
+
+        entry = self.cache.get("http://a/qr.png")
+        # Metadata không kèm body: lượt trúng kết quả đã giải mã không đọc BLOB
+        self.assertIsNone(entry.body)
+        self.assertEqual(self.cache.body("http://a/qr.png"), b"abc")
+        self.assertTrue(entry.is_fresh())
+        self.assertEqual(entry.validators(), {"If-None-Match": '"v1"'})
+        self.assertIsNone(self.cache.get("http://a/other.png"))
+
+    def test_not_storable(self):
+        self.assertIsNone(self.cache.store("http://a/1", b"abc", {"Cache-Control": "no-store"}))
+        # Hết tươi ngay mà không có validator: lưu cũng vô ích
+        self.assertIsNone(self.cache.store("http://a/2", b"abc", {}))
+        self.assertIsNone(self.cache.store("http://a/3", b"x" * 2000, {"Cache-Control": "max-age=60"}))
+        self.assertEqual(self.cache.total_bytes(), 0)
+
+    def test_refresh_keeps_body_and_results(self):
+        self.cache.store("http://a/qr.png", b"abc", {"Cache-Control": "no-cache", "ETag": '"v1"'})
+        self.cache.put_result("http://a/qr.png", "decode", {"lpa": "LPA:1$a$b"})
+        self.assertFalse(self.cache.get("http://a/qr.png").is_fresh())
+
+        entry = self.cache.refresh("http://a/qr.png", {"Cache-Control": "max-age=60"})
+
+        self.assertTrue(entry.is_fresh())
+        self.assertEqual(self.cache.body("http://a/qr.png"), b"abc")
+        self.assertEqual(entry.etag, '"v1"')
+        self.assertEqual(self.cache.get_result("http://a/qr.png", "decode"), {"lpa": "LPA:1$a$b"})
+
+    def test_new_body_drops_results(self):
+        self.cache.store("http://a/qr.png", b"abc", {"Cache-Control": "max-age=60"})
+        self.cache.put_result("http://a/qr.png", "decode", {"lpa": "old"})
+
+        self.cache.store("http://a/qr.png", b"def", {"Cache-Control": "max-age=60"})
+
+        self.assertIsNone(self.cache.get_result("http://a/qr.png", "decode"))
+
+    def test_result_requires_stored_body(self):
+        self.cache.put_result("http://a/missing.png", "decode", {"lpa": "x"})
+
+        self.assertIsNone(self.cache.get_result("http://a/missing.png", "decode"))
+
+    def test_refresh_with_no_store_returns_body_and_drops_entry(self):
+        self.cache.store("http://a/qr.png", b"abc", {"Cache-Control": "no-cache", "ETag": '"v1"'})
+
+        entry = self.cache.refresh("http://a/qr.png", {"Cache-Control": "no-store"})
+
+        self.assertEqual(entry.body, b"abc")
+        self.assertIsNone(self.cache.get("http://a/qr.png"))
+
+    def test_access_time_is_written_at_most_once_per_resolution(self):
+        cache = HTTPCache(self.cache.db_path, access_resolution=60)
+        cache.store("http://a/qr.png", b"abc", {"Cache-Control": "max-age=60"})
+        stored_at = self._last_access("http://a/qr.png")
+
+        with mock.patch("esim_http_cache.time.time", return_value=stored_at + 30):
+            cache.get("http://a/qr.png")
+        self.assertEqual(self._last_access("http://a/qr.png"), stored_at)
+
+        with mock.patch("esim_http_cache.time.time", return_value=stored_at + 90) as now:
+            cache.get("http://a/qr.png")
+        self.assertEqual(self._last_access("http://a/qr.png"), now.return_value)
+
+    def _last_access(self, url):
+        conn = sqlite3.connect(self.cache.db_path)
+        try:
+            return conn.execute("SELECT last_access FROM http_cache WHERE url = ?", (url,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_evicts_least_recently_used(self):
+        headers = {"Cache-Control": "max-age=60"}
+        self.cache.store("http://a/1", b"1" * 400, headers)
+        self.cache.store("http://a/2", b"2" * 400, headers)
+        self.cache.get("http://a/1")
+
+        self.cache.store("http://a/3", b"3" * 400, headers)
+
+        self.assertIsNotNone(self.cache.get("http://a/1"))
+        self.assertIsNone(self.cache.get("http://a/2"))
+        self.assertIsNotNone(self.cache.get("http://a/3"))
+        self.assertEqual(self.cache.total_bytes(), 800)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import threading
+import unittest
+from unittest import mock
+
+from esim_image_guard import DecodeAdmission, ImageRejected, MemoryBudget, decode_admission, probe_image
+from esim_qr_decode import strategy_stats
+from esim_tools import eSIMTools
+
+
+def qr_png(lpa="LPA:1$rsp.esim.exchange$GUARD1"):
+    bio, lpa = eSIMTools().create_qr_from_lpa(lpa)
+    return bio.getvalue(), lpa
+
+
+def qr_jpeg(side):
+    import cv2
+    import numpy as np
+
+    png, lpa = qr_png()
+    img = cv2.imdecode(np.frombuffer(png, np.uint8), cv2.IMREAD_COLOR)
+    img = cv2.resize(img, (side, side), interpolation=cv2.INTER_NEAREST)
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes(), lpa
+
+
+class ProbeImageTest(unittest.TestCase):
+    def test_reads_size_from_header(self):
+        png, _ = qr_png()
+        width, height, image_format = probe_image(memoryview(png))
+
+        self.assertEqual(image_format, "PNG")
+        self.assertEqual(width, height)
+        self.assertGreater(width, 100)
+
+    def test_rejects_unknown_data(self):
+        with self.assertRaises(ImageRejected):
+            probe_image(b"not an image at all")
+
+
+class DecodeAdmissionTest(unittest.TestCase):
+    def test_rejects_too_many_pixels(self):
+        png, _ = qr_png()
+
+        with self.assertRaises(ImageRejected):
+            DecodeAdmission(max_pixels=10_000).plan(png)
+
+    def test_large_jpeg_is_reduced(self):
+        jpeg, _ = qr_jpeg(2000)
+        plan = DecodeAdmission(target_pixels=1_000_000).plan(jpeg)
+
+        self.assertEqual((plan.width, plan.height, plan.format, plan.scale), (2000, 2000, "JPEG", 2))
+        self.assertEqual(plan.cost, len(jpeg) + 1000 * 1000 * 5)
+
+    def test_non_jpeg_reduction_counts_full_decode(self):
+        png, _ = qr_png()
+        width, height, _ = probe_image(png)
+        plan = DecodeAdmission(target_pixels=width * height // 3).plan(png)
+
+        self.assertEqual(plan.scale, 2)
+        self.assertGreater(plan.cost, width * height * 3)
+
+    def test_cost_over_budget_is_rejected(self):
+        png, _ = qr_png()
+
+        with self.assertRaises(ImageRejected):
+            DecodeAdmission(memory_budget=1024).plan(png)
+
+    def test_busy_budget_times_out(self):
+        png, _ = qr_png()
+        admission = DecodeAdmission(wait_timeout=0.05)
+        admission.budget.in_use = admission.budget.limit
+
+        with self.assertRaises(ImageRejected):
+            with admission.admit(png):
+                pass
+
+    def test_budget_released_after_decode(self):
+        jpeg, lpa = qr_jpeg(2000)
+
+        with mock.patch.object(decode_admission, "target_pixels", 1_000_000):
+            self.assertEqual(eSIMTools().decode_qr_from_image(jpeg), lpa)
+        # Lượt chạy hết danh sách ở thread nền giữ ngân sách đến khi xong
+        strategy_stats.drain()
+        self.assertEqual(decode_admission.budget.in_use, 0)
+
+    def test_rejected_image_reports_error(self):
+        png, _ = qr_png()
+
+        with mock.patch.object(decode_admission, "max_pixels", 10_000):
+            analysis = eSIMTools().analyze_qr_image(png)
+
+        self.assertFalse(analysis["qr_detected"])
+        self.assertIn("quá lớn", analysis["error"])
+
+
+class MemoryBudgetTest(unittest.TestCase):
+    def test_waiter_resumes_after_release(self):
+        budget = MemoryBudget(100)
+        self.assertTrue(budget.acquire(80))
+        acquired = []
+
+        waiter = threading.Thread(target=lambda: acquired.append(budget.acquire(50, timeout=5)))
+        waiter.start()
+        budget.release(80)
+        waiter.join(5)
+
+        self.assertEqual(acquired, [True])
+        self.assertEqual(budget.in_use, 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
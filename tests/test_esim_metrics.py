@@ -0,0 +1,113 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from esim_metrics import Histogram, MetricsRegistry, instrument_methods, metrics, timed, timer
+from esim_storage import eSIMStorage
+
+
+class HistogramTest(unittest.TestCase):
+    def test_percentiles_are_close_to_exact_values(self):
+        histogram = Histogram()
+        for i in range(1, 1001):
+            histogram.observe(i / 1000)  # 1ms .. 1s
+
+        summary = histogram.summary()
+
+        self.assertEqual(summary["count"], 1000)
+        self.assertAlmostEqual(summary["p50"], 0.5, delta=0.5 * 0.25)
+        self.assertAlmostEqual(summary["p99"], 0.99, delta=0.99 * 0.25)
+        self.assertLessEqual(summary["p99"], summary["max"])
+
+    def test_empty_histogram_reports_zero(self):
+        self.assertEqual(Histogram().percentile(95), 0.0)
+
+
+class TimedTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry(enabled=True)
+
+    def test_disabled_registry_records_nothing(self):
+        registry = MetricsRegistry(enabled=False)
+        func = timed("noop", registry)(lambda: 42)
+
+        self.assertEqual(func(), 42)
+        with timer("block", registry):
+            pass
+        self.assertEqual(registry.snapshot(), {})
+
+    def test_sync_async_and_generator_functions(self):
+        @timed("sync", self.registry)
+        def sync():
+            return 1
+
+        @timed("async", self.registry)
+        async def coro():
+            return 2
+
+        @timed("gen", self.registry)
+        def gen():
+            yield from range(3)
+
+        self.assertEqual(sync(), 1)
+        self.assertEqual(asyncio.run(coro()), 2)
+        self.assertEqual(list(gen()), [0, 1, 2])
+        with timer("block", self.registry):
+            pass
+
+        snapshot = self.registry.snapshot()
+        self.assertEqual({name: s["count"] for name, s in snapshot.items()},
+                         {"sync": 1, "async": 1, "gen": 1, "block": 1})
+
+    def test_exceptions_are_still_timed(self):
+        @timed("boom", self.registry)
+        def boom():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            boom()
+        self.assertEqual(self.registry.snapshot()["boom"]["count"], 1)
+
+    def test_instrument_methods_wraps_public_methods_only(self):
+        @instrument_methods("svc", registry=self.registry)
+        class Service:
+            def work(self):
+                return "ok"
+
+            def _helper(self):
+                return "hidden"
+
+            @staticmethod
+            def util():
+                return "static"
+
+        service = Service()
+        self.assertEqual((service.work(), service._helper(), Service.util()), ("ok", "hidden", "static"))
+        self.assertEqual(list(self.registry.snapshot()), ["svc.work"])
+
+
+class StorageInstrumentationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.storage = eSIMStorage(db_path=os.path.join(self.tmpdir, "esim.db"))
+        metrics.reset()
+        metrics.enabled = True
+
+    def tearDown(self):
+        metrics.enabled = False
+        metrics.reset()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_storage_methods_feed_shared_registry(self):
+        self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$M1")
+        list(self.storage.iter_esims())
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["storage.add_esim_from_lpa"]["count"], 1)
+        self.assertEqual(snapshot["storage.iter_esims"]["count"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from esim_migrations import (
+    MIGRATIONS,
+    SCHEMA_VERSION,
+    Backfill,
+    Migration,
+    migrate,
+    user_version,
+)
+from esim_storage import eSIMStorage
+
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, "esim.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, isolation_level=None)
+
+    def _names(self, kind):
+        conn = self._connect()
+        names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+        conn.close()
+        return names
+
+    def test_registry_versions_are_ordered_and_unique(self):
+        versions = [m.version for m in MIGRATIONS]
+
+        self.assertEqual(versions, list(range(1, len(MIGRATIONS) + 1)))
+        self.assertEqual(SCHEMA_VERSION, versions[-1])
+
+    def test_fresh_database_reaches_latest_version(self):
+        eSIMStorage(db_path=self.db_path)
+
+        conn = self._connect()
+        self.assertEqual(user_version(conn), SCHEMA_VERSION)
+        conn.close()
+        self.assertTrue({"esim_entries", "esim_entries_archive", "bot_persistence", "leader_leases"}
+                        <= self._names("table"))
+        self.assertTrue({"idx_live_iccid", "idx_live_smdp_status"} <= self._names("index"))
+
+    def test_upgrade_from_version_1_backfills_in_batches(self):
+        conn = self._connect()
+        migrate(conn, MIGRATIONS[:1])
+        conn.executemany(
+            "INSERT INTO esim_entries (id, sm_dp_address, activation_code, added_date, lpa_string) "
+            "VALUES (?, 'rsp.esim.exchange', ?, '2024-01-01', ?)",
+            [(f"e{i}", f"CODE{i}", None if i % 2 else "") for i in range(5)],
+        )
+        batches = []
+        conn.set_trace_callback(lambda sql: batches.append(sql) if sql.lstrip().startswith("UPDATE") else None)
+
+        self.assertEqual(migrate(conn, batch_size=2, pause=0), (1, SCHEMA_VERSION))
+
+        conn.set_trace_callback(None)
+        lpas = dict(conn.execute("SELECT id, lpa_string FROM esim_entries"))
+        conn.close()
+        self.assertEqual(lpas["e3"], "LPA:1$rsp.esim.exchange$CODE3")
+        # 5 dòng, lô 2 dòng: 3 lô cho bảng chính + 1 lô rỗng cho archive
+        self.assertEqual(len(batches), 4)
+
+    def test_failed_migration_rolls_back_and_keeps_version(self):
+        def broken(conn):
+            raise RuntimeError("boom")
+
+        registry = [
+            Migration(1, "one", statements=("CREATE TABLE a (x)",)),
+            Migration(2, "two", statements=("CREATE TABLE b (x)",), apply=broken),
+        ]
+        conn = self._connect()
+
+        with self.assertRaises(RuntimeError):
+            migrate(conn, registry)
+
+        self.assertEqual(user_version(conn), 1)
+        conn.close()
+        self.assertIn("a", self._names("table"))
+        self.assertNotIn("b", self._names("table"))
+
+    def test_interrupted_backfill_resumes(self):
+        registry = [
+            Migration(1, "table", statements=("CREATE TABLE t (v INTEGER)",)),
+            Migration(2, "double", backfills=(Backfill("t", "v = -v * 2", "v > 0"),)),
+        ]
+        conn = self._connect()
+        migrate(conn, registry[:1])
+        conn.executemany("INSERT INTO t (v) VALUES (?)", [(i,) for i in range(1, 6)])
+        # Giả lập lần chạy trước đã xử lý một phần rồi bị ngắt
+        conn.execute("UPDATE t SET v = -v * 2 WHERE v <= 2")
+
+        migrate(conn, registry, batch_size=2, pause=0)
+
+        values = sorted(v for (v,) in conn.execute("SELECT v FROM t"))
+        self.assertEqual(values, [-10, -8, -6, -4, -2])
+        self.assertEqual(user_version(conn), 2)
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
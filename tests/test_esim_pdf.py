@@ -0,0 +1,79 @@
+import importlib.util
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from fixtures import voucher_pdf  # noqa: E402
+
+from esim_decode_pool import decode_pool  # noqa: E402
+from esim_image_guard import ImageRejected, decode_admission  # noqa: E402
+from esim_pdf import decode_pdf  # noqa: E402
+
+HAS_PDFIUM = importlib.util.find_spec("pypdfium2") is not None
+
+
+@unittest.skipUnless(HAS_PDFIUM, "pypdfium2 chưa được cài")
+class DecodePdfTest(unittest.TestCase):
+    def test_one_qr_per_page_with_iccid(self):
+        pdf, vouchers = voucher_pdf(4)
+
+        report = decode_pdf(pdf, workers=1)
+
+        self.assertEqual(list(zip(report.codes, report.iccids)), vouchers)
+        self.assertEqual(report.empty_pages, [])
+
+    def test_pages_are_split_across_processes(self):
+        decode_pool.configure(2)
+        self.addCleanup(decode_pool.configure, 0)
+        self.addCleanup(decode_pool.shutdown)
+        pdf, vouchers = voucher_pdf(5, per_page=2)
+
+        report = decode_pdf(pdf, workers=2)
+        pool = decode_pool.executor()
+        again = decode_pdf(pdf)
+
+        self.assertEqual([page.number for page in report.pages], [1, 2, 3, 4, 5])
+        self.assertEqual(list(zip(report.codes, report.iccids)), vouchers)
+        self.assertEqual(again.codes, report.codes)
+        # PDF thứ hai dùng lại pool của PDF đầu, không spawn process mới
+        self.assertIs(decode_pool.executor(), pool)
+
+    def test_max_pages_skips_the_rest(self):
+        pdf, vouchers = voucher_pdf(3)
+
+        report = decode_pdf(pdf, workers=1, max_pages=2)
+
+        self.assertEqual(report.codes, [lpa for lpa, _ in vouchers[:2]])
+        self.assertEqual(report.skipped_pages, 1)
+
+    def test_pages_hold_decode_budget(self):
+        pdf, vouchers = voucher_pdf(2)
+
+        with mock.patch.object(decode_admission, "hold", wraps=decode_admission.hold) as hold:
+            report = decode_pdf(pdf, workers=1)
+
+        self.assertEqual(report.codes, [lpa for lpa, _ in vouchers])
+        self.assertEqual(hold.call_count, 2)
+        self.assertEqual(decode_admission.budget.in_use, 0)
+
+    def test_busy_budget_rejects_pdf(self):
+        pdf, _ = voucher_pdf(1)
+
+        with mock.patch.object(decode_admission, "wait_timeout", 0.01):
+            decode_admission.budget.acquire(decode_admission.budget.limit)
+            try:
+                with self.assertRaises(ImageRejected):
+                    decode_pdf(pdf, workers=1)
+            finally:
+                decode_admission.budget.release(decode_admission.budget.limit)
+
+    def test_invalid_pdf_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            decode_pdf(b"%PDF-1.4 broken", workers=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
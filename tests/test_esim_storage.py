@@ -1,9 +1,15 @@
+import datetime
 import os
+import shutil
 import sqlite3
+import subprocess
+import sys
 import tempfile
 import unittest
+from unittest import mock
 
-from esim_storage import eSIMStorage
+from esim_maintenance import StorageCompactor
+from esim_storage import SCHEMA_VERSION, eSIMStorage
 
 
 class ESIMStorageBulkTest(unittest.TestCase):
@@ -46,6 +52,14 @@ class ESIMStorageBulkTest(unittest.TestCase):
         self.assertEqual(stats["total"], 2)
         self.assertEqual(stats["available"], 2)
 
+    def test_entries_are_slotted_and_round_trip_dict(self):
+        esim_id = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$CODE-1")
+
+        entry = self.storage.get_esim_by_id(esim_id)
+
+        self.assertFalse(hasattr(entry, "__dict__"))
+        self.assertEqual(type(entry).from_dict(entry.to_dict()), entry)
+
     def test_add_esim_from_lpa_stores_iccid(self):
         esim_id = self.storage.add_esim_from_lpa(
             "LPA:1$rsp.truphone.com$CODE123",
@@ -128,6 +142,148 @@ class ESIMStorageBulkTest(unittest.TestCase):
         self.assertEqual(self.storage.get_all_esims(), [])
 
 
+class ESIMStorageSoftDeleteTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        os.remove(self.db_path)
+        self.storage = eSIMStorage(db_path=self.db_path)
+
+    def tearDown(self):
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+    def _raw_count(self):
+        conn = sqlite3.connect(self.db_path)
+        count = conn.execute("SELECT COUNT(*) FROM esim_entries").fetchone()[0]
+        conn.close()
+        return count
+
+    def test_delete_keeps_tombstone_and_restore_undoes_it(self):
+        a1 = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$A1")
+        u1 = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$U1")
+        self.storage.mark_esim_used(u1, "1000 (@admin)")
+        tombstone = self.storage.new_tombstone()
+
+        self.assertEqual(self.storage.delete_all_esims(deleted_at=tombstone), 2)
+        self.assertEqual(self.storage.get_storage_stats()["total"], 0)
+        self.assertEqual(self._raw_count(), 2)
+
+        self.assertEqual(self.storage.restore_deleted(tombstone), 2)
+        self.assertEqual(self.storage.get_esim_by_id(a1).status, "available")
+        self.assertEqual(self.storage.get_esim_by_id(u1).status, "used")
+
+    def test_restore_only_affects_matching_tombstone(self):
+        a1 = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$A1")
+        a2 = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$A2")
+        first = "2024-01-01T00:00:00"
+        self.storage.delete_esim(a1, deleted_at=first)
+        self.storage.delete_esim(a2, deleted_at="2024-01-02T00:00:00")
+
+        self.assertEqual(self.storage.restore_deleted(first), 1)
+        self.assertIsNotNone(self.storage.get_esim_by_id(a1))
+        self.assertIsNone(self.storage.get_esim_by_id(a2))
+
+    def test_deleted_esim_cannot_be_marked_used(self):
+        a1 = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$A1")
+        self.storage.delete_esim(a1)
+
+        self.assertFalse(self.storage.mark_esim_used(a1, "1000 (@admin)"))
+
+    def test_purge_removes_only_old_tombstones_in_batches(self):
+        ids = [
+            self.storage.add_esim_from_lpa(f"LPA:1$rsp.esim.exchange$C{i}")
+            for i in range(5)
+        ]
+        for esim_id in ids[:4]:
+            self.storage.delete_esim(esim_id, deleted_at="2020-01-01T00:00:00")
+        self.storage.delete_esim(ids[4])
+
+        purged = self.storage.purge_deleted(datetime.timedelta(hours=1), batch_size=3)
+
+        self.assertEqual(purged, 4)
+        self.assertEqual(self._raw_count(), 1)
+
+    def test_compactor_purges_and_reclaims_space(self):
+        esim_id = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$A1")
+        self.storage.delete_esim(esim_id, deleted_at="2020-01-01T00:00:00")
+
+        result = StorageCompactor(self.storage).run_once()
+
+        self.assertEqual(result, {"archived": 0, "purged": 1, "vacuum": "incremental"})
+        self.assertEqual(self._raw_count(), 0)
+
+    def test_reclaim_space_converts_legacy_database(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA auto_vacuum = NONE")
+        conn.execute("VACUUM")
+        conn.close()
+
+        self.assertEqual(self.storage.reclaim_space(), "full")
+        self.assertEqual(self.storage.reclaim_space(), "incremental")
+
+
+class ESIMStorageArchiveTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        os.remove(self.db_path)
+        self.storage = eSIMStorage(db_path=self.db_path)
+        self.available_id = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$A1")
+        self.old_id = self.storage.add_esim_from_lpa(
+            "LPA:1$rsp.esim.exchange$OLD", iccid="8985000001"
+        )
+        self.recent_id = self.storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$NEW")
+        self.storage.mark_esim_used(self.old_id, "1000 (@admin)", "Khách cũ")
+        self.storage.mark_esim_used(self.recent_id, "1000 (@admin)", "Khách mới")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "UPDATE esim_entries SET used_date = ? WHERE id = ?",
+            ("2020-01-01T00:00:00", self.old_id),
+        )
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+    def _hot_ids(self):
+        conn = sqlite3.connect(self.db_path)
+        ids = {row[0] for row in conn.execute("SELECT id FROM esim_entries")}
+        conn.close()
+        return ids
+
+    def test_archive_moves_only_old_used_rows(self):
+        archived = self.storage.archive_used_esims(datetime.timedelta(days=30), batch_size=1)
+
+        self.assertEqual(archived, 1)
+        self.assertEqual(self._hot_ids(), {self.available_id, self.recent_id})
+
+    def test_reads_stay_unified_after_archive(self):
+        self.storage.archive_used_esims(datetime.timedelta(days=30))
+
+        used = self.storage.get_used_esims()
+        self.assertEqual([e.id for e in used], [self.recent_id, self.old_id])
+        self.assertEqual(self.storage.get_used_esims(limit=1)[0].id, self.recent_id)
+        self.assertEqual(self.storage.get_esim_by_id(self.old_id).used_note, "Khách cũ")
+        self.assertEqual(self.storage.get_storage_stats()["used"], 2)
+        self.assertEqual(len(list(self.storage.iter_esims(status="used"))), 2)
+        self.assertEqual(
+            [e.id for e in self.storage.search_esims("8985000001")], [self.old_id]
+        )
+
+    def test_delete_used_and_undo_cover_archive(self):
+        self.storage.archive_used_esims(datetime.timedelta(days=30))
+        tombstone = self.storage.new_tombstone()
+
+        self.assertEqual(self.storage.delete_used_esims(deleted_at=tombstone), 2)
+        self.assertEqual(self.storage.get_storage_stats()["used"], 0)
+
+        self.assertEqual(self.storage.restore_deleted(tombstone), 2)
+        self.assertIsNotNone(self.storage.get_esim_by_id(self.old_id))
+
+
 class ESIMStorageMigrationTest(unittest.TestCase):
     def setUp(self):
         fd, self.db_path = tempfile.mkstemp(suffix=".db")
@@ -188,6 +344,7 @@ class ESIMStorageMigrationTest(unittest.TestCase):
         conn.close()
         self.assertIn("iccid", columns)
         self.assertIn("used_note", columns)
+        self.assertIn("deleted_at", columns)
 
         entry = storage.get_esim_by_id("legacy01")
         self.assertIsNotNone(entry)
@@ -210,5 +367,46 @@ class ESIMStorageMigrationTest(unittest.TestCase):
         self.assertEqual(used_entry.used_note, "Khách cũ")
 
 
+class ESIMStorageBootstrapTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, "esim.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_import_has_no_database_side_effects(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=root)
+
+        result = subprocess.run(
+            [sys.executable, "-c", "import esim_storage"],
+            cwd=self.tmpdir, env=env, capture_output=True, text=True,
+        )
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_lazy_storage_initializes_on_first_use_at_configured_path(self):
+        storage = eSIMStorage(lazy=True)
+        storage.configure(self.db_path)
+        self.assertFalse(os.path.exists(self.db_path))
+
+        storage.add_esim_from_lpa("LPA:1$rsp.esim.exchange$LAZY")
+
+        conn = sqlite3.connect(self.db_path)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        conn.close()
+        self.assertEqual(version, SCHEMA_VERSION)
+        self.assertEqual(storage.get_storage_stats()["available"], 1)
+
+    def test_schema_work_runs_once_per_database(self):
+        eSIMStorage(db_path=self.db_path)
+
+        with mock.patch("esim_migrations._run_migration", side_effect=AssertionError):
+            storage = eSIMStorage(db_path=self.db_path)
+            self.assertEqual(storage.get_storage_stats()["total"], 0)
+
+
 if __name__ == "__main__":
     unittest.main()
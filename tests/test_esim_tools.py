@@ -1,8 +1,37 @@
+import io
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
+from unittest import mock
 
+import esim_qr_decode
+from esim_metrics import metrics
+from esim_qr_decode import StrategyStats, strategy_stats, tile_regions
 from esim_tools import eSIMTools
 
 
+def voucher_sheet(count, cols, cell=240, pad=40):
+    """PNG một tờ ``count`` QR xếp lưới ``cols`` cột, kèm danh sách LPA theo thứ tự đọc."""
+    import cv2
+    import numpy as np
+
+    tools = eSIMTools()
+    rows = -(-count // cols)
+    canvas = np.full((rows * (cell + pad) + pad, cols * (cell + pad) + pad), 255, np.uint8)
+    lpas = []
+    for i in range(count):
+        lpa = f"LPA:1$rsp.esim.exchange$SHEET-{i:03d}"
+        png = tools.create_qr_from_lpa(lpa)[0].getvalue()
+        qr = cv2.imdecode(np.frombuffer(png, np.uint8), cv2.IMREAD_GRAYSCALE)
+        row, col = divmod(i, cols)
+        y, x = pad + row * (cell + pad), pad + col * (cell + pad)
+        canvas[y:y + cell, x:x + cell] = cv2.resize(qr, (cell, cell), interpolation=cv2.INTER_AREA)
+        lpas.append(lpa)
+    return cv2.imencode(".png", canvas)[1].tobytes(), lpas
+
+
 class ESIMToolsTest(unittest.TestCase):
     def setUp(self):
         self.tools = eSIMTools()
@@ -225,5 +254,222 @@ class ESIMToolsTest(unittest.TestCase):
         self.assertEqual(errors, [])
 
 
+class LazyImportTest(unittest.TestCase):
+    def test_import_does_not_load_heavy_qr_libraries(self):
+        code = (
+            "import sys, esim_tools\n"
+            "heavy = [m for m in ('cv2', 'numpy', 'qrcode', 'PIL') if m in sys.modules]\n"
+            "assert not heavy, heavy\n"
+            "assert isinstance(esim_tools.PYZBAR_AVAILABLE, bool)\n"
+            "assert 'cv2' in sys.modules\n"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_decode_round_trip_loads_backends_on_demand(self):
+        tools = eSIMTools()
+        bio, lpa = tools.create_qr_from_lpa("LPA:1$rsp.esim.exchange$LAZY1")
+
+        self.assertEqual(tools.decode_qr_from_image(bio.getvalue()), lpa)
+
+    def test_decode_accepts_buffers_and_file_objects(self):
+        tools = eSIMTools()
+        bio, lpa = tools.create_qr_from_lpa("LPA:1$rsp.esim.exchange$BUF1")
+        png = bio.getvalue()
+
+        with tempfile.TemporaryFile() as f:
+            f.write(png)
+            f.seek(0)
+            sources = [memoryview(png), bytearray(png), io.BytesIO(png), f]
+            for source in sources:
+                with self.subTest(type(source).__name__):
+                    self.assertEqual(tools.decode_qr_from_image(source), lpa)
+
+    def test_decode_counts_attempts_per_strategy(self):
+        tools = eSIMTools()
+        bio, _ = tools.create_qr_from_lpa("LPA:1$rsp.esim.exchange$COUNT1")
+        metrics.reset()
+        metrics.enabled = True
+        try:
+            tools.decode_qr_from_image(bio.getvalue())
+            counters = metrics.counters()["qr_decode_total"]
+            peak = metrics.histograms()["memory.qr_decode_peak"]
+        finally:
+            metrics.enabled = False
+            metrics.reset()
+
+        results = {dict(key)["result"] for key in counters}
+        self.assertEqual(results, {"success"} if len(counters) == 1 else {"miss", "success"})
+        self.assertEqual(sum(counters.values()), len(counters))
+        self.assertEqual((peak.unit, peak.count), ("bytes", 1))
+        self.assertGreater(peak.max, len(bio.getvalue()))
+
+
+class StrategyStatsTest(unittest.TestCase):
+    NAMES = ["opencv_color", "opencv_gray", "opencv_equalized", "adaptive_threshold", "inverted"]
+
+    def test_default_order_until_learned(self):
+        self.assertEqual(StrategyStats().plan("photo:small", self.NAMES), (self.NAMES, True))
+
+    def test_learned_order_and_skip(self):
+        stats = StrategyStats(min_trials=2, explore_every=100)
+        for _ in range(4):
+            stats.record_run("doc:small", [
+                ("opencv_color", False, 0.01),
+                ("opencv_equalized", True, 0.005),
+                ("opencv_gray", True, 0.01),
+                ("inverted", True, 0.001),
+            ])
+
+        plan, exhaustive = stats.plan("doc:small", self.NAMES)
+
+        # Chiến lược bổ sung luôn sau nhóm cơ bản; opencv_color không bao giờ đọc được nên bị bỏ
+        self.assertEqual(plan, ["opencv_equalized", "opencv_gray", "inverted", "adaptive_threshold"])
+        self.assertFalse(exhaustive)
+        self.assertEqual(stats.plan("url:small", self.NAMES), (self.NAMES, True))
+
+    def test_rescue_strategy_is_kept_despite_low_success_rate(self):
+        stats = StrategyStats(min_trials=2, explore_every=100)
+        for _ in range(10):
+            stats.record_run("photo:small", [("opencv_color", True, 0.01), ("inverted", False, 0.01)])
+        stats.record_run("photo:small", [("opencv_color", False, 0.01), ("inverted", True, 0.01)])
+
+        self.assertLess(stats.snapshot()["photo:small"]["inverted"]["success_rate"], stats.skip_rate * 5)
+        # inverted mới gặp một ảnh mà opencv_color trượt, và đã cứu được: không bị bỏ
+        self.assertEqual(stats.plan("photo:small", ["opencv_color", "inverted"])[0], ["opencv_color", "inverted"])
+
+    def test_skipped_strategy_is_retried_when_exploring(self):
+        stats = StrategyStats(min_trials=1, explore_every=3)
+        stats.record_run("doc:small", [("opencv_color", False, 0.01), ("opencv_gray", True, 0.01)])
+
+        plans = [stats.plan("doc:small", self.NAMES[:2]) for _ in range(3)]
+
+        self.assertEqual(plans, [
+            (["opencv_gray"], False),
+            (["opencv_gray"], False),
+            (["opencv_gray", "opencv_color"], True),
+        ])
+
+    def test_only_exhaustive_runs_are_recorded(self):
+        import numpy as np
+
+        stats = StrategyStats(min_trials=1, explore_every=100)
+        strategies = [("first", lambda img, gray: "LPA:1$a.b$C"), ("second", lambda img, gray: "LPA:1$a.b$C")]
+        gray = np.zeros((10, 10), np.uint8)
+
+        with mock.patch.object(esim_qr_decode, "strategy_stats", stats), \
+                mock.patch.object(esim_qr_decode, "decode_strategies", return_value=strategies):
+            for _ in range(3):
+                self.assertEqual(esim_qr_decode.run_strategies(None, None, gray, gray, "doc"), "LPA:1$a.b$C")
+                stats.drain()
+
+        # Lượt chạy hết trả kết quả của "first" ngay, "second" chạy tiếp ở thread nền;
+        # hai lượt sau dừng ở "first" và không ghi
+        snapshot = stats.snapshot()["doc:small"]
+        self.assertEqual({name: s["attempts"] for name, s in snapshot.items()}, {"first": 1, "second": 1})
+        self.assertEqual(snapshot["second"]["success_rate"], 1.0)
+        self.assertEqual(snapshot["second"]["rescue_rate"], 0.0)
+
+    def test_exploration_is_dropped_without_budget(self):
+        stats = StrategyStats()
+        prepare = mock.Mock()
+        with mock.patch.object(esim_qr_decode.decode_admission.budget, "acquire", return_value=False):
+            self.assertFalse(stats.explore_later("doc:small", [("first", True, 0.01)], prepare, 100))
+
+        prepare.assert_not_called()
+        self.assertEqual(stats.snapshot(), {})
+
+    def test_dark_mode_qr_is_read_by_inversion(self):
+        import cv2
+        import numpy as np
+
+        tools = eSIMTools()
+        bio, lpa = tools.create_qr_from_lpa("LPA:1$rsp.esim.exchange$DARK1")
+        gray = cv2.imdecode(np.frombuffer(bio.getvalue(), np.uint8), cv2.IMREAD_GRAYSCALE)
+        # Screenshot dark mode: module sáng trên nền tối, tương phản thấp
+        dark = cv2.bitwise_not((gray / 255 * 100 + 40).astype(np.uint8))
+        strategy_stats.reset()
+
+        self.assertEqual(tools.decode_qr_from_image(cv2.imencode(".png", dark)[1].tobytes(), "document"), lpa)
+        self.assertEqual(strategy_stats.snapshot()["document:small"]["inverted"]["success_rate"], 1.0)
+        strategy_stats.reset()
+
+    def test_dark_mode_is_read_after_learning_on_clean_photos(self):
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+        from fixtures import qr_photo
+
+        tools = eSIMTools()
+        strategy_stats.reset()
+        try:
+            clean = qr_photo("clean")
+            for _ in range(strategy_stats.min_trials):
+                tools.decode_qr_from_image(clean, "photo")
+                strategy_stats.drain()
+
+            dark = qr_photo("dark", "LPA:1$rsp.esim.exchange$DARK1")
+            # Thống kê học trên ảnh sạch không được làm mất chiến lược inverted
+            for _ in range(10):
+                self.assertEqual(tools.decode_qr_from_image(dark, "photo"), "LPA:1$rsp.esim.exchange$DARK1")
+        finally:
+            strategy_stats.reset()
+
+
+class MultiQRTest(unittest.TestCase):
+    def test_tiles_cover_image_with_overlap(self):
+        regions = tile_regions(2500, 1000, side=1024, overlap=0.25)
+
+        self.assertEqual({(x, y) for x, y, _, _ in regions}, {(0, 0), (768, 0), (1476, 0)})
+        self.assertEqual(max(x + w for x, _, w, _ in regions), 2500)
+        self.assertEqual(tile_regions(800, 600, side=1024), [])
+
+    def test_decodes_every_code_in_reading_order(self):
+        image, lpas = voucher_sheet(6, 3)
+
+        self.assertEqual(eSIMTools().decode_all_qr_from_image(image), lpas)
+
+    def test_tiled_scan_finds_same_codes(self):
+        image, lpas = voucher_sheet(6, 3)
+
+        with mock.patch.object(esim_qr_decode, "MULTI_TILE_SIDE", 400):
+            self.assertEqual(eSIMTools().decode_all_qr_from_image(image), lpas)
+
+    def test_no_codes(self):
+        import cv2
+        import numpy as np
+
+        blank = cv2.imencode(".png", np.full((200, 200), 255, np.uint8))[1].tobytes()
+
+        self.assertEqual(eSIMTools().decode_all_qr_from_image(blank), [])
+
+    def test_parse_bulk_qr_codes(self):
+        entries, errors = eSIMTools().parse_bulk_qr_codes([
+            "LPA:1$rsp.esim.exchange$AAA",
+            "https://example.com/not-esim",
+            "LPA:1$rsp.esim.exchange$AAA",
+        ])
+
+        self.assertEqual([e["lpa_string"] for e in entries], ["LPA:1$rsp.esim.exchange$AAA"])
+        self.assertEqual(len(errors), 2)
+
+    def test_parse_bulk_qr_codes_keeps_iccids(self):
+        entries, _ = eSIMTools().parse_bulk_qr_codes(
+            ["LPA:1$rsp.esim.exchange$AAA", "LPA:1$rsp.esim.exchange$BBB"],
+            ["8985000000000000001", ""],
+        )
+
+        self.assertEqual([e["iccid"] for e in entries], ["8985000000000000001", ""])
+
+    def test_extract_iccids_from_voucher_text(self):
+        text = "ICCID: 8985 2000 1234 5678 901\nHotline 1900123456\nSerial 89852000123456789012"
+
+        self.assertEqual(
+            eSIMTools().extract_iccids(text),
+            ["8985200012345678901", "89852000123456789012"],
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,88 @@
+import io
+import unittest
+import zipfile
+
+from esim_decode_pool import decode_pool
+from esim_zip import decode_zip_archive, format_archive_report
+from esim_tools import eSIMTools
+
+
+def qr_png(lpa):
+    return eSIMTools().create_qr_from_lpa(lpa)[0].getvalue()
+
+
+def make_zip(members):
+    """ZIP trong RAM từ danh sách ``(tên, dữ liệu)``."""
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return out.getvalue()
+
+
+def sample_zip():
+    first = qr_png("LPA:1$rsp.esim.exchange$ZIP-001")
+    return make_zip([
+        ("vouchers/b.png", qr_png("LPA:1$rsp.esim.exchange$ZIP-002")),
+        ("vouchers/a.png", first),
+        ("vouchers/a-copy.png", first),
+        ("readme.txt", b"not an image"),
+        ("broken.png", b"\x89PNG broken"),
+        ("__MACOSX/vouchers/._a.png", b"resource fork"),
+    ])
+
+
+class DecodeZipArchiveTest(unittest.TestCase):
+    def assert_sample_report(self, report):
+        statuses = {f.name: f.status for f in report.files}
+        self.assertEqual(statuses, {
+            "broken.png": "error",
+            "readme.txt": "skipped",
+            "vouchers/a-copy.png": "duplicate",
+            "vouchers/a.png": "ok",
+            "vouchers/b.png": "ok",
+        })
+        self.assertEqual(report.codes, [
+            "LPA:1$rsp.esim.exchange$ZIP-001",
+            "LPA:1$rsp.esim.exchange$ZIP-002",
+        ])
+
+    def test_decodes_inline(self):
+        self.assert_sample_report(decode_zip_archive(sample_zip(), workers=1))
+
+    def test_decodes_in_process_pool(self):
+        decode_pool.configure(2)
+        self.addCleanup(decode_pool.configure, 0)
+        self.addCleanup(decode_pool.shutdown)
+
+        self.assert_sample_report(decode_zip_archive(io.BytesIO(sample_zip()), workers=2))
+        pool = decode_pool.executor()
+        self.assert_sample_report(decode_zip_archive(sample_zip()))
+
+        # ZIP thứ hai dùng lại pool của ZIP đầu, không spawn process mới
+        self.assertIs(decode_pool.executor(), pool)
+
+    def test_member_limits_are_reported(self):
+        png = qr_png("LPA:1$rsp.esim.exchange$ZIP-LIMIT")
+        data = make_zip([("1.png", png), ("2.png", png), ("3.png", b"0" * 2048)])
+
+        report = decode_zip_archive(data, workers=1, max_members=2, max_member_bytes=1024 * 1024)
+        self.assertEqual([f.status for f in report.files], ["ok", "duplicate", "skipped"])
+
+        report = decode_zip_archive(data, workers=1, max_member_bytes=len(png) - 1)
+        self.assertEqual([f.status for f in report.files], ["skipped", "skipped", "skipped"])
+
+    def test_invalid_zip_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            decode_zip_archive(b"not a zip", workers=1)
+
+    def test_report_has_one_line_per_file(self):
+        report = decode_zip_archive(sample_zip(), workers=1)
+        lines = format_archive_report(report).splitlines()
+
+        self.assertEqual(len(lines), 1 + len(report.files))
+        self.assertIn("vouchers/a-copy.png\tduplicate\t0\tTrùng nội dung vouchers/a.png", lines)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from load_test import run_load  # noqa: E402
+
+
+class LoadHarnessSmokeTest(unittest.TestCase):
+    """Chạy load test rất nhỏ để harness không bị hỏng khi handler thay đổi."""
+
+    def test_every_scenario_completes_without_errors(self):
+        report = asyncio.run(run_load(sessions=24, concurrency=6, rtt=0, inventory=50, bulk_lines=6))
+
+        self.assertEqual(report["errors"], {})
+        sessions = sum(s["count"] for name, s in report["latency"].items() if name.startswith("session."))
+        self.assertEqual(sessions, 24)
+        self.assertEqual(
+            {name for name in report["latency"] if name.startswith("session.")},
+            {"session.create_link", "session.scan_qr", "session.use_esim", "session.bulk_add"},
+        )
+        self.assertGreater(report["api_calls"]["sendPhoto"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()